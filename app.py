@@ -1,7 +1,7 @@
 import os
 import secrets
 import logging
-from flask import Flask, session, render_template, make_response
+from flask import Flask, session, render_template, make_response, jsonify
 from flask_cors import CORS
 from authlib.integrations.flask_client import OAuth
 from dotenv import load_dotenv
@@ -13,13 +13,25 @@ from social import social_bp
 from quiz import quiz_bp
 from phish import phish_bp
 from db_init import init_db
-from utils import load_quiz_count
+from utils import get_db_conn, init_db_pool, get_db_pool_stats, ops_only
+from migrations import LATEST_VERSION, get_schema_version
+from counters import quiz_counter
+from ranking import warm_rank_index
+from metrics import init_metrics
+from xai import xai_client
+from jobs import queue_stats
 
 load_dotenv()
 app = Flask(__name__, static_folder='static')
 app.secret_key = os.getenv('SECRET_KEY', secrets.token_hex(16))
 CORS(app, origins=[os.getenv('ALLOWED_ORIGIN', '*')])
 
+# Return pooled DB connections at request teardown
+init_db_pool(app)
+
+# Request, query, pool and upstream latency metrics at /metrics (ops token required)
+init_metrics(app)
+
 # Initialize OAuth
 oauth = OAuth(app)
 
@@ -35,11 +47,12 @@ app.register_blueprint(phish_bp)
 # Initialize OAuth clients in auth.py
 init_oauth(oauth)
 
-# Initialize database and scheduler
+# Initialize database. Refreshes, phishing pool top-ups and X posts run in the job worker
+# (`python manage.py worker`), never in web workers.
 init_db()
-from content import refresh_database, start_scheduler
-refresh_database()
-start_scheduler()
+from content import content_freshness
+warm_rank_index()
+quiz_counter.warm()
 
 @app.route('/')
 def index():
@@ -52,7 +65,7 @@ def index():
     user = session.get('user')
     logging.debug(f"Root route accessed, session user: {user}")
     try:
-        quiz_count = load_quiz_count()
+        quiz_count = quiz_counter.value()
         logging.debug(f"Quiz count: {quiz_count}")
         response = make_response(render_template('index.html', quiz_count=quiz_count, user=user))
         response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
@@ -63,6 +76,37 @@ def index():
         response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
         return response
 
+@app.route('/api/db_pool_stats')
+@ops_only
+def db_pool_stats():
+    return jsonify(get_db_pool_stats())
+
+@app.route('/api/ready')
+def ready():
+    try:
+        with get_db_conn() as conn:
+            schema_version = get_schema_version(conn.cursor())
+        content = content_freshness()
+    except Exception as e:
+        logging.error(f"Readiness check failed: {e}")
+        return jsonify({"ready": False, "error": "Database unavailable"}), 503
+    is_ready = schema_version >= LATEST_VERSION
+    return jsonify({"ready": is_ready, "schema_version": schema_version, "content": content}), 200 if is_ready else 503
+
+@app.route('/api/job_stats')
+@ops_only
+def job_stats():
+    try:
+        return jsonify(queue_stats())
+    except Exception as e:
+        logging.error(f"Error in /api/job_stats: {e}")
+        return jsonify({"error": "Failed to load job stats"}), 500
+
+@app.route('/api/xai_stats')
+@ops_only
+def xai_stats():
+    return jsonify(xai_client.stats())
+
 @app.route('/home')
 def home():
     return index()
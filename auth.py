@@ -1,37 +1,49 @@
 import os
-from flask import Blueprint, redirect, url_for, session, request, make_response, render_template, jsonify
+from flask import Blueprint, current_app, redirect, url_for, session, request, make_response, render_template, jsonify
+import json
 import secrets
 import logging
 import jwt
 import requests
-from utils import get_db_conn, generate_username, load_quiz_count
+import psycopg2
+import psycopg2.errors
+from utils import get_db_conn
+from leaderboard import bump_leaderboard_version
+import events
+from counters import quiz_counter
 from psycopg2.extras import DictCursor
+from snapshot import get_snapshot
+from oidc_cache import (CachedOIDCApp, GOOGLE_METADATA_URL, MICROSOFT_METADATA_URL, MICROSOFT_JWKS_URL,
+                        warm_oidc_cache)
 
 auth_bp = Blueprint('auth', __name__)
 
 def init_oauth(oauth):
     global google, microsoft
+    oauth.oauth2_client_cls = CachedOIDCApp
     google = oauth.register(
         name='google',
         client_id=os.getenv('GOOGLE_CLIENT_ID'),
         client_secret=os.getenv('GOOGLE_CLIENT_SECRET'),
-        server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+        server_metadata_url=GOOGLE_METADATA_URL,
         client_kwargs={'scope': 'openid email profile'}
     )
     microsoft = oauth.register(
         name='microsoft',
         client_id=os.getenv('MICROSOFT_CLIENT_ID'),
         client_secret=os.getenv('MICROSOFT_CLIENT_SECRET'),
-        server_metadata_url='https://login.microsoftonline.com/common/v2.0/.well-known/openid-configuration',
+        server_metadata_url=MICROSOFT_METADATA_URL,
         client_kwargs={'scope': 'openid email profile'},
         authorize_params={'prompt': 'select_account'},
-        jwks_uri='https://login.microsoftonline.com/common/discovery/v2.0/keys'
+        jwks_uri=MICROSOFT_JWKS_URL
     )
+    # fetch discovery documents and signing keys before the first login needs them
+    warm_oidc_cache(GOOGLE_METADATA_URL, MICROSOFT_METADATA_URL, MICROSOFT_JWKS_URL)
 
 @auth_bp.route('/login')
 def login_page():
     return_to = request.args.get('return_to', 'home')
-    response = make_response(render_template('index.html', quiz_count=load_quiz_count(), user=None, login_options=True, return_to=return_to))
+    response = make_response(render_template('index.html', quiz_count=quiz_counter.value(), user=None, login_options=True, return_to=return_to))
     response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
     return response
 
@@ -50,6 +62,55 @@ def login(provider):
         return microsoft.authorize_redirect(url_for('auth.auth_callback', provider='microsoft', _external=True), nonce=nonce)
     return redirect(url_for('index'))
 
+USER_UPSERT_ATTEMPTS = 5
+
+# Returning users only get their domain refreshed; new users get the next cyb3r_<n> name
+# from username_seq. nextval() sits behind the NOT EXISTS filter, so logins of existing
+# users don't consume sequence values.
+_UPSERT_USER_SQL = """
+    WITH existing AS (
+        -- joining the pre-update row tells us whether the domain (team membership) changed
+        UPDATE users u SET domain = %(domain)s
+        FROM users old
+        WHERE old.id = u.id AND u.social_id = %(social_id)s AND u.provider = %(provider)s
+        RETURNING u.id, u.username, u.domain, old.domain IS DISTINCT FROM u.domain AS domain_changed
+    ), created AS (
+        INSERT INTO users (social_id, provider, username, bio, domain)
+        SELECT %(social_id)s, %(provider)s, 'cyb3r_' || nextval('username_seq'), '', %(domain)s
+        WHERE NOT EXISTS (SELECT 1 FROM existing)
+        ON CONFLICT (social_id, provider) DO NOTHING
+        RETURNING id, username, domain
+    ), totals AS (
+        INSERT INTO user_totals (user_id, total_score, perfect_quizzes)
+        SELECT id, 0, 0 FROM created
+    )
+    SELECT id, username, domain, domain_changed FROM existing
+    UNION ALL
+    SELECT id, username, domain, FALSE FROM created
+"""
+
+def _upsert_user(conn, social_id, provider, domain):
+    cur = conn.cursor(cursor_factory=DictCursor)
+    params = {"social_id": social_id, "provider": provider, "domain": domain}
+    for attempt in range(USER_UPSERT_ATTEMPTS):
+        try:
+            cur.execute(_UPSERT_USER_SQL, params)
+            user = cur.fetchone()
+        except psycopg2.errors.UniqueViolation as e:
+            # someone renamed themselves to the generated name; the next nextval() skips it
+            conn.rollback()
+            logging.warning(f"Generated username already taken, retrying: {e}")
+            continue
+        # a new domain moves the user between team leaderboards
+        version = bump_leaderboard_version(cur) if user and user['domain_changed'] else None
+        conn.commit()
+        if version is not None:
+            events.publish_local('leaderboard', version)
+        if user:
+            return user
+        # a concurrent first login for the same account inserted it; the UPDATE branch finds it now
+    raise RuntimeError(f"Could not create or load user for {provider} login after {USER_UPSERT_ATTEMPTS} attempts")
+
 @auth_bp.route('/auth/<provider>/callback')
 def auth_callback(provider):
     try:
@@ -82,28 +143,9 @@ def auth_callback(provider):
                 domain = full_domain
             except IndexError:
                 pass
-        username = generate_username()
         with get_db_conn() as conn:
-            cur = conn.cursor(cursor_factory=DictCursor)
-            cur.execute('SELECT id, username, domain FROM users WHERE social_id = %s AND provider = %s', (social_id, provider))
-            user = cur.fetchone()
-            if not user:
-                cur.execute(
-                    'INSERT INTO users (social_id, provider, username, bio, domain) VALUES (%s, %s, %s, %s, %s) RETURNING id, username, domain',
-                    (social_id, provider, username, '', domain)
-                )
-                user = cur.fetchone()
-                user_id = user['id']
-                cur.execute('INSERT INTO user_totals (user_id, total_score, perfect_quizzes) VALUES (%s, 0, 0)', (user_id,))
-                conn.commit()
-            else:
-                cur.execute(
-                    'UPDATE users SET domain = %s WHERE id = %s RETURNING id, username, domain',
-                    (domain, user['id'])
-                )
-                user = cur.fetchone()
-                conn.commit()
-            session['user'] = {'id': user['id'], 'username': user['username'], 'provider': provider, 'domain': user['domain']}
+            user = _upsert_user(conn, social_id, provider, domain)
+        session['user'] = {'id': user['id'], 'username': user['username'], 'provider': provider, 'domain': user['domain']}
         return_to = session.pop('return_to', 'home')
         if return_to == 'leaderboard':
             return redirect(url_for('leaderboard_page'))
@@ -128,6 +170,13 @@ def user_status():
     user = session.get('user')
     return jsonify({"user": user})
 
+def _team_status(cur, user_id):
+    cur.execute("SELECT domain, join_team FROM users WHERE id = %s", (user_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    return {"has_team": bool(row['domain'] and row['join_team']), "domain": row['domain']}
+
 @auth_bp.route('/api/user_team_status', methods=['GET'])
 def user_team_status():
     user = session.get('user')
@@ -136,16 +185,32 @@ def user_team_status():
         return jsonify({"has_team": False})
     try:
         with get_db_conn() as conn:
-            cur = conn.cursor(cursor_factory=DictCursor)
-            cur.execute("SELECT domain, join_team FROM users WHERE id = %s", (user['id'],))
-            row = cur.fetchone()
-            if row:
-                domain, join_team = row['domain'], row['join_team']
-                has_team = bool(domain and join_team)
-                return jsonify({"has_team": has_team, "domain": domain})
-            else:
-                logging.error(f"User not found for id {user['id']} in /api/user_team_status")
-                return jsonify({"has_team": False}), 404
+            team_status = _team_status(conn.cursor(cursor_factory=DictCursor), user['id'])
+        if team_status is None:
+            logging.error(f"User not found for id {user['id']} in /api/user_team_status")
+            return jsonify({"has_team": False}), 404
+        return jsonify(team_status)
     except Exception as e:
         logging.error(f"Error in /api/user_team_status for user_id {user.get('id', 'unknown')}: {e}")
-        return jsonify({"error": "Internal server error"}), 500
\ No newline at end of file
+        return jsonify({"error": "Internal server error"}), 500
+
+@auth_bp.route('/api/bootstrap', methods=['GET'])
+def bootstrap():
+    # Everything the SPA needs on load in one round trip. The content part comes pre-serialized
+    # from the shared snapshot; only the session user and team status are computed here.
+    user = session.get('user')
+    try:
+        snap = get_snapshot()
+        team_status = {"has_team": False}
+        if user:
+            with get_db_conn() as conn:
+                team_status = _team_status(conn.cursor(cursor_factory=DictCursor), user['id']) or team_status
+    except Exception as e:
+        logging.error(f"Error in /api/bootstrap: {e}")
+        return jsonify({"error": "Failed to load app data"}), 500
+    body = (f'{{"generation": {snap.generation}, {snap.bootstrap_fragment}, '
+            f'"user": {json.dumps(user)}, "team_status": {json.dumps(team_status)}, '
+            f'"quiz_count": {quiz_counter.value()}}}')
+    response = current_app.response_class(body, mimetype='application/json')
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
\ No newline at end of file
@@ -0,0 +1,75 @@
+import os
+import io
+import sys
+import time
+import argparse
+import tracemalloc
+import urllib.request
+from rss_stream import parse_feed, parse_with_feedparser
+
+# Compares the streaming ingestion parser with the old feedparser path on saved feeds.
+#
+#   python -m bench.feed_parse --save bench/feeds   # download the configured feeds once
+#   python -m bench.feed_parse bench/feeds          # time and peak memory per feed
+#
+# Run from the repository root. Saved feeds are not checked in; they go stale and are
+# someone else's content. A saved directory also drives an offline refresh:
+#
+#   FEED_REPLAY_DIR=bench/feeds LLM_CACHE_MODE=replay python manage.py refresh
+
+def save_feeds(directory):
+    # the same file names content.FEED_REPLAY_DIR reads, so a saved set can drive an offline refresh
+    from content import FEEDS, FEED_HEADERS, feed_replay_path
+    os.makedirs(directory, exist_ok=True)
+    for feed in FEEDS:
+        req = urllib.request.Request(feed["url"], headers=FEED_HEADERS)
+        with urllib.request.urlopen(req, timeout=30) as response:
+            data = response.read()
+        path = feed_replay_path(feed, directory)
+        with open(path, 'wb') as f:
+            f.write(data)
+        print(f"saved {path} ({len(data)} bytes)")
+
+def _measure(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def run(directory, repeat, max_entries):
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.xml'))
+    if not paths:
+        sys.exit(f"no .xml feeds in {directory}; fetch some with --save {directory}")
+    print(f"{'feed':<32}{'bytes':>10}{'feedparser ms':>15}{'stream ms':>11}{'feedparser KiB':>16}{'stream KiB':>12}  match")
+    totals = [0.0, 0.0, 0, 0]
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        old, old_time, old_peak = _measure(lambda: parse_with_feedparser(data, max_entries), repeat)
+        new, new_time, new_peak = _measure(lambda: parse_feed(io.BytesIO(data), max_entries), repeat)
+        # same headlines in the same order is what matters downstream
+        match = [(e["title"], e["link"]) for e in old] == [(e["title"], e["link"]) for e in new]
+        totals = [totals[0] + old_time, totals[1] + new_time, max(totals[2], old_peak), max(totals[3], new_peak)]
+        print(f"{os.path.basename(path):<32}{len(data):>10}{old_time * 1000:>15.2f}{new_time * 1000:>11.2f}"
+              f"{old_peak / 1024:>16.0f}{new_peak / 1024:>12.0f}  {'yes' if match else 'NO'}")
+    print(f"{'total time / max peak':<42}{totals[0] * 1000:>15.2f}{totals[1] * 1000:>11.2f}"
+          f"{totals[2] / 1024:>16.0f}{totals[3] / 1024:>12.0f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark streaming feed parsing against feedparser")
+    parser.add_argument('directory', help="directory of saved feed .xml files")
+    parser.add_argument('--save', action='store_true', help="download the configured feeds into directory first")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--max-entries', type=int, default=10)
+    args = parser.parse_args(argv)
+    if args.save:
+        save_feeds(args.directory)
+    run(args.directory, args.repeat, args.max_entries)
+
+if __name__ == '__main__':
+    main()
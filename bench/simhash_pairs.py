@@ -0,0 +1,48 @@
+import os
+import json
+import argparse
+from simhash import SIMHASH_MAX_DISTANCE, hamming, simhash
+
+# Checks near-duplicate clustering against hand-labelled headline pairs: the same story
+# from two outlets ("same": true) and different stories that share a topic, vendor or
+# victim type ("same": false).
+#
+#   python -m bench.simhash_pairs                 # distances and the current threshold
+#   python -m bench.simhash_pairs --sweep         # recall / false merges per threshold
+#
+# Run from the repository root. Add a pair whenever a merge or a miss shows up in practice.
+
+PAIRS_PATH = os.path.join(os.path.dirname(__file__), 'simhash_pairs.json')
+
+def _distance(pair):
+    return hamming(simhash(pair['a']['title'], pair['a']['description']),
+                   simhash(pair['b']['title'], pair['b']['description']))
+
+def run(path, threshold, sweep):
+    with open(path) as f:
+        pairs = json.load(f)
+    scored = [(pair['same'], _distance(pair), pair.get('note', '')) for pair in pairs]
+    same = sorted(d for is_same, d, _ in scored if is_same)
+    different = sorted(d for is_same, d, _ in scored if not is_same)
+    if not sweep:
+        for is_same, distance, note in sorted(scored, key=lambda s: (not s[0], s[1])):
+            merged = distance <= threshold
+            flag = '' if merged == is_same else ('  MISSED' if is_same else '  FALSE MERGE')
+            print(f"{'same' if is_same else 'diff'}  {distance:>3}  {note}{flag}")
+        print(f"same-story distances:      {same}")
+        print(f"different-story distances: {different}")
+    thresholds = range(0, max(same + different) + 1) if sweep else [threshold]
+    print(f"{'threshold':>9}{'merged same':>14}{'false merges':>14}")
+    for t in thresholds:
+        print(f"{t:>9}{sum(d <= t for d in same):>9}/{len(same):<4}{sum(d <= t for d in different):>9}/{len(different)}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate SimHash near-duplicate detection on labelled pairs")
+    parser.add_argument('--pairs', default=PAIRS_PATH, help="labelled pairs JSON file")
+    parser.add_argument('--threshold', type=int, default=SIMHASH_MAX_DISTANCE)
+    parser.add_argument('--sweep', action='store_true', help="report every threshold")
+    args = parser.parse_args(argv)
+    run(args.pairs, args.threshold, args.sweep)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+import time
+import threading
+from collections import OrderedDict
+import events
+
+# In-process LRU whose entries are tagged with the version they were built at. A version
+# bump (see events.bump_version) makes every older entry a miss; the TTL is a fallback for
+# invalidations a worker never heard about.
+class VersionedCache:
+    def __init__(self, name, maxsize=256, ttl=300):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        events.subscribe(name, self.set_version)
+
+    @property
+    def version(self):
+        return self._version
+
+    def set_version(self, version):
+        with self._lock:
+            if version > self._version:
+                self._version = version
+                self._entries.clear()
+
+    def get(self, key):
+        events.ensure_listener()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, version, expires_at = entry
+                if version == self._version and time.monotonic() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, version):
+        with self._lock:
+            # a result computed before a concurrent bump must not be cached under the new version
+            if version != self._version:
+                return
+            self._entries[key] = (value, version, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"name": self.name, "version": self._version, "size": len(self._entries),
+                    "maxsize": self.maxsize, "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
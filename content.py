@@ -6,96 +6,234 @@ import psycopg2
 import psycopg2.extras
 import hashlib
 from flask import Blueprint, jsonify
-import requests
 import urllib.request
 import urllib.error
-import feedparser
 import re
 import json
 from datetime import datetime, timezone, timedelta
 import bleach
 from collections import defaultdict
-from apscheduler.schedulers.background import BackgroundScheduler
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from utils import get_db_conn
-from social import post_to_x
+from metrics import FEED_FETCH_LATENCY
+from rss_stream import parse_feed
+from relevance import classifier as relevance
+from simhash import headline_index, simhash, to_db as simhash_to_db
+from xai import xai_client
+from snapshot import content_response, bump_content_generation
+import llm_cache
 from psycopg2.extras import DictCursor
 
 content_bp = Blueprint('content', __name__)
 
-XAI_API_URL = os.getenv("XAI_API_URL", "https://api.x.ai/v1/chat/completions")
-XAI_API_KEY = os.getenv("XAI_API_KEY")
 REFRESH_INTERVAL_SECONDS = 14400
+REFRESH_LEASE_SECONDS = int(os.getenv("REFRESH_LEASE_SECONDS", "3600"))
+# pg_advisory_xact_lock key serializing refresh claims across workers
+REFRESH_LOCK_ID = 4201021
+GENERATION_BATCH_SIZE = 5
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "5"))
+# 'combined' asks for slide and quiz in one structured response; 'separate' makes two calls
+GENERATION_MODE = os.getenv("GENERATION_MODE", "combined")
 
-scheduler = BackgroundScheduler({'apscheduler.job_defaults.misfire_grace_time': 3600})
+FEEDS = [
+    {"url": "https://feeds.feedburner.com/TheHackersNews", "name": "The Hacker News"},
+    {"url": "https://krebsonsecurity.com/feed/", "name": "Krebs on Security"},
+    {"url": "https://www.darkreading.com/rss.xml", "name": "Dark Reading"},
+    {"url": "https://isc.sans.edu/rssfeed.xml", "name": "SANS Internet Storm Center"},
+    {"url": "https://www.bleepingcomputer.com/feed/", "name": "BleepingComputer"}
+]
+FEED_HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+FEED_MAX_RETRIES = 3
+# only the newest entries of each feed are considered; the rest is never read
+FEED_MAX_ENTRIES = 10
+FEED_FETCH_WORKERS = int(os.getenv("FEED_FETCH_WORKERS", "5"))
+FEED_DEADLINE_SECONDS = float(os.getenv("FEED_DEADLINE_SECONDS", "30"))
+FEED_RETRY_BACKOFF_SECONDS = float(os.getenv("FEED_RETRY_BACKOFF_SECONDS", "2"))
+# Directory of recorded feeds (<slug of feed name>.xml, as saved by `python -m bench.feed_parse
+# --save DIR`) read instead of the network. With LLM_CACHE_MODE=replay a whole refresh then
+# runs offline, for tests and benchmarks.
+FEED_REPLAY_DIR = os.getenv("FEED_REPLAY_DIR")
 
-def fetch_headlines():
+def load_feed_validators():
+    try:
+        with get_db_conn() as conn:
+            cur = conn.cursor(cursor_factory=DictCursor)
+            cur.execute("SELECT url, etag, last_modified FROM feed_state")
+            return {row['url']: {"etag": row['etag'], "last_modified": row['last_modified']} for row in cur.fetchall()}
+    except Exception as e:
+        logging.warning(f"Could not load feed validators, fetching all feeds unconditionally: {e}")
+        return {}
+
+def save_feed_validators(validators):
+    rows = [(url, v.get("etag"), v.get("last_modified")) for url, v in validators.items()
+            if v.get("etag") or v.get("last_modified")]
+    if not rows:
+        return
+    try:
+        with get_db_conn() as conn:
+            cur = conn.cursor()
+            psycopg2.extras.execute_values(cur, """
+                INSERT INTO feed_state (url, etag, last_modified) VALUES %s
+                ON CONFLICT (url) DO UPDATE SET etag = EXCLUDED.etag, last_modified = EXCLUDED.last_modified,
+                                                updated_at = CURRENT_TIMESTAMP
+            """, rows)
+            conn.commit()
+    except Exception as e:
+        logging.warning(f"Could not save feed validators: {e}")
+
+def _parse_feed_entries(entries, source_name):
+    headlines = []
+    for entry in entries:
+        title = entry["title"]
+        desc = bleach.clean(entry["summary"], tags=[], strip=True)
+        logging.debug(f"Raw description for {title}: {desc[:225]}")
+        match = re.search(r'((?:[A-Z][^\.]*?\.){1,2})(?:\s|$)', desc[:225])
+        description = match.group(1) if match else desc[:225]
+        link = entry["link"]
+        published_date = entry["published"]
+        score, categories = relevance.score(title, description)
+        if relevance.is_relevant(score):
+            headlines.append({
+                "title": title,
+                "description": description,
+                "link": link,
+                "source": source_name,
+                "published_date": published_date,
+                "relevance": score,
+                "categories": categories
+            })
+    return headlines
+
+def feed_replay_path(feed, directory):
+    slug = re.sub(r'[^a-z0-9]+', '_', feed["name"].lower()).strip('_')
+    return os.path.join(directory, f"{slug}.xml")
+
+def _replay_feed(feed):
+    path = feed_replay_path(feed, FEED_REPLAY_DIR)
+    try:
+        with open(path, 'rb') as f:
+            entries = parse_feed(f, FEED_MAX_ENTRIES, source_name=feed["name"])
+    except OSError as e:
+        logging.warning(f"No recorded feed for {feed['name']} in {FEED_REPLAY_DIR}: {e}")
+        return None
+    return _parse_feed_entries(entries, feed["name"])
+
+def _fetch_feed(feed, validator, deadline):
+    # Retries back off only inside this feed's worker and never past its deadline,
+    # so a failing feed cannot delay the others.
+    rss_url = feed["url"]
+    source_name = feed["name"]
+    start = time.monotonic()
+
+    def observe(outcome):
+        FEED_FETCH_LATENCY.labels(source_name, outcome).observe(time.monotonic() - start)
+
+    if FEED_REPLAY_DIR:
+        headlines = _replay_feed(feed)
+        observe('failed' if headlines is None else 'replayed')
+        return headlines, validator
+
+    for attempt in range(FEED_MAX_RETRIES):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logging.warning(f"Deadline reached fetching {source_name} RSS after {attempt} attempts")
+            break
+        headers = dict(FEED_HEADERS)
+        if validator.get("etag"):
+            headers['If-None-Match'] = validator["etag"]
+        if validator.get("last_modified"):
+            headers['If-Modified-Since'] = validator["last_modified"]
+        try:
+            req = urllib.request.Request(rss_url, headers=headers)
+            with urllib.request.urlopen(req, timeout=min(15, remaining)) as response:
+                if response.getcode() != 200:
+                    logging.warning(f"RSS feed {source_name} returned status {response.getcode()} on attempt {attempt + 1}/{FEED_MAX_RETRIES}")
+                else:
+                    entries = parse_feed(response, FEED_MAX_ENTRIES, source_name=source_name)
+                    if entries:
+                        new_validator = {"etag": response.headers.get('ETag'),
+                                         "last_modified": response.headers.get('Last-Modified')}
+                        observe('ok')
+                        return _parse_feed_entries(entries, source_name), new_validator
+                    logging.warning(f"No entries in RSS feed {source_name} on attempt {attempt + 1}/{FEED_MAX_RETRIES}")
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                logging.debug(f"RSS feed {source_name} not modified since last refresh")
+                observe('not_modified')
+                return [], validator
+            logging.warning(f"HTTP error {e.code} fetching {source_name} RSS on attempt {attempt + 1}/{FEED_MAX_RETRIES}")
+        except Exception as e:
+            logging.warning(f"Error fetching {source_name} RSS on attempt {attempt + 1}/{FEED_MAX_RETRIES}: {e}")
+        if attempt < FEED_MAX_RETRIES - 1:
+            backoff = FEED_RETRY_BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5)
+            time.sleep(max(0, min(backoff, deadline - time.monotonic())))
+    observe('failed')
+    return None, validator
+
+def fetch_headlines(validators=None):
     logging.debug("Entering fetch_headlines")
-    feeds = [
-        {"url": "https://feeds.feedburner.com/TheHackersNews", "name": "The Hacker News"},
-        {"url": "https://krebsonsecurity.com/feed/", "name": "Krebs on Security"},
-        {"url": "https://www.darkreading.com/rss.xml", "name": "Dark Reading"},
-        {"url": "https://isc.sans.edu/rssfeed.xml", "name": "SANS Internet Storm Center"},
-        {"url": "https://www.bleepingcomputer.com/feed/", "name": "BleepingComputer"}
-    ]
-    max_retries = 3
+    if validators is None:
+        validators = {}
     all_headlines = []
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-    keywords = ["ransomware", "phishing", "malware", "social engineering", "credential stuffing", "data breach", "exploit", "cybercrime"]
-    for feed in feeds:
-        rss_url = feed["url"]
-        source_name = feed["name"]
-        for attempt in range(max_retries):
+    deadline = time.monotonic() + FEED_DEADLINE_SECONDS
+    executor = ThreadPoolExecutor(max_workers=max(1, min(FEED_FETCH_WORKERS, len(FEEDS))))
+    try:
+        futures = {executor.submit(_fetch_feed, feed, validators.get(feed["url"], {}), deadline): feed for feed in FEEDS}
+        # small grace period past the deadline for an in-flight read to return
+        done, not_done = wait(futures, timeout=FEED_DEADLINE_SECONDS + 5)
+        for future in not_done:
+            logging.warning(f"Timed out fetching {futures[future]['name']} RSS, skipping it for this refresh")
+        results = {}
+        for future in done:
+            feed = futures[future]
             try:
-                req = urllib.request.Request(rss_url, headers=headers)
-                with urllib.request.urlopen(req, timeout=15) as response:
-                    if response.getcode() != 200:
-                        logging.warning(f"RSS feed {source_name} returned status {response.getcode()} on attempt {attempt + 1}/{max_retries}")
-                        if attempt < max_retries - 1:
-                            time.sleep(5)
-                            continue
-                        break
-                    feed_data = feedparser.parse(response.read())
-                    if not feed_data.entries:
-                        logging.warning(f"No entries in RSS feed {source_name} on attempt {attempt + 1}/{max_retries}")
-                        if attempt < max_retries - 1:
-                            time.sleep(5)
-                            continue
-                        break
-                    for entry in feed_data.entries[:10]:
-                        title = entry.get("title", "").strip()
-                        desc = bleach.clean(entry.get("summary", ""), tags=[], strip=True)
-                        logging.debug(f"Raw description for {title}: {desc[:225]}")
-                        match = re.search(r'((?:[A-Z][^\.]*?\.){1,2})(?:\s|$)', desc[:225])
-                        description = match.group(1) if match else desc[:225]
-                        link = entry.get("link", "")
-                        published_date = entry.get("published_parsed")
-                        published_date = datetime(*published_date[:6], tzinfo=timezone.utc) if published_date else None
-                        contains_keyword = any(kw.lower() in title.lower() or kw.lower() in description.lower() for kw in keywords)
-                        if contains_keyword:
-                            all_headlines.append({
-                                "title": title,
-                                "description": description,
-                                "link": link,
-                                "source": source_name,
-                                "published_date": published_date
-                            })
-                    break
-            except urllib.error.HTTPError as e:
-                logging.warning(f"HTTP error {e.code} fetching {source_name} RSS on attempt {attempt + 1}/{max_retries}")
-                if attempt < max_retries - 1:
-                    time.sleep(5)
-                    continue
+                headlines, validator = future.result()
             except Exception as e:
-                logging.warning(f"Error fetching {source_name} RSS on attempt {attempt + 1}/{max_retries}: {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(5)
-                    continue
+                logging.warning(f"Error fetching {feed['name']} RSS: {e}")
+                continue
+            validators[feed["url"]] = validator
+            if headlines is not None:
+                results[feed["url"]] = headlines
+        # keep the configured feed order so downstream selection is deterministic
+        for feed in FEEDS:
+            all_headlines.extend(results.get(feed["url"], []))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    if not results:
+        # an outage must not be recorded as a successful (fresh) refresh
+        raise RuntimeError(f"None of the {len(FEEDS)} feeds could be fetched")
     return all_headlines
 
+XAI_MODEL = "grok-3-mini"
+
+def _call_xai(prompt, operation, model=XAI_MODEL):
+    # Returns (completion, cache_key); completion is None when there is nothing to return
+    # (no API key, or a miss in replay mode). API errors propagate to the caller.
+    messages = [{"role": "user", "content": prompt}]
+    key = llm_cache.cache_key(model, messages)
+    try:
+        cached = llm_cache.lookup(key)
+    except Exception as e:
+        logging.warning(f"LLM cache lookup failed, calling xAI: {e}")
+        cached = None
+    if cached is not None:
+        return cached, key
+    if llm_cache.LLM_CACHE_MODE == 'replay':
+        logging.warning(f"No recorded {operation} completion for this prompt (LLM_CACHE_MODE=replay)")
+        return None, key
+    if not xai_client.configured:
+        logging.error(f"XAI_API_KEY is not set, cannot generate {operation}")
+        return None, key
+    logging.debug(f"Sending xAI {operation} request: {messages}")
+    completion = xai_client.chat(messages, model, operation).strip()
+    logging.debug(f"xAI {operation} completion: {completion}")
+    try:
+        llm_cache.store(key, model, messages, completion)
+    except Exception as e:
+        logging.warning(f"Failed to store {operation} completion in the LLM cache: {e}")
+    return completion, key
+
 def generate_slide_content(headline):
-    if not XAI_API_KEY:
-        logging.error("XAI_API_KEY is not set, cannot generate slide")
-        return None, None
     prompt = (
         f"Headline: {headline['title']}\nDescription: {headline['description']}\nLink: {headline['link']}\n"
         "Generate a concise cyber awareness slide. Format strictly as follows:\n"
@@ -103,14 +241,10 @@ def generate_slide_content(headline):
         "Threat: [brief threat description]\n"
         "Safety tips: [3-4 bullet points with prevention tips, keep simple and actionable, under 200 words total]"
     )
-    headers = {"Authorization": f"Bearer {XAI_API_KEY}", "Content-Type": "application/json"}
-    data = {"model": "grok-3-mini", "messages": [{"role": "user", "content": prompt}]}
     try:
-        logging.debug(f"Sending xAI API request: URL={XAI_API_URL}, Headers={headers}, Data={data}")
-        response = requests.post(XAI_API_URL, headers=headers, json=data, timeout=120)
-        logging.debug(f"xAI API response: Status={response.status_code}, Body={response.text}")
-        response.raise_for_status()
-        generated = response.json()["choices"][0]["message"]["content"].strip()
+        generated, _ = _call_xai(prompt, 'slides')
+        if generated is None:
+            return None, None
         title_match = re.search(r'\*\*Title:\*\* ([^\n]*?)(?=\s*$|\s*\n)', generated)
         content_match = re.search(r'Threat:.*?(?=Safety tips:)|Safety tips:.*', generated, re.DOTALL)
         title = title_match.group(1).strip() if title_match else "Cyber Tip"
@@ -121,23 +255,17 @@ def generate_slide_content(headline):
         return None, None
 
 def generate_quiz_questions(slide_content):
-    if not XAI_API_KEY:
-        logging.error("XAI_API_KEY is not set, cannot generate quiz")
-        return None, None, None, None
     prompt = (
         f"Slide: {slide_content}\n"
         "Generate 1 multiple-choice quiz question. Format strictly as JSON:\n"
         "{\"question\": str, \"options\": [str, str, str, str], \"correct\": int, \"explanation\": str}\n"
         "Ensure exactly 4 options, no prefixes (e.g., no 'A. ', 'B. '). 'correct' must be a valid index (0-3)."
     )
-    headers = {"Authorization": f"Bearer {XAI_API_KEY}", "Content-Type": "application/json"}
-    data = {"model": "grok-3-mini", "messages": [{"role": "user", "content": prompt}]}
+    key = None
     try:
-        logging.debug(f"Sending xAI API request: URL={XAI_API_URL}, Headers={headers}, Data={data}")
-        response = requests.post(XAI_API_URL, headers=headers, json=data, timeout=120)
-        logging.debug(f"xAI API response: Status={response.status_code}, Body={response.text}")
-        response.raise_for_status()
-        generated = response.json()["choices"][0]["message"]["content"].strip()
+        generated, key = _call_xai(prompt, 'quiz')
+        if generated is None:
+            return None, None, None, None
         if generated.startswith('```json'):
             generated = generated[7:-3].strip()
         quiz_data = json.loads(generated)
@@ -146,66 +274,354 @@ def generate_quiz_questions(slide_content):
         correct = quiz_data["correct"]
         explanation = quiz_data["explanation"]
         if not (isinstance(options, list) and len(options) == 4 and isinstance(correct, int) and 0 <= correct <= 3):
-            logging.error(f"Invalid quiz format: {generated}")
-            return None, None, None, None
+            raise ValueError(f"Invalid quiz format: {generated}")
         return question, json.dumps(options), correct, explanation
     except Exception as e:
         logging.error(f"Error generating quiz: {e}")
+        if key:
+            # a completion came back but couldn't be used; don't replay it next time
+            llm_cache.forget(key)
         return None, None, None, None
 
-def refresh_database():
-    logging.info("Starting database refresh")
-    headlines = fetch_headlines()
-    if not headlines:
-        logging.warning("No headlines fetched, skipping refresh")
-        return
+_JSON_FENCE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+def _parse_json_object(text):
+    text = _JSON_FENCE.sub('', text.strip())
+    start, end = text.find('{'), text.rfind('}')
+    if start == -1 or end < start:
+        raise ValueError("no JSON object in response")
+    parsed = json.loads(text[start:end + 1])
+    if not isinstance(parsed, dict):
+        raise ValueError("response is not a JSON object")
+    return parsed
+
+def _nonempty_str(value):
+    return isinstance(value, str) and bool(value.strip())
+
+def _slide_errors(slide):
+    if not isinstance(slide, dict):
+        return ["slide must be an object"]
+    errors = []
+    if not _nonempty_str(slide.get("title")):
+        errors.append("slide.title must be a non-empty string")
+    if not _nonempty_str(slide.get("threat")):
+        errors.append("slide.threat must be a non-empty string")
+    tips = slide.get("safety_tips")
+    if not (isinstance(tips, list) and 3 <= len(tips) <= 4 and all(_nonempty_str(t) for t in tips)):
+        errors.append("slide.safety_tips must be a list of 3-4 non-empty strings")
+    return errors
+
+def _quiz_errors(quiz):
+    if not isinstance(quiz, dict):
+        return ["quiz must be an object"]
+    errors = []
+    if not _nonempty_str(quiz.get("question")):
+        errors.append("quiz.question must be a non-empty string")
+    options = quiz.get("options")
+    if not (isinstance(options, list) and len(options) == 4 and all(_nonempty_str(o) for o in options)):
+        errors.append("quiz.options must be a list of exactly 4 non-empty strings without 'A. ' style prefixes")
+    correct = quiz.get("correct")
+    if not (isinstance(correct, int) and not isinstance(correct, bool) and 0 <= correct <= 3):
+        errors.append("quiz.correct must be an integer index 0-3")
+    if not _nonempty_str(quiz.get("explanation")):
+        errors.append("quiz.explanation must be a non-empty string")
+    return errors
+
+_SLIDE_SCHEMA = ('{"title": str (1-2 sentence catchy header), "threat": str (brief threat description), '
+                 '"safety_tips": [str, str, str] (3-4 simple, actionable prevention tips, under 200 words total)}')
+_QUIZ_SCHEMA = ('{"question": str, "options": [str, str, str, str], "correct": int (index 0-3), "explanation": str}')
+
+def _repair(part, schema, context, broken, errors):
+    # ask again for just the part that failed validation
+    prompt = (
+        f"{context}\n"
+        f"This {part} JSON was invalid:\n{json.dumps(broken) if broken is not None else '(missing)'}\n"
+        f"Problems: {'; '.join(errors)}\n"
+        f"Return only the corrected {part} as a JSON object matching: {schema}"
+    )
+    completion, key = _call_xai(prompt, 'repair')
+    if completion is None:
+        return None
     try:
-        with get_db_conn() as conn:
-            cur = conn.cursor()
-            new_headlines = []
-            for h in headlines:
-                hash_value = hashlib.sha256((h['title'] + h['description']).encode()).hexdigest()
-                cur.execute("SELECT id FROM headlines WHERE hash = %s", (hash_value,))
-                if not cur.fetchone():
-                    cur.execute("""
-                        INSERT INTO headlines (title, description, link, timestamp, source, published_date, hash)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id
-                    """, (h['title'], h['description'], h['link'], datetime.now(timezone.utc),
-                          h['source'], h['published_date'], hash_value))
-                    headline_id = cur.fetchone()[0]
-                    new_headlines.append(headline_id)
+        fixed = _parse_json_object(completion)
+    except ValueError as e:
+        logging.error(f"Unparseable {part} repair: {e}")
+        llm_cache.forget(key)
+        return None
+    remaining = _slide_errors(fixed) if part == "slide" else _quiz_errors(fixed)
+    if remaining:
+        logging.error(f"{part} still invalid after repair: {'; '.join(remaining)}")
+        llm_cache.forget(key)
+        return None
+    return fixed
+
+def _render_slide_content(slide):
+    tips = "\n".join(f"- {tip.strip()}" for tip in slide["safety_tips"])
+    return f"Threat: {slide['threat'].strip()}\nSafety tips:\n{tips}"
+
+def generate_combined_content(headline):
+    # One structured call for both slide and quiz instead of two sequential ones.
+    context = f"Headline: {headline['title']}\nDescription: {headline['description']}\nLink: {headline['link']}"
+    prompt = (
+        f"{context}\n"
+        "Generate a concise cyber awareness slide about this headline and 1 multiple-choice quiz question "
+        "testing its key lesson. Respond with only a JSON object, no markdown:\n"
+        f'{{"slide": {_SLIDE_SCHEMA}, "quiz": {_QUIZ_SCHEMA}}}\n'
+        "Quiz options must have no prefixes (e.g., no 'A. ', 'B. ')."
+    )
+    try:
+        completion, key = _call_xai(prompt, 'combined')
+        if completion is None:
+            return None
+        try:
+            parsed = _parse_json_object(completion)
+        except ValueError as e:
+            logging.warning(f"Unparseable combined response for {headline['title']}: {e}")
+            llm_cache.forget(key)
+            parsed = {}
+        slide, quiz = parsed.get("slide"), parsed.get("quiz")
+        slide_errors, quiz_errors = _slide_errors(slide), _quiz_errors(quiz)
+        if slide_errors or quiz_errors:
+            llm_cache.forget(key)
+        if slide_errors:
+            slide = _repair("slide", _SLIDE_SCHEMA, context, slide, slide_errors)
+            if slide is None:
+                return None
+        content = _render_slide_content(slide)
+        if quiz_errors:
+            quiz = _repair("quiz", _QUIZ_SCHEMA, f"Slide: {content}", quiz, quiz_errors)
+        return {
+            "headline_id": headline['id'],
+            "title": slide["title"].strip(),
+            "content": content,
+            "quiz": (quiz["question"], json.dumps(quiz["options"]), quiz["correct"], quiz["explanation"]) if quiz else None
+        }
+    except Exception as e:
+        logging.error(f"Error generating combined content for {headline['title']}: {e}")
+        return None
+
+def store_headlines(headlines):
+    # Exact repeats are dropped by the hash; near-duplicates are stored but share a cluster_id.
+    now = datetime.now(timezone.utc)
+    by_hash = {}
+    for h in headlines:
+        hash_value = hashlib.sha256((h['title'] + h['description']).encode()).hexdigest()
+        by_hash.setdefault(hash_value, h)
+    for h in by_hash.values():
+        h['simhash'] = simhash(h['title'], h['description'])
+    rows = [(h['title'], h['description'], h['link'], now, h['source'], h['published_date'], hash_value,
+             simhash_to_db(h['simhash']))
+            for hash_value, h in by_hash.items()]
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        try:
+            headline_index.sync(cur)
+            inserted = psycopg2.extras.execute_values(cur, """
+                INSERT INTO headlines (title, description, link, timestamp, source, published_date, hash, simhash)
+                VALUES %s
+                ON CONFLICT (hash) DO NOTHING
+                RETURNING id, hash
+            """, rows, page_size=max(len(rows), 1), fetch=True)
+            new_headlines = [dict(by_hash[hash_value], id=headline_id, timestamp=now)
+                             for headline_id, hash_value in sorted(inserted)]
             if new_headlines:
-                for headline_id in random.sample(new_headlines, min(5, len(new_headlines))):
-                    cur.execute("SELECT title, description, link FROM headlines WHERE id = %s", (headline_id,))
-                    headline = cur.fetchone()
-                    title, content = generate_slide_content({"title": headline[0], "description": headline[1], "link": headline[2]})
-                    if title and content:
-                        cur.execute(
-                            "INSERT INTO slides (title, content, headline_id) VALUES (%s, %s, %s) RETURNING id",
-                            (title, content, headline_id)
-                        )
-                        slide_id = cur.fetchone()[0]
-                        question, options, correct, explanation = generate_quiz_questions(content)
-                        if question:
-                            cur.execute(
-                                "INSERT INTO quiz (question, options, correct, explanation, slide_id) VALUES (%s, %s, %s, %s, %s)",
-                                (question, options, correct, explanation, slide_id)
-                            )
+                headline_index.assign_clusters(cur, new_headlines)
             conn.commit()
-            logging.info("Database refresh completed")
+        except Exception:
+            # the index may have seen rows that are now rolled back
+            headline_index.reset()
+            raise
+    logging.debug(f"Inserted {len(inserted)} of {len(rows)} fetched headlines")
+    return new_headlines
+
+def _generation_rank(h):
+    # highest relevance first, newest first among equals
+    return h['relevance'], h['published_date'].timestamp() if h['published_date'] else 0
+
+def story_representatives(headlines):
+    # One headline per near-duplicate cluster, skipping stories that already have a slide
+    # from an earlier refresh.
+    clusters = list({h['cluster_id'] for h in headlines})
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT DISTINCT h.cluster_id FROM headlines h JOIN slides s ON s.headline_id = h.id
+            WHERE h.cluster_id = ANY(%s::int[])
+        """, (clusters,))
+        covered = {row[0] for row in cur.fetchall()}
+    best = {}
+    for h in headlines:
+        if h['cluster_id'] in covered:
+            continue
+        current = best.get(h['cluster_id'])
+        if current is None or _generation_rank(h) > _generation_rank(current):
+            best[h['cluster_id']] = h
+    if len(best) < len(headlines):
+        logging.info(f"{len(headlines)} new headlines cover {len(best)} stories without slides")
+    return list(best.values())
+
+def select_for_generation(headlines, limit=GENERATION_BATCH_SIZE):
+    return sorted(headlines, key=_generation_rank, reverse=True)[:limit]
+
+def _generate_for_headline(headline):
+    if GENERATION_MODE == 'combined':
+        return generate_combined_content(headline)
+    title, content = generate_slide_content(headline)
+    if not (title and content):
+        return None
+    question, options, correct, explanation = generate_quiz_questions(content)
+    return {
+        "headline_id": headline['id'],
+        "title": title,
+        "content": content,
+        "quiz": (question, options, correct, explanation) if question else None
+    }
+
+def generate_content(headlines):
+    # Runs with no database connection checked out: LLM calls can take minutes.
+    if not headlines:
+        return []
+    generated = []
+    with ThreadPoolExecutor(max_workers=max(1, min(GENERATION_CONCURRENCY, len(headlines)))) as executor:
+        futures = {executor.submit(_generate_for_headline, h): h for h in headlines}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                logging.error(f"Error generating content for {futures[future]['title']}: {e}")
+                continue
+            if result:
+                generated.append(result)
+    # keep insertion order stable with the selection order
+    order = {h['id']: i for i, h in enumerate(headlines)}
+    generated.sort(key=lambda g: order[g['headline_id']])
+    return generated
+
+def store_generated_content(generated):
+    if not generated:
+        return
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        slide_rows = psycopg2.extras.execute_values(
+            cur,
+            "INSERT INTO slides (title, content, headline_id) VALUES %s RETURNING id, headline_id",
+            [(g['title'], g['content'], g['headline_id']) for g in generated],
+            fetch=True
+        )
+        slide_ids = {headline_id: slide_id for slide_id, headline_id in slide_rows}
+        # quiz.created_at opens the next one-score-per-refresh window (submit_quiz_score), so it
+        # is stamped with the same clock as scores.completed_at
+        now = datetime.now(timezone.utc)
+        quiz_rows = [g['quiz'] + (slide_ids[g['headline_id']], now) for g in generated if g['quiz']]
+        if quiz_rows:
+            psycopg2.extras.execute_values(
+                cur,
+                "INSERT INTO quiz (question, options, correct, explanation, slide_id, created_at) VALUES %s",
+                quiz_rows
+            )
+        conn.commit()
+    logging.info(f"Stored {len(generated)} slides and {len(quiz_rows)} quiz questions")
+
+def _refresh_content():
+    logging.info("Starting database refresh")
+    validators = load_feed_validators()
+    headlines = fetch_headlines(validators)
+    if not headlines:
+        logging.info("No new relevant headlines in any feed")
+        save_feed_validators(validators)
+        return 0
+    try:
+        new_headlines = store_headlines(headlines)
+        # only remember validators once the headlines they cover are stored
+        save_feed_validators(validators)
+        if new_headlines:
+            # Serve the new headlines now rather than after minutes of generation. Scores are
+            # still counted against the old quiz until the new one is stored.
+            bump_content_generation()
+            try:
+                selected = select_for_generation(story_representatives(new_headlines))
+                store_generated_content(generate_content(selected))
+            finally:
+                # new headlines are visible even if generation failed
+                bump_content_generation()
+            llm_cache.evict()
+        logging.info("Database refresh completed")
+        return len(new_headlines)
     except Exception as e:
         logging.error(f"Error in refresh_database: {e}")
         raise
 
+# Last successful refresh, falling back to the newest headline for databases that predate
+# refresh_runs.
+_LAST_REFRESH_SQL = """
+    SELECT COALESCE((SELECT MAX(finished_at) FROM refresh_runs WHERE status = 'ok'),
+                    (SELECT MAX(timestamp) FROM headlines)),
+           EXISTS (SELECT 1 FROM refresh_runs
+                   WHERE status = 'running' AND started_at > NOW() - make_interval(secs => %s))
+"""
+
+def _claim_refresh(force):
+    # Only one refresh runs at a time across all workers, and unless forced only when the
+    # last one is older than REFRESH_INTERVAL_SECONDS. The claim is a 'running' row, so no
+    # connection is held while feeds and the LLM are slow; a run that died without finishing
+    # stops blocking others after REFRESH_LEASE_SECONDS.
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (REFRESH_LOCK_ID,))
+        cur.execute(_LAST_REFRESH_SQL, (REFRESH_LEASE_SECONDS,))
+        last_refresh, running = cur.fetchone()
+        if running:
+            logging.info("Refresh already running in another process, skipping")
+            return None
+        if not force and last_refresh and \
+                (datetime.now(timezone.utc) - last_refresh).total_seconds() < REFRESH_INTERVAL_SECONDS:
+            logging.info(f"Content refreshed at {last_refresh.isoformat()}, still fresh; skipping refresh")
+            return None
+        cur.execute("INSERT INTO refresh_runs (status) VALUES ('running') RETURNING id")
+        run_id = cur.fetchone()[0]
+        conn.commit()
+    return run_id
+
+def _finish_refresh(run_id, status, new_headlines):
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE refresh_runs SET status = %s, finished_at = CURRENT_TIMESTAMP, new_headlines = %s
+            WHERE id = %s
+        """, (status, new_headlines, run_id))
+        cur.execute("DELETE FROM refresh_runs WHERE started_at < NOW() - INTERVAL '30 days'")
+        conn.commit()
+
+def refresh_database(force=True):
+    run_id = _claim_refresh(force)
+    if run_id is None:
+        return False
+    status, new_headlines = 'failed', 0
+    try:
+        new_headlines = _refresh_content()
+        status = 'ok'
+    finally:
+        _finish_refresh(run_id, status, new_headlines)
+    return True
+
+def refresh_if_stale():
+    return refresh_database(force=False)
+
+def content_freshness():
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(_LAST_REFRESH_SQL, (REFRESH_LEASE_SECONDS,))
+        last_refresh, running = cur.fetchone()
+    age = (datetime.now(timezone.utc) - last_refresh).total_seconds() if last_refresh else None
+    return {"last_refresh": last_refresh.isoformat() if last_refresh else None,
+            "age_seconds": int(age) if age is not None else None,
+            "stale": age is None or age > REFRESH_INTERVAL_SECONDS,
+            "refresh_running": running}
+
 @content_bp.route('/api/latest_refresh', methods=['GET'])
 def latest_refresh():
     try:
-        with get_db_conn() as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT MAX(timestamp) FROM headlines")
-            latest = cur.fetchone()[0]
-            timestamp = int(latest.timestamp()) if latest else 0
-            return jsonify({"timestamp": timestamp})
+        return content_response('latest_refresh')
     except Exception as e:
         logging.error(f"Error in /api/latest_refresh: {e}")
         return jsonify({"error": "Failed to fetch latest refresh timestamp"}), 500
@@ -213,19 +629,7 @@ def latest_refresh():
 @content_bp.route('/api/headlines', methods=['GET'])
 def get_headlines():
     try:
-        with get_db_conn() as conn:
-            cur = conn.cursor(cursor_factory=DictCursor)
-            cur.execute("""
-                SELECT title, description, link, source, published_date, timestamp
-                FROM headlines ORDER BY timestamp DESC LIMIT 5
-            """)
-            headlines = [{"title": row['title'], "description": row['description'] or "No description",
-                          "link": row['link'] or "#", "source": row['source'],
-                          "published_date": row['published_date'].isoformat().replace('+00:00', 'Z') if row['published_date'] else None,
-                          "timestamp": row['timestamp'].isoformat().replace('+00:00', 'Z') if row['timestamp'] else None}
-                         for row in cur.fetchall()]
-        logging.debug(f"Serving headlines: {headlines}")
-        return jsonify(headlines)
+        return content_response('headlines')
     except Exception as e:
         logging.error(f"Error in /api/headlines: {e}")
         return jsonify({"error": "Failed to load headlines"}), 500
@@ -233,65 +637,7 @@ def get_headlines():
 @content_bp.route('/api/slides', methods=['GET'])
 def get_slides():
     try:
-        with get_db_conn() as conn:
-            cur = conn.cursor(cursor_factory=DictCursor)
-            cur.execute("""
-                SELECT slides.title, slides.content, headlines.title as headline_title,
-                       headlines.description as headline_description, headlines.link as headline_link,
-                       headlines.source as headline_source, headlines.published_date as headline_published_date,
-                       headlines.timestamp as headline_timestamp
-                FROM slides
-                LEFT JOIN headlines ON slides.headline_id = headlines.id
-                ORDER BY slides.created_at DESC
-                LIMIT 5
-            """)
-            slides = []
-            for row in cur.fetchall():
-                slide = {
-                    "title": row['title'],
-                    "content": row['content']
-                }
-                if row['headline_title']:
-                    slide.update({
-                        "headline": {
-                            "title": row['headline_title'],
-                            "description": row['headline_description'] or "No description",
-                            "link": row['headline_link'] or "#",
-                            "source": row['headline_source'],
-                            "published_date": row['headline_published_date'].isoformat().replace('+00:00', 'Z') if row['headline_published_date'] else None,
-                            "timestamp": row['headline_timestamp'].isoformat().replace('+00:00', 'Z') if row['headline_timestamp'] else None
-                        }
-                    })
-                else:
-                    slide["headline"] = None
-                slides.append(slide)
-            logging.debug(f"Serving slides: {slides}")
-            return jsonify(slides)
+        return content_response('slides')
     except Exception as e:
         logging.error(f"Error in /api/slides: {e}")
-        return jsonify({"error": "Failed to load slides"}), 500
-
-def start_scheduler():
-    logging.info("Starting scheduler for daily refresh and X post")
-    try:
-        scheduler.remove_all_jobs()
-        scheduler.add_job(
-            func=refresh_database,
-            trigger="interval",
-            seconds=REFRESH_INTERVAL_SECONDS,
-            max_instances=1,
-            id="refresh_database"
-        )
-        scheduler.add_job(
-            func=post_to_x,
-            trigger="cron",
-            hour=11,
-            minute=11,
-            timezone="US/Eastern",
-            max_instances=1,
-            id="post_to_x"
-        )
-        scheduler.start()
-    except Exception as e:
-        logging.error(f"Error starting scheduler: {e}")
-        raise
\ No newline at end of file
+        return jsonify({"error": "Failed to load slides"}), 500
\ No newline at end of file
@@ -0,0 +1,81 @@
+import os
+import time
+import random
+import logging
+import threading
+from utils import get_db_conn
+
+# Global counters spread over COUNTER_SHARDS rows of counter_shards, so concurrent increments
+# land on different rows instead of queueing on one row lock. Reads come from a per-worker
+# cached sum that is refreshed in the background once it is older than COUNTER_CACHE_TTL,
+# so page renders never wait on the database for it.
+COUNTER_SHARDS = int(os.getenv('COUNTER_SHARDS', '16'))
+COUNTER_CACHE_TTL = float(os.getenv('COUNTER_CACHE_TTL', '30'))
+
+class ShardedCounter:
+    def __init__(self, name, shards=COUNTER_SHARDS, ttl=COUNTER_CACHE_TTL):
+        self.name = name
+        self.shards = max(shards, 1)
+        self.ttl = ttl
+        self._value = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _read(self):
+        with get_db_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT COALESCE(SUM(count), 0) FROM counter_shards WHERE name = %s", (self.name,))
+            return cur.fetchone()[0]
+
+    def refresh(self):
+        started = time.monotonic()
+        try:
+            value = self._read()
+            with self._lock:
+                # local increments committed after the read are picked up by the next refresh
+                self._value = value
+                self._loaded_at = started
+        finally:
+            with self._lock:
+                self._refreshing = False
+        return value
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logging.error(f"Failed to refresh {self.name} counter: {e}")
+
+    def value(self, block=False):
+        # block=False never touches the database: it returns the cached sum (0 before the first
+        # load) and kicks off a background refresh when the cache is stale.
+        with self._lock:
+            value = self._value
+            stale = value is None or time.monotonic() - self._loaded_at >= self.ttl
+            start_refresh = stale and not self._refreshing and not (block and value is None)
+            if start_refresh:
+                self._refreshing = True
+        if block and value is None:
+            return self.refresh()
+        if start_refresh:
+            threading.Thread(target=self._refresh_in_background, name=f'{self.name}-counter-refresh',
+                             daemon=True).start()
+        return value or 0
+
+    def increment(self, amount=1):
+        with get_db_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO counter_shards (name, shard, count) VALUES (%s, %s, %s)
+                ON CONFLICT (name, shard) DO UPDATE SET count = counter_shards.count + EXCLUDED.count
+            """, (self.name, random.randrange(self.shards), amount))
+            conn.commit()
+        with self._lock:
+            if self._value is not None:
+                self._value += amount
+
+    def warm(self):
+        threading.Thread(target=self._refresh_in_background, name=f'{self.name}-counter-warm', daemon=True).start()
+
+quiz_counter = ShardedCounter('quizzes_completed')
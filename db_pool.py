@@ -0,0 +1,206 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+import psycopg2
+
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+DB_POOL_MAX_AGE = float(os.getenv('DB_POOL_MAX_AGE', '1800'))
+DB_POOL_CHECK_IDLE = float(os.getenv('DB_POOL_CHECK_IDLE', '30'))
+
+class PoolTimeout(psycopg2.OperationalError):
+    pass
+
+class ConnectionPool:
+    def __init__(self, connect, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+                 max_age=DB_POOL_MAX_AGE, check_idle=DB_POOL_CHECK_IDLE):
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = max(maxconn, 1)
+        self.timeout = timeout
+        self.max_age = max_age
+        self.check_idle = check_idle
+        self._cond = threading.Condition()
+        # idle entries are (conn, created_at, returned_at); newest returns go on the right
+        self._idle = deque()
+        self._created = {}
+        self._size = 0
+        self._closed = False
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._checkout_time_total = 0.0
+        self._checkout_time_max = 0.0
+        self._discarded = 0
+        self._timeouts = 0
+        for _ in range(minconn):
+            try:
+                conn = self._open()
+            except psycopg2.Error as e:
+                logging.warning(f"Could not pre-open pooled connection: {e}")
+                break
+            self._idle.append((conn, self._created[id(conn)], time.monotonic()))
+
+    def _open(self):
+        conn = self._connect()
+        self._created[id(conn)] = time.monotonic()
+        self._size += 1
+        return conn
+
+    def _discard(self, conn):
+        self._created.pop(id(conn), None)
+        self._size -= 1
+        self._discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _usable(self, conn, created_at, returned_at, now):
+        if conn.closed:
+            return False
+        if self.max_age and now - created_at > self.max_age:
+            return False
+        if self.check_idle is not None and now - returned_at >= self.check_idle:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        while True:
+            conn = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise psycopg2.InterfaceError("connection pool is closed")
+                    if self._idle:
+                        conn, created_at, returned_at = self._idle.pop()
+                        break
+                    if self._size < self.maxconn:
+                        # reserve the slot before connecting so concurrent callers respect maxconn
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(f"Timed out after {self.timeout}s waiting for a database connection")
+                    waited = True
+                    self._cond.wait(remaining)
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created[id(conn)] = time.monotonic()
+                    return self._checked_out(conn, start, waited)
+            # liveness check runs outside the lock so a slow SELECT 1 doesn't stall other checkouts
+            if self._usable(conn, created_at, returned_at, time.monotonic()):
+                with self._cond:
+                    return self._checked_out(conn, start, waited)
+            with self._cond:
+                self._discard(conn)
+                self._cond.notify()
+
+    def _checked_out(self, conn, start, waited):
+        elapsed = time.monotonic() - start
+        self._checkouts += 1
+        self._checkout_time_total += elapsed
+        self._checkout_time_max = max(self._checkout_time_max, elapsed)
+        if waited:
+            self._waits += 1
+            self._wait_time_total += elapsed
+            self._wait_time_max = max(self._wait_time_max, elapsed)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        with self._cond:
+            if id(conn) not in self._created:
+                return
+            if not discard and not conn.closed:
+                try:
+                    if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+            if discard or conn.closed or self._closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, self._created[id(conn)], time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _, _ = self._idle.pop()
+                self._discard(conn)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            checkouts = self._checkouts
+            return {
+                "size": self._size,
+                "in_use": self._size - idle,
+                "idle": idle,
+                "min": self.minconn,
+                "max": self.maxconn,
+                "checkouts": checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "wait_time_total_ms": round(self._wait_time_total * 1000, 3),
+                "wait_time_max_ms": round(self._wait_time_max * 1000, 3),
+                "checkout_latency_avg_ms": round(self._checkout_time_total * 1000 / checkouts, 3) if checkouts else 0.0,
+                "checkout_latency_max_ms": round(self._checkout_time_max * 1000, 3),
+            }
+
+# Behaves like `with psycopg2_conn:` (commit on success, rollback on error) and then
+# hands the connection back to the pool instead of leaving it open until GC.
+class PooledConnection:
+    def __init__(self, pool, conn, on_release=None):
+        self._pool = pool
+        self._conn = conn
+        self._on_release = on_release
+
+    @property
+    def connection(self):
+        return self._conn
+
+    def __enter__(self):
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._conn is not None and not self._conn.closed:
+                self._conn.__exit__(exc_type, exc, tb)
+        except psycopg2.Error as e:
+            logging.warning(f"Error finishing pooled transaction: {e}")
+            self.release(discard=True)
+            return False
+        self.release(discard=isinstance(exc, (psycopg2.OperationalError, psycopg2.InterfaceError)))
+        return False
+
+    def release(self, discard=False):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        self._pool.putconn(conn, discard=discard)
+        if self._on_release:
+            self._on_release(self)
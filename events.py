@@ -0,0 +1,127 @@
+import os
+import time
+import select
+import logging
+import threading
+import psycopg2
+import psycopg2.extensions
+
+# Cross-worker invalidation. Writers bump a row in cache_versions and pg_notify the new
+# version in the same transaction; every worker runs one LISTEN thread that forwards
+# (name, version) to local subscribers. Versions are re-read on every (re)connect, so
+# notifications missed while disconnected are recovered. Topics (see notify/on) carry an
+# arbitrary payload instead; their handlers get None after a reconnect and must resync.
+EVENTS_CHANNEL = 'cyberaware_invalidate'
+LISTEN_POLL_SECONDS = 5
+LISTEN_RECONNECT_SECONDS = 10
+
+_subscribers = {}
+_topics = {}
+_versions = {}
+_lock = threading.Lock()
+_listener = None
+_listener_pid = None
+
+def bump_version(cur, name):
+    cur.execute("""
+        WITH v AS (
+            INSERT INTO cache_versions (name, version) VALUES (%s, 1)
+            ON CONFLICT (name) DO UPDATE SET version = cache_versions.version + 1
+            RETURNING version
+        )
+        SELECT version, pg_notify(%s, %s || ':' || version) FROM v
+    """, (name, EVENTS_CHANNEL, name))
+    return cur.fetchone()[0]
+
+def subscribe(name, callback):
+    with _lock:
+        _subscribers.setdefault(name, []).append(callback)
+        version = _versions.get(name)
+    if version is not None:
+        callback(version)
+
+def notify(cur, topic, payload):
+    cur.execute("SELECT pg_notify(%s, %s)", (EVENTS_CHANNEL, f"{topic}:{payload}"))
+
+def on(topic, callback):
+    with _lock:
+        _topics.setdefault(topic, []).append(callback)
+
+def _dispatch_topic(topic, payload):
+    with _lock:
+        callbacks = list(_topics.get(topic, []))
+    for callback in callbacks:
+        try:
+            callback(payload)
+        except Exception as e:
+            logging.error(f"Error handling {topic} event: {e}")
+
+def publish_local(name, version):
+    # Called by the writing worker after commit so its own caches don't wait for the round trip.
+    with _lock:
+        if version <= _versions.get(name, -1):
+            return
+        _versions[name] = version
+        callbacks = list(_subscribers.get(name, []))
+    for callback in callbacks:
+        try:
+            callback(version)
+        except Exception as e:
+            logging.error(f"Error handling {name} invalidation: {e}")
+
+def current_version(name):
+    with _lock:
+        return _versions.get(name)
+
+def listener_alive():
+    return _listener is not None and _listener.is_alive() and _listener_pid == os.getpid()
+
+def ensure_listener():
+    global _listener, _listener_pid
+    if listener_alive():
+        return
+    with _lock:
+        if _listener is not None and _listener.is_alive() and _listener_pid == os.getpid():
+            return
+        _listener = threading.Thread(target=_listen_forever, name='events-listener', daemon=True)
+        _listener_pid = os.getpid()
+        _listener.start()
+
+def _listen_forever():
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(os.getenv('DATABASE_URL'), sslmode='require')
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {EVENTS_CHANNEL}")
+            cur.execute("SELECT name, version FROM cache_versions")
+            for name, version in cur.fetchall():
+                publish_local(name, version)
+            with _lock:
+                topics = list(_topics)
+            for topic in topics:
+                _dispatch_topic(topic, None)
+            while True:
+                if select.select([conn], [], [], LISTEN_POLL_SECONDS) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    name, _, version = notify.payload.partition(':')
+                    if name in _topics:
+                        _dispatch_topic(name, version)
+                        continue
+                    try:
+                        publish_local(name, int(version))
+                    except ValueError:
+                        logging.warning(f"Ignoring malformed invalidation payload: {notify.payload}")
+        except Exception as e:
+            logging.warning(f"Invalidation listener disconnected, retrying in {LISTEN_RECONNECT_SECONDS}s: {e}")
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        time.sleep(LISTEN_RECONNECT_SECONDS)
@@ -0,0 +1,16 @@
+import os
+import glob
+
+# Multi-worker /metrics: every worker writes its samples to PROMETHEUS_MULTIPROC_DIR and
+# the endpoint merges them. The directory must be emptied before the workers start.
+def on_starting(server):
+    directory = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, '*.db')):
+            os.remove(path)
+
+def child_exit(server, worker):
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import logging
+import psycopg2.extras
+from utils import get_db_conn
+
+# Durable job queue in the jobs table. Producers enqueue(); worker processes (see worker.py,
+# `python manage.py worker`) claim one due job at a time with FOR UPDATE SKIP LOCKED, so any
+# number of them can share the queue without handing the same job out twice. A failed job is
+# retried with exponential backoff until max_attempts. A running job's lease is renewed every
+# JOB_HEARTBEAT_SECONDS while its handler runs, so only a job whose worker died (or lost the
+# database for a whole lease) is re-queued once the lease expires. dedupe_key is unique
+# across all rows, which makes "enqueue the 14:00 refresh" idempotent however many
+# schedulers try.
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+JOB_RETRY_BACKOFF_SECONDS = int(os.getenv('JOB_RETRY_BACKOFF_SECONDS', '60'))
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '600'))
+JOB_HEARTBEAT_SECONDS = JOB_LEASE_SECONDS / 3
+JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', '7'))
+
+def slot_key(kind, period_seconds, now=None):
+    # same key for every enqueue within one period
+    now = time.time() if now is None else now
+    return f"{kind}:{int(now // period_seconds)}"
+
+def enqueue(kind, payload=None, dedupe_key=None, delay_seconds=0, max_attempts=JOB_MAX_ATTEMPTS, cur=None):
+    # Returns the new job id, or None if dedupe_key was already used. Pass cur to enqueue
+    # inside the caller's transaction.
+    sql = """
+        INSERT INTO jobs (kind, payload, dedupe_key, max_attempts, run_at)
+        VALUES (%s, %s, %s, %s, NOW() + make_interval(secs => %s))
+        ON CONFLICT (dedupe_key) DO NOTHING
+        RETURNING id
+    """
+    params = (kind, json.dumps(payload or {}), dedupe_key, max_attempts, delay_seconds)
+    if cur is not None:
+        cur.execute(sql, params)
+        row = cur.fetchone()
+    else:
+        with get_db_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            row = cur.fetchone()
+            conn.commit()
+    if row:
+        logging.info(f"Enqueued {kind} job {row[0]}" + (f" ({dedupe_key})" if dedupe_key else ''))
+    return row[0] if row else None
+
+def claim(worker_id):
+    with get_db_conn() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cur.execute("""
+            UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_by = %s, locked_at = NOW()
+            WHERE id = (
+                SELECT id FROM jobs WHERE status = 'queued' AND run_at <= NOW()
+                ORDER BY run_at, id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, kind, payload, attempts, max_attempts
+        """, (worker_id,))
+        job = cur.fetchone()
+        conn.commit()
+    return dict(job) if job else None
+
+def heartbeat(job):
+    # renew the lease; attempts pins it to this claim, so a job already reaped and claimed
+    # again elsewhere is left alone
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("UPDATE jobs SET locked_at = NOW() WHERE id = %s AND status = 'running' AND attempts = %s",
+                    (job['id'], job['attempts']))
+        conn.commit()
+    return cur.rowcount == 1
+
+def complete(job_id):
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("UPDATE jobs SET status = 'done', finished_at = NOW(), last_error = NULL WHERE id = %s",
+                    (job_id,))
+        conn.commit()
+
+def fail(job, error):
+    retry = job['attempts'] < job['max_attempts']
+    delay = JOB_RETRY_BACKOFF_SECONDS * 2 ** (job['attempts'] - 1)
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        if retry:
+            cur.execute("""
+                UPDATE jobs SET status = 'queued', run_at = NOW() + make_interval(secs => %s), last_error = %s,
+                                locked_by = NULL, locked_at = NULL
+                WHERE id = %s
+            """, (delay, error, job['id']))
+        else:
+            cur.execute("UPDATE jobs SET status = 'failed', finished_at = NOW(), last_error = %s WHERE id = %s",
+                        (error, job['id']))
+        conn.commit()
+    if retry:
+        logging.warning(f"{job['kind']} job {job['id']} failed (attempt {job['attempts']}/{job['max_attempts']}), "
+                        f"retrying in {delay}s: {error}")
+    else:
+        logging.error(f"{job['kind']} job {job['id']} failed permanently after {job['attempts']} attempts: {error}")
+
+def reap(cur):
+    # re-queue (or fail) jobs whose worker stopped heartbeating (see heartbeat), and drop old
+    # finished rows
+    cur.execute("""
+        UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                        finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE NOW() END,
+                        last_error = 'lease expired on ' || COALESCE(locked_by, 'unknown worker'),
+                        locked_by = NULL, locked_at = NULL, run_at = NOW()
+        WHERE status = 'running' AND locked_at < NOW() - make_interval(secs => %s)
+    """, (JOB_LEASE_SECONDS,))
+    if cur.rowcount:
+        logging.warning(f"Reclaimed {cur.rowcount} jobs with expired leases")
+    cur.execute("""
+        DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < NOW() - make_interval(days => %s)
+    """, (JOB_RETENTION_DAYS,))
+
+def queue_stats():
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT kind,
+                   COUNT(*) FILTER (WHERE status = 'queued' AND run_at <= NOW()),
+                   COUNT(*) FILTER (WHERE status = 'queued' AND run_at > NOW()),
+                   COUNT(*) FILTER (WHERE status = 'running'),
+                   COUNT(*) FILTER (WHERE status = 'failed' AND finished_at > NOW() - INTERVAL '1 day'),
+                   EXTRACT(EPOCH FROM NOW() - MIN(run_at) FILTER (WHERE status = 'queued' AND run_at <= NOW()))
+            FROM jobs GROUP BY kind ORDER BY kind
+        """)
+        rows = cur.fetchall()
+    by_kind = {kind: {"due": due, "scheduled": scheduled, "running": running, "failed_24h": failed,
+                      "oldest_due_seconds": int(oldest) if oldest is not None else None}
+               for kind, due, scheduled, running, failed, oldest in rows}
+    return {"due": sum(k["due"] for k in by_kind.values()),
+            "running": sum(k["running"] for k in by_kind.values()),
+            "failed_24h": sum(k["failed_24h"] for k in by_kind.values()),
+            "by_kind": by_kind}
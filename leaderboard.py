@@ -1,103 +1,209 @@
+import os
+import json
+import base64
 import logging
-from flask import Blueprint, jsonify, request, session
+from flask import Blueprint, current_app, jsonify, request, session
 from datetime import datetime, timezone, timedelta
 from psycopg2.extras import DictCursor
 from utils import get_db_conn
+from cache import VersionedCache
+import events
+from ranking import rank_index
 
 leaderboard_bp = Blueprint('leaderboard', __name__)
 
+WEEKLY_WINDOW_DAYS = 7
+LEADERBOARD_CACHE_SIZE = int(os.getenv('LEADERBOARD_CACHE_SIZE', '256'))
+LEADERBOARD_CACHE_TTL = int(os.getenv('LEADERBOARD_CACHE_TTL', '300'))
+LEADERBOARD_PAGE_SIZE = 50
+LEADERBOARD_MAX_PAGE_SIZE = 200
+
+leaderboard_cache = VersionedCache('leaderboard', maxsize=LEADERBOARD_CACHE_SIZE, ttl=LEADERBOARD_CACHE_TTL)
+
+def bump_leaderboard_version(cur):
+    # call inside the writing transaction; pass the result to events.publish_local after commit
+    return events.bump_version(cur, 'leaderboard')
+
+def rebuild_daily_rollups():
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("LOCK TABLE user_daily_scores IN EXCLUSIVE MODE")
+        cur.execute("DELETE FROM user_daily_scores")
+        cur.execute("""
+            INSERT INTO user_daily_scores (user_id, day, total_score, quizzes_taken, perfect_quizzes, first_completed_at)
+            SELECT user_id, (completed_at AT TIME ZONE 'UTC')::date, SUM(score), COUNT(*),
+                   COUNT(CASE WHEN score = 69 OR score = 100 THEN 1 END), MIN(completed_at)
+            FROM scores
+            WHERE score > 0 AND completed_at IS NOT NULL
+            GROUP BY user_id, (completed_at AT TIME ZONE 'UTC')::date
+        """)
+        rows = cur.rowcount
+        version = bump_leaderboard_version(cur)
+        conn.commit()
+    events.publish_local('leaderboard', version)
+    logging.info(f"Rebuilt {rows} daily leaderboard rollup rows")
+    return rows
+
+def encode_cursor(row):
+    # only the sort key: the rank of the next page is counted server-side, never taken from
+    # the client
+    tiebreak = row['tiebreak']
+    tiebreak = tiebreak.isoformat() if tiebreak and tiebreak.year < 9999 else None
+    raw = json.dumps([row['total_score'], row['perfect_quizzes'], tiebreak, row['id']])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        total_score, perfect_quizzes, tiebreak, user_id = json.loads(raw)
+        return {"total_score": int(total_score), "perfect_quizzes": int(perfect_quizzes),
+                "tiebreak": datetime.fromisoformat(tiebreak) if tiebreak else 'infinity', "id": int(user_id)}
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+_SORT_KEY = "(-ranked.total_score, -ranked.perfect_quizzes, ranked.tiebreak, ranked.id)"
+
+def _keyset(after, op='>'):
+    # All sort keys ascending, so a single row comparison seeks straight to the page start.
+    if not after:
+        return "", ()
+    return (f" AND {_SORT_KEY} {op} (%s, %s, %s, %s)",
+            (-after['total_score'], -after['perfect_quizzes'], after['tiebreak'], after['id']))
+
+def _leader_row(row, rank):
+    return {"rank": rank, "username": row['username'], "quizzes_taken": row['quizzes_taken'],
+            "perfect_quizzes": row['perfect_quizzes'], "avg_score": round(row['avg_score'] or 0, 1),
+            "total_score": row['total_score'] or 0, "last_quiz": row['last_quiz'].isoformat() + 'Z' if row['last_quiz'] else None}
+
+def _ranked_query(scope, domain):
+    # (ranked subquery, its params, per-row LATERAL join for the page, its params)
+    if scope == 'team':
+        return ("""
+            SELECT users.id, users.username, COUNT(DISTINCT scores.quiz_id) as quizzes_taken,
+                   COUNT(CASE WHEN scores.score = 69 OR scores.score = 100 THEN 1 END) as perfect_quizzes,
+                   AVG(scores.score)::float as avg_score, SUM(scores.score) as total_score,
+                   user_totals.last_quiz, COALESCE(MIN(scores.completed_at), 'infinity'::timestamptz) as tiebreak
+            FROM scores
+            JOIN users ON scores.user_id = users.id
+            JOIN user_totals ON users.id = user_totals.user_id
+            WHERE users.domain = %s AND users.join_team = TRUE AND scores.score > 0
+            GROUP BY users.id, user_totals.last_quiz
+        """, (domain,), "", ())
+    if scope == 'weekly':
+        # 7 UTC days including today, at most 7 rollup rows per user
+        week_start = (datetime.now(timezone.utc) - timedelta(days=WEEKLY_WINDOW_DAYS - 1)).date()
+        # the rollup's quizzes_taken counts score rows (right for the average); the distinct
+        # quizzes shown, as in the other scopes, are counted from scores for the page only
+        return ("""
+            SELECT users.id, users.username,
+                   SUM(d.perfect_quizzes) as perfect_quizzes,
+                   SUM(d.total_score)::float / NULLIF(SUM(d.quizzes_taken), 0) as avg_score,
+                   SUM(d.total_score) as total_score, user_totals.last_quiz,
+                   COALESCE(MIN(d.first_completed_at), 'infinity'::timestamptz) as tiebreak
+            FROM user_daily_scores d
+            JOIN users ON d.user_id = users.id
+            JOIN user_totals ON users.id = user_totals.user_id
+            WHERE d.day >= %s AND users.join_public = TRUE
+            GROUP BY users.id, user_totals.last_quiz
+        """, (week_start,), """
+            LEFT JOIN LATERAL (
+                SELECT COUNT(DISTINCT scores.quiz_id) as quizzes_taken
+                FROM scores
+                WHERE scores.user_id = ranked.id AND scores.score > 0
+                  AND scores.completed_at >= %s::date::timestamp AT TIME ZONE 'UTC'
+            ) s ON TRUE
+        """, (week_start,))
+    # all-time, walks idx_user_totals_ranking and only aggregates scores for the page
+    return ("""
+        SELECT ut.user_id as id, users.username, ut.perfect_quizzes, ut.total_score, ut.last_quiz,
+               COALESCE(ut.last_quiz, 'infinity'::timestamptz) as tiebreak
+        FROM user_totals ut
+        JOIN users ON ut.user_id = users.id
+        WHERE ut.total_score > 0 AND users.join_public = TRUE
+    """, (), """
+        LEFT JOIN LATERAL (
+            SELECT COUNT(DISTINCT scores.quiz_id) as quizzes_taken, AVG(scores.score)::float as avg_score
+            FROM scores WHERE scores.user_id = ranked.id
+        ) s ON TRUE
+    """, ())
+
+def _compute_leaderboard(cur, scope, domain=None, limit=LEADERBOARD_PAGE_SIZE, after=None):
+    ranked, ranked_params, lateral, lateral_params = _ranked_query(scope, domain)
+    keyset, keyset_params = _keyset(after)
+    cur.execute(f"""
+        SELECT * FROM ({ranked}) ranked
+        {lateral}
+        WHERE TRUE{keyset}
+        ORDER BY {_SORT_KEY}
+        LIMIT %s
+    """, ranked_params + lateral_params + keyset_params + (limit + 1,))
+    rows = cur.fetchall()
+    first_rank = 1
+    if after:
+        # rows up to and including the cursor, on the same index as the page
+        keyset, keyset_params = _keyset(after, '<=')
+        cur.execute(f"SELECT COUNT(*) FROM ({ranked}) ranked WHERE TRUE{keyset}", ranked_params + keyset_params)
+        first_rank = cur.fetchone()[0] + 1
+    team_stats = None
+    if scope == 'team' and not after:
+        cur.execute("""
+            SELECT SUM(user_totals.total_score) as team_total,
+                   AVG((SELECT AVG(score) FROM scores WHERE scores.user_id = users.id AND scores.score > 0))::float as team_avg,
+                   SUM(user_totals.perfect_quizzes) as team_perfects,
+                   COUNT(*) as members
+            FROM user_totals
+            JOIN users ON user_totals.user_id = users.id
+            WHERE users.domain = %s AND users.join_team = TRUE
+        """, (domain,))
+        ts = cur.fetchone()
+        team_stats = {
+            "team_total": ts['team_total'] or 0,
+            "team_avg": round(ts['team_avg'] or 0, 1),
+            "team_perfects": ts['team_perfects'] or 0,
+            "members": ts['members'] or 0
+        }
+    leaders = [_leader_row(row, first_rank + i) for i, row in enumerate(rows[:limit])]
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return leaders, team_stats, next_cursor
+
 @leaderboard_bp.route('/api/leaderboard', methods=['GET'])
 def leaderboard():
     scope = request.args.get('scope', 'weekly')
-    with get_db_conn() as conn:
-        cur = conn.cursor(cursor_factory=DictCursor)
-        user = session.get('user')
-        leaders = []
-        user_rank = None
-        team_stats = None
-        if scope == 'team':
-            if not user or not user.get('domain'):
-                return jsonify({"error": "No team access", "leaders": [], "user_rank": None, "team_stats": None}), 403
-            domain = user['domain']
-            cur.execute("""
-                SELECT users.username, COUNT(DISTINCT scores.quiz_id) as quizzes_taken,
-                       COUNT(CASE WHEN scores.score = 69 OR scores.score = 100 THEN 1 END) as perfect_quizzes,
-                       AVG(scores.score) as avg_score, SUM(scores.score) as total_score,
-                       user_totals.last_quiz
-                FROM scores
-                JOIN users ON scores.user_id = users.id
-                JOIN user_totals ON users.id = user_totals.user_id
-                WHERE users.domain = %s AND users.join_team = TRUE AND scores.score > 0
-                GROUP BY users.id, user_totals.last_quiz
-                ORDER BY total_score DESC, perfect_quizzes DESC, MIN(scores.completed_at) ASC
-            """, (domain,))
-            leaders = [{"rank": i+1, "username": row['username'], "quizzes_taken": row['quizzes_taken'],
-                        "perfect_quizzes": row['perfect_quizzes'], "avg_score": round(row['avg_score'] or 0, 1),
-                        "total_score": row['total_score'] or 0, "last_quiz": row['last_quiz'].isoformat() + 'Z' if row['last_quiz'] else None}
-                       for i, row in enumerate(cur.fetchall())]
-            cur.execute("""
-                SELECT SUM(user_totals.total_score) as team_total,
-                       AVG((SELECT AVG(score) FROM scores WHERE scores.user_id = users.id AND scores.score > 0)) as team_avg,
-                       SUM(user_totals.perfect_quizzes) as team_perfects,
-                       COUNT(*) as members
-                FROM user_totals
-                JOIN users ON user_totals.user_id = users.id
-                WHERE users.domain = %s AND users.join_team = TRUE
-            """, (domain,))
-            ts = cur.fetchone()
-            team_stats = {
-                "team_total": ts['team_total'] or 0,
-                "team_avg": round(ts['team_avg'] or 0, 1),
-                "team_perfects": ts['team_perfects'] or 0,
-                "members": ts['members'] or 0
-            }
-        elif scope == 'weekly':
-            week_start = datetime.now(timezone.utc) - timedelta(days=7)
-            cur.execute("""
-                SELECT users.username, COUNT(DISTINCT scores.quiz_id) as quizzes_taken,
-                       COUNT(CASE WHEN scores.score = 69 OR scores.score = 100 THEN 1 END) as perfect_quizzes,
-                       AVG(scores.score) as avg_score, SUM(scores.score) as total_score,
-                       user_totals.last_quiz
-                FROM scores
-                JOIN users ON scores.user_id = users.id
-                JOIN user_totals ON users.id = user_totals.user_id
-                WHERE scores.completed_at >= %s AND scores.score > 0 AND users.join_public = TRUE
-                GROUP BY users.id, user_totals.last_quiz
-                ORDER BY total_score DESC, perfect_quizzes DESC, MIN(scores.completed_at) ASC
-            """, (week_start,))
-            leaders = [{"rank": i+1, "username": row['username'], "quizzes_taken": row['quizzes_taken'],
-                        "perfect_quizzes": row['perfect_quizzes'], "avg_score": round(row['avg_score'], 1),
-                        "total_score": row['total_score'], "last_quiz": row['last_quiz'].isoformat() + 'Z' if row['last_quiz'] else None}
-                       for i, row in enumerate(cur.fetchall())]
-        else:  # all-time
-            cur.execute("""
-                SELECT users.username, COUNT(DISTINCT scores.quiz_id) as quizzes_taken,
-                       user_totals.perfect_quizzes, COALESCE(AVG(scores.score), 0) as avg_score,
-                       user_totals.total_score, user_totals.last_quiz
-                FROM user_totals
-                JOIN users ON user_totals.user_id = users.id
-                LEFT JOIN scores ON users.id = scores.user_id
-                WHERE user_totals.total_score > 0 AND users.join_public = TRUE
-                GROUP BY users.id, user_totals.perfect_quizzes, user_totals.total_score, user_totals.last_quiz
-                ORDER BY user_totals.total_score DESC, user_totals.perfect_quizzes DESC, user_totals.last_quiz ASC
-            """)
-            leaders = [{"rank": i+1, "username": row['username'], "quizzes_taken": row['quizzes_taken'],
-                        "perfect_quizzes": row['perfect_quizzes'], "avg_score": round(row['avg_score'], 1),
-                        "total_score": row['total_score'], "last_quiz": row['last_quiz'].isoformat() + 'Z' if row['last_quiz'] else None}
-                       for i, row in enumerate(cur.fetchall())]
-        if scope != 'team' and user:
-            cur.execute(
-                'SELECT total_score, perfect_quizzes FROM user_totals WHERE user_id = %s',
-                (user['id'],)
-            )
-            totals = cur.fetchone()
-            if totals and totals['total_score'] > 0:
-                cur.execute(
-                    'SELECT COUNT(*) + 1 as rank FROM user_totals ut JOIN users u ON ut.user_id = u.id '
-                    'WHERE u.join_public = TRUE AND (ut.total_score > %s OR '
-                    '(ut.total_score = %s AND ut.perfect_quizzes > %s))',
-                    (totals['total_score'], totals['total_score'], totals['perfect_quizzes'])
-                )
-                user_rank = {"rank": cur.fetchone()['rank'], "username": user['username'],
-                             "total_score": totals['total_score']}
-        return jsonify({"leaders": leaders, "user_rank": user_rank, "team_stats": team_stats})
\ No newline at end of file
+    user = session.get('user')
+    domain = None
+    if scope == 'team':
+        if not user or not user.get('domain'):
+            return jsonify({"error": "No team access", "leaders": [], "user_rank": None, "team_stats": None}), 403
+        domain = user['domain']
+    elif scope != 'weekly':
+        scope = 'alltime'
+    try:
+        limit = min(max(int(request.args.get('limit', LEADERBOARD_PAGE_SIZE)), 1), LEADERBOARD_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    cursor = request.args.get('cursor') or None
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    # Only first pages are cached: they are the hot ones, and their keys are bounded. Later
+    # pages are keyed by client-supplied cursors, which would let anyone flood the cache.
+    key = (scope, domain, limit)
+    version = leaderboard_cache.version
+    rendered = leaderboard_cache.get(key) if after is None else None
+    if rendered is None:
+        with get_db_conn() as conn:
+            cur = conn.cursor(cursor_factory=DictCursor)
+            leaders, team_stats, next_cursor = _compute_leaderboard(cur, scope, domain, limit, after)
+            rendered = (json.dumps(leaders), json.dumps(team_stats), json.dumps(next_cursor))
+        if after is None:
+            leaderboard_cache.set(key, rendered, version)
+    user_rank = None
+    if scope != 'team' and user:
+        found = rank_index.lookup(user['id'])
+        if found:
+            user_rank = {"rank": found['rank'], "username": user['username'], "total_score": found['total_score']}
+    leaders_json, team_stats_json, next_cursor_json = rendered
+    body = (f'{{"leaders": {leaders_json}, "team_stats": {team_stats_json}, '
+            f'"next_cursor": {next_cursor_json}, "user_rank": {json.dumps(user_rank)}}}')
+    return current_app.response_class(body, mimetype='application/json')
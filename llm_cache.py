@@ -0,0 +1,102 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from utils import get_db_conn
+from metrics import LLM_CACHE_REQUESTS
+
+# Content-addressed cache of raw LLM completions, keyed by sha256 of the model and the exact
+# request messages. A crashed or re-run refresh gets the same headlines' slides and quizzes
+# back without paying for them again.
+#
+# LLM_CACHE_MODE:
+#   readwrite  look up, call the API on a miss and store the completion (default)
+#   replay     never call the API; a miss returns None. Together with FEED_REPLAY_DIR
+#              (recorded feeds, see content.py) tests and benchmarks can run a full
+#              refresh offline against a recorded cache
+#   off        bypass the cache entirely
+LLM_CACHE_MODE = os.getenv('LLM_CACHE_MODE', 'readwrite')
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '5000'))
+LLM_CACHE_MAX_AGE_DAYS = int(os.getenv('LLM_CACHE_MAX_AGE_DAYS', '30'))
+
+_stats = {"hits": 0, "misses": 0, "stores": 0, "replay_misses": 0, "evicted": 0}
+_stats_lock = threading.Lock()
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+    if name != 'evicted':
+        LLM_CACHE_REQUESTS.labels(name).inc(amount)
+
+def cache_key(model, messages):
+    raw = json.dumps([model, messages], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def lookup(key):
+    if LLM_CACHE_MODE == 'off':
+        return None
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE llm_cache SET last_used_at = CURRENT_TIMESTAMP, hits = hits + 1
+            WHERE key = %s RETURNING completion
+        """, (key,))
+        row = cur.fetchone()
+        conn.commit()
+    if row:
+        _count('hits')
+        return row[0]
+    _count('replay_misses' if LLM_CACHE_MODE == 'replay' else 'misses')
+    return None
+
+def store(key, model, messages, completion):
+    if LLM_CACHE_MODE != 'readwrite':
+        return
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO llm_cache (key, model, request, completion) VALUES (%s, %s, %s, %s)
+            ON CONFLICT (key) DO UPDATE SET completion = EXCLUDED.completion, created_at = CURRENT_TIMESTAMP,
+                                            last_used_at = CURRENT_TIMESTAMP
+        """, (key, model, json.dumps(messages), completion))
+        conn.commit()
+    _count('stores')
+
+def forget(key):
+    # drop a completion the caller could not use, so the next run asks again
+    if LLM_CACHE_MODE != 'readwrite':
+        return
+    try:
+        with get_db_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM llm_cache WHERE key = %s", (key,))
+            conn.commit()
+    except Exception as e:
+        logging.warning(f"Failed to drop LLM cache entry {key}: {e}")
+
+def evict(max_entries=LLM_CACHE_MAX_ENTRIES, max_age_days=LLM_CACHE_MAX_AGE_DAYS):
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM llm_cache WHERE last_used_at < NOW() - make_interval(days => %s)", (max_age_days,))
+        expired = cur.rowcount
+        cur.execute("""
+            DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM llm_cache ORDER BY last_used_at DESC OFFSET %s
+            )
+        """, (max_entries,))
+        overflow = cur.rowcount
+        conn.commit()
+    if expired or overflow:
+        _count('evicted', expired + overflow)
+        logging.info(f"Evicted {expired} expired and {overflow} least recently used LLM cache entries")
+    return expired + overflow
+
+def stats():
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*), COALESCE(SUM(octet_length(completion) + octet_length(request)), 0) FROM llm_cache")
+        entries, size_bytes = cur.fetchone()
+    with _stats_lock:
+        return dict(_stats, mode=LLM_CACHE_MODE, entries=entries, size_bytes=size_bytes,
+                    max_entries=LLM_CACHE_MAX_ENTRIES, max_age_days=LLM_CACHE_MAX_AGE_DAYS)
@@ -0,0 +1,76 @@
+import sys
+import logging
+import argparse
+from migrations import MIGRATIONS, LATEST_VERSION, applied_migrations, migrate
+
+def cmd_migrate(args):
+    applied = migrate(target=args.target)
+    print(f"Applied migrations: {', '.join(map(str, applied))}" if applied else "Nothing to migrate")
+
+def cmd_showmigrations(args):
+    applied = applied_migrations()
+    for version, name, _ in MIGRATIONS:
+        mark = 'x' if version in applied else ' '
+        when = f" ({applied[version].isoformat()})" if version in applied else ''
+        print(f"[{mark}] {version:>4} {name}{when}")
+    print(f"Latest version: {LATEST_VERSION}")
+
+def cmd_rebuild_rollups(args):
+    from leaderboard import rebuild_daily_rollups
+    print(f"Rebuilt {rebuild_daily_rollups()} daily rollup rows")
+
+def cmd_llm_cache(args):
+    import llm_cache
+    if args.evict:
+        print(f"Evicted {llm_cache.evict()} entries")
+    for name, value in llm_cache.stats().items():
+        print(f"{name}: {value}")
+
+def cmd_worker(args):
+    from worker import run_worker, JOB_WORKER_CONCURRENCY
+    run_worker(concurrency=args.concurrency or JOB_WORKER_CONCURRENCY)
+
+def cmd_refresh(args):
+    # runs in this process; FEED_REPLAY_DIR and LLM_CACHE_MODE=replay make it fully offline
+    from content import refresh_database
+    ran = refresh_database(force=not args.if_stale)
+    print("Refresh finished" if ran else "Refresh skipped (already running or still fresh)")
+
+def cmd_jobs(args):
+    import jobs
+    if args.enqueue:
+        job_id = jobs.enqueue(args.enqueue)
+        print(f"Enqueued {args.enqueue} job {job_id}")
+    stats = jobs.queue_stats()
+    print(f"due: {stats['due']}  running: {stats['running']}  failed (24h): {stats['failed_24h']}")
+    for kind, counts in stats['by_kind'].items():
+        print(f"  {kind}: " + '  '.join(f"{name}={value}" for name, value in counts.items()))
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="CyberAware maintenance commands")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('migrate', help="apply pending schema migrations")
+    p.add_argument('--target', type=int, default=None, help="migrate up to this version")
+    p.set_defaults(func=cmd_migrate)
+    p = sub.add_parser('showmigrations', help="list migrations and whether they are applied")
+    p.set_defaults(func=cmd_showmigrations)
+    p = sub.add_parser('rebuild-rollups', help="regenerate user_daily_scores from scores")
+    p.set_defaults(func=cmd_rebuild_rollups)
+    p = sub.add_parser('llm-cache', help="show LLM response cache stats")
+    p.add_argument('--evict', action='store_true', help="apply age and size eviction first")
+    p.set_defaults(func=cmd_llm_cache)
+    p = sub.add_parser('worker', help="run the background job worker")
+    p.add_argument('--concurrency', type=int, default=None, help="consumer threads (default JOB_WORKER_CONCURRENCY)")
+    p.set_defaults(func=cmd_worker)
+    p = sub.add_parser('refresh', help="refresh content now, without the job queue")
+    p.add_argument('--if-stale', action='store_true', help="skip if the last refresh is still fresh")
+    p.set_defaults(func=cmd_refresh)
+    p = sub.add_parser('jobs', help="show job queue depth")
+    p.add_argument('--enqueue', metavar='KIND', help="queue a job first, e.g. refresh")
+    p.set_defaults(func=cmd_jobs)
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import os
+import time
+import logging
+from flask import Response, g, has_request_context, request
+import psycopg2.extensions
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY,
+                               generate_latest, multiprocess)
+
+# Prometheus instrumentation. Under gunicorn each worker writes its samples to
+# PROMETHEUS_MULTIPROC_DIR and /metrics merges them (see gunicorn.conf.py); without it the
+# default in-process registry is served, which is fine for a single dev server.
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+_FAST_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+_SLOW_BUCKETS = (.25, .5, 1, 2.5, 5, 10, 20, 30, 60, 90, 120, 180)
+
+REQUEST_LATENCY = Histogram('cyberaware_http_request_duration_seconds', 'HTTP request latency',
+                            ['blueprint', 'endpoint', 'method'], buckets=_FAST_BUCKETS)
+REQUESTS = Counter('cyberaware_http_requests_total', 'HTTP responses by status code',
+                   ['blueprint', 'endpoint', 'method', 'status'])
+DB_QUERY_LATENCY = Histogram('cyberaware_db_query_duration_seconds', 'Latency of individual SQL statements',
+                             ['endpoint'], buckets=_FAST_BUCKETS)
+DB_QUERIES_PER_REQUEST = Histogram('cyberaware_db_queries_per_request', 'SQL statements issued per request',
+                                   ['endpoint'], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55))
+DB_TIME_PER_REQUEST = Histogram('cyberaware_db_time_per_request_seconds', 'Total SQL time per request',
+                                ['endpoint'], buckets=_FAST_BUCKETS)
+POOL_CHECKOUT_LATENCY = Histogram('cyberaware_db_pool_checkout_seconds', 'Time to check out a pooled connection',
+                                  buckets=_FAST_BUCKETS)
+POOL_TIMEOUTS = Counter('cyberaware_db_pool_timeouts_total', 'Connection checkouts that timed out')
+XAI_LATENCY = Histogram('cyberaware_xai_request_duration_seconds', 'xAI API call latency',
+                        ['operation'], buckets=_SLOW_BUCKETS)
+XAI_ERRORS = Counter('cyberaware_xai_errors_total', 'Failed xAI API calls', ['operation', 'kind'])
+LLM_CACHE_REQUESTS = Counter('cyberaware_llm_cache_requests_total', 'LLM cache lookups and stores', ['result'])
+FEED_FETCH_LATENCY = Histogram('cyberaware_feed_fetch_duration_seconds', 'RSS fetch duration per feed',
+                               ['feed', 'outcome'], buckets=_SLOW_BUCKETS)
+
+def _endpoint_label():
+    if has_request_context():
+        return request.endpoint or 'unmatched'
+    return 'background'
+
+def observe_query(seconds):
+    endpoint = _endpoint_label()
+    DB_QUERY_LATENCY.labels(endpoint).observe(seconds)
+    if has_request_context():
+        g._db_queries = g.get('_db_queries', 0) + 1
+        g._db_time = g.get('_db_time', 0.0) + seconds
+
+class _TimedCursorMixin:
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            observe_query(time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            observe_query(time.perf_counter() - start)
+
+    def callproc(self, procname, parameters=None):
+        start = time.perf_counter()
+        try:
+            return super().callproc(procname, parameters)
+        finally:
+            observe_query(time.perf_counter() - start)
+
+_timed_cursor_classes = {}
+
+def _timed_cursor_class(base):
+    cls = _timed_cursor_classes.get(base)
+    if cls is None:
+        cls = _timed_cursor_classes[base] = type(f"Timed{base.__name__}", (_TimedCursorMixin, base), {})
+    return cls
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    # pass as connection_factory; wraps whatever cursor_factory the caller asked for
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = _timed_cursor_class(base)
+        return super().cursor(*args, **kwargs)
+
+class timed_xai_call:
+    # with timed_xai_call('slides'): ... records latency, and the exception type on failure
+    def __init__(self, operation):
+        self.operation = operation
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        XAI_LATENCY.labels(self.operation).observe(time.perf_counter() - self._start)
+        if exc_type is not None:
+            self.error(exc_type.__name__)
+        return False
+
+    def error(self, kind):
+        XAI_ERRORS.labels(self.operation, kind).inc()
+
+def _before_request():
+    g._request_start = time.perf_counter()
+
+def _after_request(response):
+    start = g.get('_request_start')
+    if start is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    if endpoint == 'metrics':
+        return response
+    blueprint = request.blueprint or 'app'
+    REQUEST_LATENCY.labels(blueprint, endpoint, request.method).observe(time.perf_counter() - start)
+    REQUESTS.labels(blueprint, endpoint, request.method, str(response.status_code)).inc()
+    DB_QUERIES_PER_REQUEST.labels(endpoint).observe(g.get('_db_queries', 0))
+    DB_TIME_PER_REQUEST.labels(endpoint).observe(g.get('_db_time', 0.0))
+    return response
+
+def _metrics():
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+def init_metrics(app):
+    # imported here: utils instruments its connections with this module
+    from utils import ops_only
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    # same exposure as the other operational endpoints, so the scraper sends the ops token
+    app.add_url_rule('/metrics', 'metrics', ops_only(_metrics))
+    logging.info(f"Metrics enabled ({'multiprocess' if PROMETHEUS_MULTIPROC_DIR else 'single process'})")
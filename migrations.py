@@ -0,0 +1,422 @@
+import logging
+import psycopg2
+import psycopg2.extras
+from utils import get_db_conn
+
+# pg_advisory_lock key so only one process applies migrations at a time
+MIGRATION_LOCK_ID = 4201005
+
+def _baseline(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS headlines
+                   (id SERIAL PRIMARY KEY, title TEXT, description TEXT, link TEXT, timestamp TIMESTAMP WITH TIME ZONE, source TEXT, published_date TIMESTAMP WITH TIME ZONE, hash TEXT)''')
+    cur.execute('''CREATE TABLE IF NOT EXISTS slides
+                   (id SERIAL PRIMARY KEY, title TEXT, content TEXT, headline_id INTEGER REFERENCES headlines(id), created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP)''')
+    cur.execute('''CREATE TABLE IF NOT EXISTS quiz
+                   (id SERIAL PRIMARY KEY, question TEXT, options TEXT, correct INTEGER, explanation TEXT, created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP, slide_id INTEGER REFERENCES slides(id))''')
+    cur.execute('''CREATE TABLE IF NOT EXISTS users
+                   (id SERIAL PRIMARY KEY, social_id TEXT NOT NULL, provider TEXT NOT NULL,
+                    username TEXT UNIQUE NOT NULL, bio TEXT, domain TEXT, join_team BOOLEAN DEFAULT FALSE, join_public BOOLEAN DEFAULT FALSE,
+                    CONSTRAINT unique_social UNIQUE (social_id, provider))''')
+    cur.execute('''CREATE TABLE IF NOT EXISTS scores
+                   (id SERIAL PRIMARY KEY, user_id INTEGER, quiz_id INTEGER, score INTEGER,
+                    completed_at TIMESTAMP WITH TIME ZONE, FOREIGN KEY (user_id) REFERENCES users(id),
+                    FOREIGN KEY (quiz_id) REFERENCES quiz(id))''')
+    cur.execute('''CREATE TABLE IF NOT EXISTS user_totals
+                   (id SERIAL PRIMARY KEY, user_id INTEGER UNIQUE, total_score INTEGER DEFAULT 0, perfect_quizzes INTEGER DEFAULT 0,
+                    last_quiz TIMESTAMP WITH TIME ZONE, quizzes_taken INTEGER DEFAULT 0, FOREIGN KEY (user_id) REFERENCES users(id))''')
+    cur.execute('''CREATE TABLE IF NOT EXISTS quiz_counts
+                   (id SERIAL PRIMARY KEY, count INTEGER DEFAULT 0)''')
+    cur.execute("INSERT INTO quiz_counts (id, count) VALUES (1, 0) ON CONFLICT (id) DO NOTHING")
+    # columns added to databases created before they were part of the CREATE TABLEs above
+    cur.execute("ALTER TABLE quiz ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP")
+    cur.execute("ALTER TABLE slides ADD COLUMN IF NOT EXISTS headline_id INTEGER REFERENCES headlines(id)")
+    cur.execute("ALTER TABLE quiz ADD COLUMN IF NOT EXISTS slide_id INTEGER REFERENCES slides(id)")
+    cur.execute("ALTER TABLE slides ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP")
+    cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS domain TEXT")
+    cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS join_team BOOLEAN DEFAULT FALSE")
+    cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS join_public BOOLEAN DEFAULT FALSE")
+    cur.execute("ALTER TABLE headlines ADD COLUMN IF NOT EXISTS published_date TIMESTAMP WITH TIME ZONE")
+    cur.execute("ALTER TABLE headlines ADD COLUMN IF NOT EXISTS hash TEXT")
+
+def _feed_state(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS feed_state
+                   (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP)''')
+
+def _unique_headline_hash(cur):
+    # collapse any duplicates left by earlier racing refreshes before enforcing uniqueness
+    cur.execute("""
+        WITH dupes AS (
+            SELECT id, MIN(id) OVER (PARTITION BY hash) AS keep_id
+            FROM headlines WHERE hash IS NOT NULL
+        )
+        UPDATE slides SET headline_id = dupes.keep_id
+        FROM dupes
+        WHERE slides.headline_id = dupes.id AND dupes.id <> dupes.keep_id
+    """)
+    cur.execute("DELETE FROM headlines h USING headlines k WHERE h.hash = k.hash AND h.id > k.id")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS headlines_hash_key ON headlines (hash)")
+
+def _hot_path_indexes(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_scores_user_completed ON scores (user_id, completed_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_scores_completed ON scores (completed_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_headlines_timestamp ON headlines (timestamp)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_slides_created ON slides (created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_quiz_created ON quiz (created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_domain_team ON users (domain, join_team)")
+
+def _user_daily_scores(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS user_daily_scores
+                   (user_id INTEGER NOT NULL REFERENCES users(id), day DATE NOT NULL,
+                    total_score INTEGER NOT NULL DEFAULT 0, quizzes_taken INTEGER NOT NULL DEFAULT 0,
+                    perfect_quizzes INTEGER NOT NULL DEFAULT 0, first_completed_at TIMESTAMP WITH TIME ZONE,
+                    PRIMARY KEY (user_id, day))''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_user_daily_scores_day ON user_daily_scores (day)")
+    cur.execute("""
+        INSERT INTO user_daily_scores (user_id, day, total_score, quizzes_taken, perfect_quizzes, first_completed_at)
+        SELECT user_id, (completed_at AT TIME ZONE 'UTC')::date, SUM(score), COUNT(*),
+               COUNT(CASE WHEN score = 69 OR score = 100 THEN 1 END), MIN(completed_at)
+        FROM scores
+        WHERE score > 0 AND completed_at IS NOT NULL
+        GROUP BY user_id, (completed_at AT TIME ZONE 'UTC')::date
+        ON CONFLICT (user_id, day) DO NOTHING
+    """)
+
+def _cache_versions(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS cache_versions
+                   (name TEXT PRIMARY KEY, version BIGINT NOT NULL DEFAULT 0)''')
+    cur.execute("INSERT INTO cache_versions (name, version) VALUES ('leaderboard', 1) ON CONFLICT (name) DO NOTHING")
+
+def _leaderboard_ranking_index(cur):
+    # matches the all-time keyset ORDER BY in leaderboard._compute_leaderboard
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_totals_ranking ON user_totals
+        ((-total_score), (-perfect_quizzes), (COALESCE(last_quiz, 'infinity'::timestamptz)), user_id)
+        WHERE total_score > 0
+    """)
+
+def _submit_quiz_function(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_scores_user_quiz ON scores (user_id, quiz_id)")
+    # start the incremental totals from exact values
+    cur.execute("""
+        UPDATE user_totals ut SET
+            total_score = COALESCE(agg.total_score, 0),
+            perfect_quizzes = COALESCE(agg.perfect_quizzes, 0),
+            quizzes_taken = COALESCE(agg.quizzes_taken, 0)
+        FROM (
+            SELECT user_id, SUM(score) as total_score, COUNT(DISTINCT quiz_id) as quizzes_taken,
+                   SUM(CASE WHEN score = 69 OR score = 100 THEN 1 ELSE 0 END) as perfect_quizzes
+            FROM scores GROUP BY user_id
+        ) agg
+        WHERE ut.user_id = agg.user_id
+    """)
+    # 'cyberaware_invalidate' and the payload formats must match events.py
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION submit_quiz_score(p_user_id INTEGER, p_quiz_id INTEGER, p_score INTEGER, p_now TIMESTAMP WITH TIME ZONE)
+        RETURNS TABLE (saved BOOLEAN, total_score INTEGER, perfect_quizzes INTEGER, last_quiz TIMESTAMP WITH TIME ZONE,
+                       join_public BOOLEAN, leaderboard_version BIGINT)
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            v_latest TIMESTAMP WITH TIME ZONE;
+            v_perfect INTEGER := CASE WHEN p_score IN (69, 100) THEN 1 ELSE 0 END;
+            v_new_quiz INTEGER;
+            v_version BIGINT;
+        BEGIN
+            -- serialize concurrent submissions from the same user so the eligibility check holds
+            PERFORM pg_advisory_xact_lock(hashtext('submit_quiz_score'), p_user_id);
+            SELECT COALESCE(MAX(h.timestamp), p_now) INTO v_latest FROM headlines h;
+            IF EXISTS (SELECT 1 FROM scores s WHERE s.user_id = p_user_id AND s.completed_at >= v_latest) THEN
+                RETURN QUERY SELECT FALSE, NULL::INTEGER, NULL::INTEGER, NULL::TIMESTAMP WITH TIME ZONE, NULL::BOOLEAN, NULL::BIGINT;
+                RETURN;
+            END IF;
+            v_new_quiz := CASE WHEN EXISTS (SELECT 1 FROM scores s WHERE s.user_id = p_user_id AND s.quiz_id = p_quiz_id) THEN 0 ELSE 1 END;
+            INSERT INTO scores (user_id, quiz_id, score, completed_at) VALUES (p_user_id, p_quiz_id, p_score, p_now);
+            INSERT INTO user_totals AS ut (user_id, total_score, perfect_quizzes, last_quiz, quizzes_taken)
+            VALUES (p_user_id, p_score, v_perfect, p_now, v_new_quiz)
+            ON CONFLICT (user_id) DO UPDATE SET
+                total_score = COALESCE(ut.total_score, 0) + EXCLUDED.total_score,
+                perfect_quizzes = COALESCE(ut.perfect_quizzes, 0) + EXCLUDED.perfect_quizzes,
+                last_quiz = EXCLUDED.last_quiz,
+                quizzes_taken = COALESCE(ut.quizzes_taken, 0) + EXCLUDED.quizzes_taken;
+            IF p_score > 0 THEN
+                INSERT INTO user_daily_scores AS d (user_id, day, total_score, quizzes_taken, perfect_quizzes, first_completed_at)
+                VALUES (p_user_id, (p_now AT TIME ZONE 'UTC')::date, p_score, 1, v_perfect, p_now)
+                ON CONFLICT (user_id, day) DO UPDATE SET
+                    total_score = d.total_score + EXCLUDED.total_score,
+                    quizzes_taken = d.quizzes_taken + 1,
+                    perfect_quizzes = d.perfect_quizzes + EXCLUDED.perfect_quizzes,
+                    first_completed_at = LEAST(d.first_completed_at, EXCLUDED.first_completed_at);
+            END IF;
+            INSERT INTO cache_versions AS cv (name, version) VALUES ('leaderboard', 1)
+            ON CONFLICT (name) DO UPDATE SET version = cv.version + 1
+            RETURNING cv.version INTO v_version;
+            PERFORM pg_notify('cyberaware_invalidate', 'leaderboard:' || v_version);
+            PERFORM pg_notify('cyberaware_invalidate', 'rank:' || p_user_id);
+            RETURN QUERY
+                SELECT TRUE, ut.total_score, ut.perfect_quizzes, ut.last_quiz, u.join_public, v_version
+                FROM user_totals ut JOIN users u ON u.id = ut.user_id
+                WHERE ut.user_id = p_user_id;
+        END;
+        $$
+    """)
+
+def _content_generation(cur):
+    cur.execute("INSERT INTO cache_versions (name, version) VALUES ('content', 1) ON CONFLICT (name) DO NOTHING")
+
+def _counter_shards(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS counter_shards
+                   (name TEXT NOT NULL, shard SMALLINT NOT NULL, count BIGINT NOT NULL DEFAULT 0,
+                    PRIMARY KEY (name, shard))''')
+    # carry the old single-row total over into shard 0; quiz_counts is no longer written
+    cur.execute("""
+        INSERT INTO counter_shards (name, shard, count)
+        SELECT 'quizzes_completed', 0, COALESCE(SUM(count), 0) FROM quiz_counts
+        ON CONFLICT (name, shard) DO NOTHING
+    """)
+
+def _username_seq(cur):
+    cur.execute("CREATE SEQUENCE IF NOT EXISTS username_seq")
+    # start after the highest cyb3r_<n> handed out by the old MAX() allocator
+    cur.execute("""
+        SELECT setval('username_seq', COALESCE(MAX(CAST(SUBSTR(username, 7) AS BIGINT)), 0) + 1, false)
+        FROM users WHERE username ~ '^cyb3r_[0-9]+$'
+    """)
+
+def _phish_pool(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS phish_pool
+                   (id SERIAL PRIMARY KEY, scenario TEXT NOT NULL, html TEXT NOT NULL,
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP)''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_phish_pool_scenario ON phish_pool (scenario, created_at)")
+
+def _llm_cache(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS llm_cache
+                   (key TEXT PRIMARY KEY, model TEXT NOT NULL, request TEXT NOT NULL, completion TEXT NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                    last_used_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP)''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used_at)")
+
+def _refresh_runs(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS refresh_runs
+                   (id SERIAL PRIMARY KEY, status TEXT NOT NULL,
+                    started_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP WITH TIME ZONE, new_headlines INTEGER DEFAULT 0)''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_refresh_runs_status ON refresh_runs (status, finished_at)")
+
+def _jobs(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS jobs
+                   (id BIGSERIAL PRIMARY KEY, kind TEXT NOT NULL, payload JSONB NOT NULL DEFAULT '{}',
+                    dedupe_key TEXT UNIQUE, status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL DEFAULT 3,
+                    run_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                    locked_by TEXT, locked_at TIMESTAMP WITH TIME ZONE, last_error TEXT,
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP WITH TIME ZONE)''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (run_at, id) WHERE status = 'queued'")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, finished_at)")
+
+def _headline_simhash(cur):
+    from simhash import SIMHASH_WINDOW_DAYS, simhash, to_db
+    cur.execute("ALTER TABLE headlines ADD COLUMN IF NOT EXISTS simhash BIGINT")
+    cur.execute("ALTER TABLE headlines ADD COLUMN IF NOT EXISTS cluster_id INTEGER")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_headlines_cluster ON headlines (cluster_id)")
+    # hash the recent window (each row its own cluster) so the first refresh can cluster
+    # against it; older rows stay NULL
+    cur.execute("SELECT id, title, description FROM headlines WHERE timestamp > NOW() - make_interval(days => %s)",
+                (SIMHASH_WINDOW_DAYS,))
+    rows = [(headline_id, to_db(simhash(title, description))) for headline_id, title, description in cur.fetchall()]
+    if rows:
+        psycopg2.extras.execute_values(cur, """
+            UPDATE headlines SET simhash = v.simhash, cluster_id = headlines.id
+            FROM (VALUES %s) AS v (id, simhash) WHERE headlines.id = v.id
+        """, rows)
+
+def _quiz_window_by_quiz(cur):
+    # The one-score-per-refresh window opens when the refresh stores its quiz, not when its
+    # headlines land: those are committed minutes earlier, while the old quiz is still served.
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION submit_quiz_score(p_user_id INTEGER, p_quiz_id INTEGER, p_score INTEGER, p_now TIMESTAMP WITH TIME ZONE)
+        RETURNS TABLE (saved BOOLEAN, total_score INTEGER, perfect_quizzes INTEGER, last_quiz TIMESTAMP WITH TIME ZONE,
+                       join_public BOOLEAN, leaderboard_version BIGINT)
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            v_latest TIMESTAMP WITH TIME ZONE;
+            v_perfect INTEGER := CASE WHEN p_score IN (69, 100) THEN 1 ELSE 0 END;
+            v_new_quiz INTEGER;
+            v_version BIGINT;
+        BEGIN
+            -- serialize concurrent submissions from the same user so the eligibility check holds
+            PERFORM pg_advisory_xact_lock(hashtext('submit_quiz_score'), p_user_id);
+            SELECT COALESCE(MAX(q.created_at), p_now) INTO v_latest FROM quiz q;
+            IF EXISTS (SELECT 1 FROM scores s WHERE s.user_id = p_user_id AND s.completed_at >= v_latest) THEN
+                RETURN QUERY SELECT FALSE, NULL::INTEGER, NULL::INTEGER, NULL::TIMESTAMP WITH TIME ZONE, NULL::BOOLEAN, NULL::BIGINT;
+                RETURN;
+            END IF;
+            v_new_quiz := CASE WHEN EXISTS (SELECT 1 FROM scores s WHERE s.user_id = p_user_id AND s.quiz_id = p_quiz_id) THEN 0 ELSE 1 END;
+            INSERT INTO scores (user_id, quiz_id, score, completed_at) VALUES (p_user_id, p_quiz_id, p_score, p_now);
+            INSERT INTO user_totals AS ut (user_id, total_score, perfect_quizzes, last_quiz, quizzes_taken)
+            VALUES (p_user_id, p_score, v_perfect, p_now, v_new_quiz)
+            ON CONFLICT (user_id) DO UPDATE SET
+                total_score = COALESCE(ut.total_score, 0) + EXCLUDED.total_score,
+                perfect_quizzes = COALESCE(ut.perfect_quizzes, 0) + EXCLUDED.perfect_quizzes,
+                last_quiz = EXCLUDED.last_quiz,
+                quizzes_taken = COALESCE(ut.quizzes_taken, 0) + EXCLUDED.quizzes_taken;
+            IF p_score > 0 THEN
+                INSERT INTO user_daily_scores AS d (user_id, day, total_score, quizzes_taken, perfect_quizzes, first_completed_at)
+                VALUES (p_user_id, (p_now AT TIME ZONE 'UTC')::date, p_score, 1, v_perfect, p_now)
+                ON CONFLICT (user_id, day) DO UPDATE SET
+                    total_score = d.total_score + EXCLUDED.total_score,
+                    quizzes_taken = d.quizzes_taken + 1,
+                    perfect_quizzes = d.perfect_quizzes + EXCLUDED.perfect_quizzes,
+                    first_completed_at = LEAST(d.first_completed_at, EXCLUDED.first_completed_at);
+            END IF;
+            INSERT INTO cache_versions AS cv (name, version) VALUES ('leaderboard', 1)
+            ON CONFLICT (name) DO UPDATE SET version = cv.version + 1
+            RETURNING cv.version INTO v_version;
+            PERFORM pg_notify('cyberaware_invalidate', 'leaderboard:' || v_version);
+            PERFORM pg_notify('cyberaware_invalidate', 'rank:' || p_user_id);
+            RETURN QUERY
+                SELECT TRUE, ut.total_score, ut.perfect_quizzes, ut.last_quiz, u.join_public, v_version
+                FROM user_totals ut JOIN users u ON u.id = ut.user_id
+                WHERE ut.user_id = p_user_id;
+        END;
+        $$
+    """)
+
+def _quiz_score_current_quiz(cur):
+    # A score only counts for a quiz of the current window: one queued offline (or submitted
+    # from a stale page) for a replaced quiz would otherwise take the slot for the new one.
+    # The result gains a column, so the function is dropped and recreated.
+    cur.execute("DROP FUNCTION IF EXISTS submit_quiz_score(INTEGER, INTEGER, INTEGER, TIMESTAMP WITH TIME ZONE)")
+    cur.execute("""
+        CREATE FUNCTION submit_quiz_score(p_user_id INTEGER, p_quiz_id INTEGER, p_score INTEGER, p_now TIMESTAMP WITH TIME ZONE)
+        RETURNS TABLE (saved BOOLEAN, stale BOOLEAN, total_score INTEGER, perfect_quizzes INTEGER,
+                       last_quiz TIMESTAMP WITH TIME ZONE, join_public BOOLEAN, leaderboard_version BIGINT)
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            v_latest TIMESTAMP WITH TIME ZONE;
+            v_perfect INTEGER := CASE WHEN p_score IN (69, 100) THEN 1 ELSE 0 END;
+            v_new_quiz INTEGER;
+            v_version BIGINT;
+        BEGIN
+            -- serialize concurrent submissions from the same user so the eligibility check holds
+            PERFORM pg_advisory_xact_lock(hashtext('submit_quiz_score'), p_user_id);
+            SELECT COALESCE(MAX(q.created_at), p_now) INTO v_latest FROM quiz q;
+            IF NOT EXISTS (SELECT 1 FROM quiz q WHERE q.id = p_quiz_id AND q.created_at >= v_latest) THEN
+                RETURN QUERY SELECT FALSE, TRUE, NULL::INTEGER, NULL::INTEGER, NULL::TIMESTAMP WITH TIME ZONE, NULL::BOOLEAN, NULL::BIGINT;
+                RETURN;
+            END IF;
+            IF EXISTS (SELECT 1 FROM scores s WHERE s.user_id = p_user_id AND s.completed_at >= v_latest) THEN
+                RETURN QUERY SELECT FALSE, FALSE, NULL::INTEGER, NULL::INTEGER, NULL::TIMESTAMP WITH TIME ZONE, NULL::BOOLEAN, NULL::BIGINT;
+                RETURN;
+            END IF;
+            v_new_quiz := CASE WHEN EXISTS (SELECT 1 FROM scores s WHERE s.user_id = p_user_id AND s.quiz_id = p_quiz_id) THEN 0 ELSE 1 END;
+            INSERT INTO scores (user_id, quiz_id, score, completed_at) VALUES (p_user_id, p_quiz_id, p_score, p_now);
+            INSERT INTO user_totals AS ut (user_id, total_score, perfect_quizzes, last_quiz, quizzes_taken)
+            VALUES (p_user_id, p_score, v_perfect, p_now, v_new_quiz)
+            ON CONFLICT (user_id) DO UPDATE SET
+                total_score = COALESCE(ut.total_score, 0) + EXCLUDED.total_score,
+                perfect_quizzes = COALESCE(ut.perfect_quizzes, 0) + EXCLUDED.perfect_quizzes,
+                last_quiz = EXCLUDED.last_quiz,
+                quizzes_taken = COALESCE(ut.quizzes_taken, 0) + EXCLUDED.quizzes_taken;
+            IF p_score > 0 THEN
+                INSERT INTO user_daily_scores AS d (user_id, day, total_score, quizzes_taken, perfect_quizzes, first_completed_at)
+                VALUES (p_user_id, (p_now AT TIME ZONE 'UTC')::date, p_score, 1, v_perfect, p_now)
+                ON CONFLICT (user_id, day) DO UPDATE SET
+                    total_score = d.total_score + EXCLUDED.total_score,
+                    quizzes_taken = d.quizzes_taken + 1,
+                    perfect_quizzes = d.perfect_quizzes + EXCLUDED.perfect_quizzes,
+                    first_completed_at = LEAST(d.first_completed_at, EXCLUDED.first_completed_at);
+            END IF;
+            INSERT INTO cache_versions AS cv (name, version) VALUES ('leaderboard', 1)
+            ON CONFLICT (name) DO UPDATE SET version = cv.version + 1
+            RETURNING cv.version INTO v_version;
+            PERFORM pg_notify('cyberaware_invalidate', 'leaderboard:' || v_version);
+            PERFORM pg_notify('cyberaware_invalidate', 'rank:' || p_user_id);
+            RETURN QUERY
+                SELECT TRUE, FALSE, ut.total_score, ut.perfect_quizzes, ut.last_quiz, u.join_public, v_version
+                FROM user_totals ut JOIN users u ON u.id = ut.user_id
+                WHERE ut.user_id = p_user_id;
+        END;
+        $$
+    """)
+
+def _rehash_headline_simhash(cur):
+    from simhash import simhash, to_db
+    # hashes from the old token weighting are not comparable with new ones; clusters stay
+    cur.execute("SELECT id, title, description FROM headlines WHERE simhash IS NOT NULL")
+    rows = [(headline_id, to_db(simhash(title, description))) for headline_id, title, description in cur.fetchall()]
+    if rows:
+        psycopg2.extras.execute_values(cur, """
+            UPDATE headlines SET simhash = v.simhash FROM (VALUES %s) AS v (id, simhash) WHERE headlines.id = v.id
+        """, rows)
+
+# Append only: never renumber or edit a migration once it has shipped.
+MIGRATIONS = [
+    (1, "baseline schema", _baseline),
+    (2, "feed_state conditional GET validators", _feed_state),
+    (3, "unique headlines.hash", _unique_headline_hash),
+    (4, "hot-path indexes", _hot_path_indexes),
+    (5, "user_daily_scores weekly rollup", _user_daily_scores),
+    (6, "cache_versions for cross-worker invalidation", _cache_versions),
+    (7, "all-time leaderboard keyset index", _leaderboard_ranking_index),
+    (8, "submit_quiz_score single round-trip submission", _submit_quiz_function),
+    (9, "content snapshot generation", _content_generation),
+    (10, "sharded counters", _counter_shards),
+    (11, "username_seq allocator", _username_seq),
+    (12, "pre-generated phishing simulation pool", _phish_pool),
+    (13, "content-addressed LLM response cache", _llm_cache),
+    (14, "refresh_runs for refresh claims and freshness", _refresh_runs),
+    (15, "jobs queue for the background worker", _jobs),
+    (16, "headline simhash and near-duplicate clusters", _headline_simhash),
+    (17, "quiz score window opens with the refresh's quiz", _quiz_window_by_quiz),
+    (18, "quiz scores only count for the current window's quiz", _quiz_score_current_quiz),
+    (19, "rehash headlines with entity-weighted simhash", _rehash_headline_simhash),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(cur):
+    try:
+        cur.execute("SELECT MAX(version) FROM schema_version")
+        return cur.fetchone()[0] or 0
+    except psycopg2.errors.UndefinedTable:
+        cur.connection.rollback()
+        return 0
+
+def applied_migrations():
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        if not get_schema_version(cur):
+            return {}
+        cur.execute("SELECT version, applied_at FROM schema_version")
+        return dict(cur.fetchall())
+
+def migrate(target=None):
+    target = LATEST_VERSION if target is None else target
+    applied = []
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            cur.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                           (version INTEGER PRIMARY KEY, name TEXT NOT NULL,
+                            applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP)''')
+            conn.commit()
+            # re-read under the lock: another worker may have migrated while we waited
+            current = get_schema_version(cur)
+            for version, name, step in MIGRATIONS:
+                if version <= current or version > target:
+                    continue
+                logging.info(f"Applying migration {version}: {name}")
+                try:
+                    step(cur)
+                    cur.execute("INSERT INTO schema_version (version, name) VALUES (%s, %s)", (version, name))
+                    conn.commit()
+                except psycopg2.Error as e:
+                    conn.rollback()
+                    logging.error(f"Migration {version} ({name}) failed: {e}")
+                    raise
+                applied.append(version)
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+    return applied
@@ -0,0 +1,160 @@
+import os
+import time
+import logging
+import threading
+import requests
+from authlib.integrations.flask_client import FlaskOAuth2App
+
+# OIDC discovery documents and JWKS, fetched once per worker and shared by every OAuth
+# client. A background thread pre-warms them at startup and refreshes each entry
+# OIDC_REFRESH_MARGIN seconds before it expires, so /login/<provider> and the callbacks
+# normally never wait on the IdP. An ID token signed with an unknown kid forces a JWKS
+# refetch (at most once per OIDC_MIN_REFETCH_SECONDS, so junk tokens can't hammer the IdP).
+#
+# Point the *_METADATA_URL variables at a local stub IdP to test the login flow offline
+# (authlib also needs AUTHLIB_INSECURE_TRANSPORT=1 for plain-http token endpoints).
+GOOGLE_METADATA_URL = os.getenv('OIDC_GOOGLE_METADATA_URL', 'https://accounts.google.com/.well-known/openid-configuration')
+MICROSOFT_METADATA_URL = os.getenv('OIDC_MICROSOFT_METADATA_URL',
+                                   'https://login.microsoftonline.com/common/v2.0/.well-known/openid-configuration')
+MICROSOFT_JWKS_URL = os.getenv('OIDC_MICROSOFT_JWKS_URL', 'https://login.microsoftonline.com/common/discovery/v2.0/keys')
+OIDC_CACHE_TTL = float(os.getenv('OIDC_CACHE_TTL', '3600'))
+OIDC_REFRESH_MARGIN = float(os.getenv('OIDC_REFRESH_MARGIN', '300'))
+OIDC_MIN_REFETCH_SECONDS = float(os.getenv('OIDC_MIN_REFETCH_SECONDS', '60'))
+OIDC_FETCH_TIMEOUT = float(os.getenv('OIDC_FETCH_TIMEOUT', '5'))
+OIDC_RETRY_SECONDS = 30
+
+class OIDCDocumentCache:
+    def __init__(self, ttl=OIDC_CACHE_TTL, refresh_margin=OIDC_REFRESH_MARGIN,
+                 min_refetch=OIDC_MIN_REFETCH_SECONDS, timeout=OIDC_FETCH_TIMEOUT):
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl / 2)
+        self.min_refetch = min_refetch
+        self.timeout = timeout
+        # url -> (document, fetched_at, expires_at)
+        self._entries = {}
+        # urls the refresher keeps warm: everything requested or registered via track()
+        self._tracked = set()
+        self._url_locks = {}
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self._refresher = None
+        self._refresher_pid = None
+        self.fetches = 0
+        self.errors = 0
+
+    def _url_lock(self, url):
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def _fetch(self, url):
+        try:
+            response = self._session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            document = response.json()
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        now = time.monotonic()
+        with self._lock:
+            self.fetches += 1
+            self._entries[url] = (document, now, now + self.ttl)
+            # keep the signing keys warm along with the discovery document that names them
+            if isinstance(document, dict) and document.get('jwks_uri'):
+                self._tracked.add(document['jwks_uri'])
+        return document
+
+    def get(self, url, force=False):
+        self.track(url)
+        entry = self._entries.get(url)
+        if entry and not force and time.monotonic() < entry[2]:
+            return entry[0]
+        with self._url_lock(url):
+            # single flight: another caller may have fetched while we waited
+            entry = self._entries.get(url)
+            now = time.monotonic()
+            if entry and now < entry[2] and (not force or now - entry[1] < self.min_refetch):
+                return entry[0]
+            try:
+                return self._fetch(url)
+            except Exception as e:
+                if entry:
+                    # an IdP hiccup shouldn't break logins while we still hold usable keys
+                    logging.warning(f"Refetching {url} failed, serving cached copy: {e}")
+                    return entry[0]
+                raise
+
+    def track(self, url):
+        with self._lock:
+            self._tracked.add(url)
+        self.ensure_refresher()
+
+    def _refresh_due(self):
+        # returns how long to sleep before the next pass
+        now = time.monotonic()
+        with self._lock:
+            due = [url for url in self._tracked
+                   if url not in self._entries or self._entries[url][2] - self.refresh_margin <= now]
+        for url in due:
+            try:
+                with self._url_lock(url):
+                    self._fetch(url)
+            except Exception as e:
+                logging.warning(f"Background refresh of OIDC document {url} failed: {e}")
+        with self._lock:
+            if not self._tracked or any(url not in self._entries for url in self._tracked):
+                return OIDC_RETRY_SECONDS
+            next_due = min(self._entries[url][2] for url in self._tracked) - self.refresh_margin
+        return max(1.0, next_due - time.monotonic())
+
+    def _refresh_forever(self):
+        while True:
+            try:
+                wait = self._refresh_due()
+            except Exception as e:
+                logging.error(f"OIDC refresher error: {e}")
+                wait = OIDC_RETRY_SECONDS
+            time.sleep(wait)
+
+    def ensure_refresher(self):
+        # per process: gunicorn workers don't inherit threads from the master
+        if self._refresher is not None and self._refresher.is_alive() and self._refresher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive() and self._refresher_pid == os.getpid():
+                return
+            self._refresher = threading.Thread(target=self._refresh_forever, name='oidc-refresh', daemon=True)
+            self._refresher_pid = os.getpid()
+            self._refresher.start()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {"fetches": self.fetches, "errors": self.errors,
+                    "expires_in": {url: round(self._entries[url][2] - now) if url in self._entries else None
+                                   for url in self._tracked}}
+
+oidc_cache = OIDCDocumentCache()
+
+class CachedOIDCApp(FlaskOAuth2App):
+    # authlib keeps metadata and JWKS on each client and fetches them inline on first use;
+    # route both through the shared cache instead
+    def load_server_metadata(self):
+        if self._server_metadata_url:
+            if not hasattr(self, '_registered_metadata'):
+                self._registered_metadata = dict(self.server_metadata)
+            self.server_metadata.update(oidc_cache.get(self._server_metadata_url))
+            # values passed to oauth.register (e.g. a stub jwks_uri) win over discovery
+            self.server_metadata.update(self._registered_metadata)
+        return self.server_metadata
+
+    def fetch_jwk_set(self, force=False):
+        uri = self.load_server_metadata().get('jwks_uri')
+        if not uri:
+            raise RuntimeError('Missing "jwks_uri" in metadata')
+        return oidc_cache.get(uri, force=force)
+
+def warm_oidc_cache(*urls):
+    for url in urls:
+        if url:
+            oidc_cache.track(url)
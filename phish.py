@@ -1,34 +1,144 @@
 import logging
-from flask import Blueprint, jsonify
-import requests
+import threading
+from flask import Blueprint, jsonify, request, session
 import os
+import psycopg2.extras
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils import get_db_conn
+from xai import xai_client
+import jobs
 
 phish_bp = Blueprint('phish', __name__)
 
-XAI_API_URL = os.getenv("XAI_API_URL", "https://api.x.ai/v1/chat/completions")
-XAI_API_KEY = os.getenv("XAI_API_KEY")
+# Simulations are generated ahead of time by top_up_phish_pool (a periodic job, see worker.py) and
+# served from phish_pool, so a click never waits on xAI. Each scenario is kept at
+# PHISH_POOL_DEPTH entries; entries older than PHISH_POOL_MAX_AGE_DAYS are retired so the
+# pool keeps changing. The session remembers what a visitor has already seen.
+PHISH_SCENARIOS = {
+    "bank": "a bank security alert",
+    "delivery": "a package delivery notice",
+    "password_reset": "a password reset request",
+    "prize": "a prize or giveaway notification",
+}
+PHISH_POOL_DEPTH = int(os.getenv("PHISH_POOL_DEPTH", "10"))
+PHISH_POOL_MAX_AGE_DAYS = int(os.getenv("PHISH_POOL_MAX_AGE_DAYS", "7"))
+PHISH_POOL_REFILL_MINUTES = int(os.getenv("PHISH_POOL_REFILL_MINUTES", "30"))
+PHISH_GENERATION_CONCURRENCY = int(os.getenv("PHISH_GENERATION_CONCURRENCY", "4"))
+PHISH_GENERATION_TIMEOUT = float(os.getenv("PHISH_GENERATION_TIMEOUT", "90"))
+PHISH_SEEN_MAX = 50
+PHISH_EMPTY_TOP_UP_SECONDS = 300
+# pg_advisory_xact_lock key serializing pool inserts across workers
+PHISH_POOL_LOCK_ID = 4201017
+UNAVAILABLE_HTML = "<p>Phishing simulation temporarily unavailable. Please try again later.</p>"
 
-@phish_bp.route('/api/phish/generate', methods=['GET'])
-def generate_phish():
-    if not XAI_API_KEY:
+_top_up_running = threading.Lock()
+
+def generate_phish_html(scenario):
+    if not xai_client.configured:
         logging.error("XAI_API_KEY is not set, cannot generate phishing simulation")
-        return jsonify({"error": "API key not configured"}), 500
+        return None
     prompt = (
         "Generate a realistic phishing simulation scenario as an HTML-formatted mock (email or SMS) "
         "aimed at stealing credentials or installing malware. Include 3-5 subtle red flags like urgency, "
-        "mismatched domains, typos, or suspicious links. Make it believable, e.g., spoofing a bank alert, "
-        "package delivery, password reset, or prize notification. Output only the raw HTML content for "
-        "direct rendering, with interactive elements (e.g., hoverable links/images) and no explanations."
+        f"mismatched domains, typos, or suspicious links. Make it believable by spoofing {PHISH_SCENARIOS[scenario]}. "
+        "Output only the raw HTML content for direct rendering, with interactive elements "
+        "(e.g., hoverable links/images) and no explanations."
     )
     try:
-        response = requests.post(
-            XAI_API_URL,
-            headers={"Authorization": f"Bearer {XAI_API_KEY}", "Content-Type": "application/json"},
-            json={"model": "grok-beta", "messages": [{"role": "user", "content": prompt}]}
-        )
-        response.raise_for_status()
-        generated_html = response.json()["choices"][0]["message"]["content"]
-        return jsonify({"html": generated_html})
+        return xai_client.chat([{"role": "user", "content": prompt}], "grok-beta", 'phish',
+                               deadline=PHISH_GENERATION_TIMEOUT)
+    except Exception as e:
+        logging.error(f"Error generating {scenario} phish: {e}")
+        return None
+
+def _pool_shortfall():
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM phish_pool WHERE created_at < NOW() - make_interval(days => %s)",
+                    (PHISH_POOL_MAX_AGE_DAYS,))
+        if cur.rowcount:
+            logging.info(f"Retired {cur.rowcount} expired phishing simulations")
+        cur.execute("SELECT scenario, COUNT(*) FROM phish_pool GROUP BY scenario")
+        counts = dict(cur.fetchall())
+        conn.commit()
+    return {scenario: PHISH_POOL_DEPTH - counts.get(scenario, 0)
+            for scenario in PHISH_SCENARIOS if counts.get(scenario, 0) < PHISH_POOL_DEPTH}
+
+def top_up_phish_pool():
+    if not _top_up_running.acquire(blocking=False):
+        return 0
+    try:
+        shortfall = _pool_shortfall()
+        pending = [scenario for scenario, missing in shortfall.items() for _ in range(missing)]
+        if not pending:
+            return 0
+        # no database connection is held while xAI generates
+        generated = []
+        with ThreadPoolExecutor(max_workers=max(1, min(PHISH_GENERATION_CONCURRENCY, len(pending)))) as executor:
+            futures = {executor.submit(generate_phish_html, scenario): scenario for scenario in pending}
+            for future in as_completed(futures):
+                html = future.result()
+                if html:
+                    generated.append((futures[future], html))
+        if not generated:
+            return 0
+        with get_db_conn() as conn:
+            cur = conn.cursor()
+            # another worker may have topped up meanwhile; only insert what is still missing
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (PHISH_POOL_LOCK_ID,))
+            cur.execute("SELECT scenario, COUNT(*) FROM phish_pool GROUP BY scenario")
+            room = {scenario: PHISH_POOL_DEPTH - count for scenario, count in cur.fetchall()}
+            rows = []
+            for scenario, html in generated:
+                if room.get(scenario, PHISH_POOL_DEPTH) > 0:
+                    room[scenario] = room.get(scenario, PHISH_POOL_DEPTH) - 1
+                    rows.append((scenario, html))
+            if rows:
+                psycopg2.extras.execute_values(cur, "INSERT INTO phish_pool (scenario, html) VALUES %s", rows)
+            conn.commit()
+        logging.info(f"Added {len(rows)} phishing simulations to the pool")
+        return len(rows)
+    finally:
+        _top_up_running.release()
+
+def _request_top_up():
+    # at most one out-of-band top-up job per PHISH_EMPTY_TOP_UP_SECONDS, however many visitors hit an empty pool
+    try:
+        jobs.enqueue('phish_top_up', dedupe_key=jobs.slot_key('phish_top_up:empty', PHISH_EMPTY_TOP_UP_SECONDS),
+                     max_attempts=1)
+    except Exception as e:
+        logging.error(f"Failed to enqueue phishing pool top-up: {e}")
+
+def _pick(cur, scenario, exclude):
+    cur.execute("""
+        SELECT id, scenario, html FROM phish_pool
+        WHERE (%(scenario)s::text IS NULL OR scenario = %(scenario)s) AND id <> ALL(%(exclude)s::int[])
+        ORDER BY random()
+        LIMIT 1
+    """, {"scenario": scenario, "exclude": exclude})
+    return cur.fetchone()
+
+@phish_bp.route('/api/phish/generate', methods=['GET'])
+def generate_phish():
+    scenario = request.args.get('scenario') or None
+    if scenario is not None and scenario not in PHISH_SCENARIOS:
+        return jsonify({"error": f"Unknown scenario, expected one of: {', '.join(PHISH_SCENARIOS)}"}), 400
+    seen = session.get('phish_seen', [])
+    try:
+        with get_db_conn() as conn:
+            cur = conn.cursor()
+            row = _pick(cur, scenario, seen)
+            if row is None:
+                # seen everything on offer: start over rather than showing nothing
+                seen = []
+                row = _pick(cur, scenario, seen)
     except Exception as e:
-        logging.error(f"Error generating phish: {e}")
-        return jsonify({"html": "<p>Phishing simulation temporarily unavailable. Please try again later.</p>"}), 200
\ No newline at end of file
+        logging.error(f"Error serving phish: {e}")
+        return jsonify({"html": UNAVAILABLE_HTML}), 200
+    if row is None:
+        logging.warning(f"Phishing simulation pool empty for scenario {scenario or 'any'}")
+        _request_top_up()
+        return jsonify({"html": UNAVAILABLE_HTML}), 200
+    phish_id, phish_scenario, html = row
+    session['phish_seen'] = (seen + [phish_id])[-PHISH_SEEN_MAX:]
+    return jsonify({"html": html, "scenario": phish_scenario, "id": phish_id})
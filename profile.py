@@ -4,7 +4,11 @@ import bleach
 import re
 from datetime import timezone, timedelta
 from psycopg2.extras import DictCursor
-from utils import get_db_conn, load_quiz_count
+from utils import get_db_conn
+from counters import quiz_counter
+from leaderboard import bump_leaderboard_version
+import events
+from ranking import rank_index, notify_rank_change
 
 profile_bp = Blueprint('profile', __name__)
 
@@ -26,14 +30,10 @@ def profile_redirect():
 def profile(username):
     user = session.get('user')
     logging.debug(f"Profile request for username: {username}, session user: {user}")
+    quiz_count = quiz_counter.value()
     with get_db_conn() as conn:
         try:
             cur = conn.cursor(cursor_factory=DictCursor)
-            logging.debug("Executing quiz count query")
-            cur.execute("SELECT count FROM quiz_counts WHERE id = 1")
-            quiz_count_row = cur.fetchone()
-            quiz_count = quiz_count_row[0] if quiz_count_row else 0
-            logging.debug(f"Quiz count: {quiz_count}")
             logging.debug(f"Executing profile query for username: {username}")
             cur.execute("""
                 SELECT users.id, users.username, users.bio, users.domain, users.join_team, users.join_public,
@@ -68,15 +68,7 @@ def profile(username):
                 "avg_score": round(profile['avg_score'], 1)
             }
             logging.debug(f"Profile data: {profile_data}")
-            cur.execute("""
-                SELECT RANK() OVER (ORDER BY ut.total_score DESC, ut.perfect_quizzes DESC, ut.last_quiz ASC) as rank
-                FROM user_totals ut
-                JOIN users u ON ut.user_id = u.id
-                WHERE u.join_public = TRUE
-            """)
-            ranks = cur.fetchall()
-            rank_map = {r['rank']: r for r in ranks}
-            profile_data['rank'] = rank_map.get(profile['id'], {}).get('rank', 'Unranked') if ranks else 'Unranked'
+            profile_data['rank'] = rank_index.rank(profile['id']) or 'Unranked'
             response = make_response(render_template('index.html', quiz_count=quiz_count, user=user, profile_data=profile_data))
             response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
             return response
@@ -117,15 +109,7 @@ def get_profile(username):
             "quizzes_taken": profile['quizzes_taken'] or 0,
             "avg_score": round(profile['avg_score'], 1)
         }
-        cur.execute("""
-            SELECT COUNT(*) + 1 as rank FROM user_totals ut JOIN users u ON ut.user_id = u.id
-            WHERE u.join_public = TRUE AND (ut.total_score > %s OR
-            (ut.total_score = %s AND ut.perfect_quizzes > %s) OR
-            (ut.total_score = %s AND ut.perfect_quizzes = %s AND ut.last_quiz > %s))
-        """, (profile['total_score'], profile['total_score'], profile['perfect_quizzes'],
-              profile['total_score'], profile['perfect_quizzes'], profile['last_quiz']))
-        rank_row = cur.fetchone()
-        profile_data['rank'] = rank_row['rank'] if rank_row['rank'] != 1 or profile['total_score'] > 0 else 'Unranked'
+        profile_data['rank'] = rank_index.rank(profile['id']) or 'Unranked'
         return jsonify({"profile_data": profile_data})
 
 @profile_bp.route('/api/check_username', methods=['POST'])
@@ -166,7 +150,11 @@ def update_profile():
             updated = cur.fetchone()
             if cur.rowcount == 0:
                 return jsonify({"error": "User not found"}), 404
+            version = bump_leaderboard_version(cur)
+            notify_rank_change(cur, user['id'])
             conn.commit()
+            events.publish_local('leaderboard', version)
+            rank_index.refresh_user(user['id'], cur)
             session['user']['username'] = updated['username']
             return jsonify({"success": True, "username": updated['username']})
         except psycopg2.errors.UniqueViolation:
@@ -193,7 +181,9 @@ def update_team_status():
             if cur.rowcount == 0:
                 logging.error(f"User not found for id {user['id']} in /api/update_team_status")
                 return jsonify({"error": "User not found"}), 404
+            version = bump_leaderboard_version(cur)
             conn.commit()
+            events.publish_local('leaderboard', version)
             logging.info(f"Successfully updated join_team to {join_team} for user_id {user['id']}")
             session['user']['domain'] = updated['domain']
             return jsonify({"success": True, "join_team": join_team})
@@ -221,7 +211,11 @@ def update_public_status():
             if cur.rowcount == 0:
                 logging.error(f"User not found for id {user['id']} in /api/update_public_status")
                 return jsonify({"error": "User not found"}), 404
+            version = bump_leaderboard_version(cur)
+            notify_rank_change(cur, user['id'])
             conn.commit()
+            events.publish_local('leaderboard', version)
+            rank_index.refresh_user(user['id'], cur)
             logging.info(f"Successfully updated join_public to {join_public} for user_id {user['id']}")
             session['user']['join_public'] = join_public
             return jsonify({"success": True, "join_public": join_public})
@@ -1,8 +1,11 @@
 import logging
-import json
 from flask import Blueprint, jsonify, request, session
 from datetime import datetime, timezone
 from utils import get_db_conn
+import events
+from ranking import rank_index
+from snapshot import content_response
+from counters import quiz_counter
 from psycopg2.extras import DictCursor
 
 quiz_bp = Blueprint('quiz', __name__)
@@ -10,27 +13,32 @@ quiz_bp = Blueprint('quiz', __name__)
 @quiz_bp.route('/api/quiz', methods=['GET'])
 def get_quiz():
     try:
-        with get_db_conn() as conn:
-            cur = conn.cursor(cursor_factory=DictCursor)
-            cur.execute("""
-                SELECT id, question, options, correct, explanation
-                FROM quiz
-                ORDER BY created_at DESC
-                LIMIT 5
-            """)
-            quiz = [{"id": row['id'], "question": row['question'], "options": json.loads(row['options']), "correct": row['correct'], "explanation": row['explanation']} for row in cur.fetchall()]
-            logging.debug(f"Serving quiz: {quiz}")
-            return jsonify(quiz)
+        return content_response('quiz')
     except Exception as e:
         logging.error(f"Error in /api/quiz: {e}")
         return jsonify({"error": "Failed to load quiz questions"}), 500
 
+SUBMIT_BATCH_MAX = 20
+ALREADY_TAKEN_MESSAGE = "Quiz already taken—check back for new content."
+SAVED_MESSAGE = "Score saved! Check the leaderboard."
+ONE_PER_REFRESH_MESSAGE = "Only one quiz score counts per content update, and an earlier one was saved."
+STALE_QUIZ_MESSAGE = "This quiz has been replaced by newer content—take the new quiz to save a score."
+
+def _valid_score(score):
+    return isinstance(score, int) and not isinstance(score, bool) and 0 <= score <= 100
+
+def _apply_saved_submission(user_id, result):
+    # the database already notified other workers; update this one without waiting for it
+    events.publish_local('leaderboard', result['leaderboard_version'])
+    rank_index.update_user(user_id, result['total_score'], result['perfect_quizzes'],
+                           result['last_quiz'], result['join_public'])
+
 @quiz_bp.route('/api/submit_quiz/<int:quiz_id>', methods=['POST'])
 def submit_quiz(quiz_id):
     user = session.get('user')
     data = request.get_json()
     score = data.get('score', 0)
-    if not isinstance(score, int) or score < 0 or score > 100:
+    if not _valid_score(score):
         logging.error(f"Invalid score {score} for quiz {quiz_id} by user {user['username'] if user else 'anonymous'}")
         return jsonify({"error": "Invalid score", "message": "Error: Invalid score provided."}), 400
     if not user:
@@ -38,37 +46,73 @@ def submit_quiz(quiz_id):
         return jsonify({"success": True, "saved": False, "message": "Sign in to save your score for the leaderboard!"}), 200
     with get_db_conn() as conn:
         cur = conn.cursor(cursor_factory=DictCursor)
-        cur.execute("SELECT MAX(timestamp) as latest_timestamp FROM headlines")
-        latest_headline = cur.fetchone()
-        latest_timestamp = latest_headline['latest_timestamp'] if latest_headline and latest_headline['latest_timestamp'] else datetime.now(timezone.utc)
-        cur.execute("""
-            SELECT COUNT(*) as count
-            FROM scores
-            WHERE user_id = %s AND completed_at >= %s
-        """, (user['id'], latest_timestamp))
+        # eligibility check, score insert, totals/rollup deltas and invalidation in one round trip
+        cur.execute("SELECT * FROM submit_quiz_score(%s, %s, %s, %s)",
+                    (user['id'], quiz_id, score, datetime.now(timezone.utc)))
         result = cur.fetchone()
-        if result['count'] > 0:
-            logging.debug(f"User {user['username']} already submitted a score since latest headline timestamp {latest_timestamp} for quiz {quiz_id}")
-            return jsonify({"success": True, "saved": False, "message": "Quiz already taken—check back for new content."}), 200
-        cur.execute(
-            "INSERT INTO scores (user_id, quiz_id, score, completed_at) VALUES (%s, %s, %s, %s)",
-            (user['id'], quiz_id, score, datetime.now(timezone.utc))
-        )
-        cur.execute(
-            "SELECT SUM(score) as total_score, COUNT(DISTINCT quiz_id) as quizzes_taken, "
-            "SUM(CASE WHEN score = 69 OR score = 100 THEN 1 ELSE 0 END) as perfect_quizzes "
-            "FROM scores WHERE user_id = %s",
-            (user['id'],)
-        )
-        totals = cur.fetchone()
-        cur.execute(
-            "INSERT INTO user_totals (user_id, total_score, perfect_quizzes, last_quiz, quizzes_taken) "
-            "VALUES (%s, %s, %s, %s, %s) "
-            "ON CONFLICT (user_id) DO UPDATE SET "
-            "total_score = EXCLUDED.total_score, perfect_quizzes = EXCLUDED.perfect_quizzes, "
-            "last_quiz = EXCLUDED.last_quiz, quizzes_taken = EXCLUDED.quizzes_taken",
-            (user['id'], totals['total_score'], totals['perfect_quizzes'], datetime.now(timezone.utc), totals['quizzes_taken'])
-        )
         conn.commit()
-        logging.info(f"Quiz {quiz_id} score {score} saved for user {user['username']}")
-        return jsonify({"success": True, "saved": True, "message": "Score saved! Check the leaderboard."}), 200
\ No newline at end of file
+    if result['stale']:
+        logging.debug(f"User {user['username']} submitted quiz {quiz_id}, which is not the current quiz")
+        return jsonify({"success": True, "saved": False, "message": STALE_QUIZ_MESSAGE}), 200
+    if not result['saved']:
+        logging.debug(f"User {user['username']} already submitted a score since the latest refresh for quiz {quiz_id}")
+        return jsonify({"success": True, "saved": False, "message": ALREADY_TAKEN_MESSAGE}), 200
+    _apply_saved_submission(user['id'], result)
+    logging.info(f"Quiz {quiz_id} score {score} saved for user {user['username']}")
+    return jsonify({"success": True, "saved": True, "message": SAVED_MESSAGE}), 200
+
+@quiz_bp.route('/api/submit_quiz/batch', methods=['POST'])
+def submit_quiz_batch():
+    user = session.get('user')
+    data = request.get_json(silent=True) or {}
+    submissions = data.get('submissions')
+    if not isinstance(submissions, list) or not submissions or len(submissions) > SUBMIT_BATCH_MAX:
+        return jsonify({"error": "Invalid submissions", "message": f"Error: Submit between 1 and {SUBMIT_BATCH_MAX} scores."}), 400
+    # invalid items are answered individually so the client can drop them and keep the rest
+    quiz_ids, scores, rejected = [], [], []
+    for item in submissions:
+        quiz_id = item.get('quiz_id') if isinstance(item, dict) else None
+        score = item.get('score', 0) if isinstance(item, dict) else None
+        if not isinstance(quiz_id, int) or not _valid_score(score):
+            logging.error(f"Invalid batch submission {item} by user {user['username'] if user else 'anonymous'}")
+            rejected.append({"quiz_id": quiz_id, "saved": False, "message": "Error: Invalid score provided."})
+            continue
+        quiz_ids.append(quiz_id)
+        scores.append(score)
+    if not user or not quiz_ids:
+        return jsonify({"success": True, "results": rejected + [
+            {"quiz_id": quiz_id, "saved": False, "message": "Sign in to save your score for the leaderboard!"} for quiz_id in quiz_ids
+        ]}), 200
+    # One score counts per content refresh, and only for a quiz of that refresh:
+    # submit_quiz_score marks items for a replaced quiz (queued before a refresh) stale and
+    # refuses a second score since the newest quiz was stored. Items are tried in order in
+    # one transaction, so at most one is saved and each answer says why the others were not.
+    results, saved = [], None
+    with get_db_conn() as conn:
+        cur = conn.cursor(cursor_factory=DictCursor)
+        for quiz_id, score in zip(quiz_ids, scores):
+            cur.execute("SELECT * FROM submit_quiz_score(%s, %s, %s, %s)",
+                        (user['id'], quiz_id, score, datetime.now(timezone.utc)))
+            result = cur.fetchone()
+            if result['saved']:
+                saved, message = result, SAVED_MESSAGE
+            elif result['stale']:
+                message = STALE_QUIZ_MESSAGE
+            else:
+                message = ONE_PER_REFRESH_MESSAGE if saved else ALREADY_TAKEN_MESSAGE
+            results.append({"quiz_id": quiz_id, "saved": result['saved'], "message": message})
+        conn.commit()
+    if saved:
+        _apply_saved_submission(user['id'], saved)
+    logging.info(f"Batch of {len(quiz_ids)} quiz submissions processed for user {user['username']}")
+    return jsonify({"success": True, "results": rejected + results}), 200
+
+@quiz_bp.route('/api/update_quiz_count', methods=['GET', 'POST'])
+def update_quiz_count():
+    try:
+        if request.method == 'POST':
+            quiz_counter.increment()
+        return jsonify({"count": quiz_counter.value(block=True)})
+    except Exception as e:
+        logging.error(f"Error in /api/update_quiz_count: {e}")
+        return jsonify({"error": "Failed to update quiz count"}), 500
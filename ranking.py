@@ -0,0 +1,170 @@
+import math
+import time
+import bisect
+import logging
+import threading
+from utils import get_db_conn
+import events
+
+# Every rank shown in the app comes from here. Users are ranked among public users with a
+# positive total by (total_score DESC, perfect_quizzes DESC, last_quiz ASC); ties share a
+# rank like SQL RANK(). Each worker keeps a sorted list of sort keys, so a lookup is one
+# bisect, and applies per-user updates published on the 'rank' topic by other workers.
+# Private users with a positive total are not on the board, but their own profile and
+# leaderboard still show where they would place among public users, so their keys are kept
+# separately.
+RANK_TOPIC = 'rank'
+RANK_RELOAD_BACKOFF_SECONDS = 30
+RANK_LOAD_WAIT_SECONDS = 2
+
+_RANKED_USERS_SQL = """
+    SELECT ut.user_id, ut.total_score, ut.perfect_quizzes, ut.last_quiz, u.join_public
+    FROM user_totals ut
+    JOIN users u ON ut.user_id = u.id
+"""
+
+def _sort_key(total_score, perfect_quizzes, last_quiz):
+    return (-(total_score or 0), -(perfect_quizzes or 0), last_quiz.timestamp() if last_quiz else math.inf)
+
+class RankIndex:
+    def __init__(self):
+        self._keys = []
+        self._by_user = {}
+        self._unlisted = {}
+        self._lock = threading.RLock()
+        self._loaded = threading.Event()
+        self._loading = threading.Lock()
+        self._retry_at = 0
+        # user_id -> latest update (None: removed) seen while a reload's SELECT was running
+        self._pending = None
+
+    def _remove(self, user_id):
+        self._unlisted.pop(user_id, None)
+        key = self._by_user.pop(user_id, None)
+        if key is not None:
+            i = bisect.bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+
+    def _apply(self, user_id, total_score, perfect_quizzes, last_quiz, join_public):
+        self._remove(user_id)
+        if (total_score or 0) <= 0:
+            return
+        key = _sort_key(total_score, perfect_quizzes, last_quiz)
+        if join_public:
+            self._by_user[user_id] = key
+            bisect.insort(self._keys, key)
+        else:
+            self._unlisted[user_id] = key
+
+    def _record(self, user_id, update):
+        # call with self._lock held
+        if self._pending is not None:
+            self._pending[user_id] = update
+
+    def reload(self):
+        # The SELECT runs outside self._lock, so updates applied meanwhile are recorded and
+        # re-applied over the loaded data; otherwise the swap would roll them back.
+        with self._lock:
+            self._pending = {}
+        try:
+            with get_db_conn() as conn:
+                cur = conn.cursor()
+                cur.execute(_RANKED_USERS_SQL + " WHERE ut.total_score > 0")
+                rows = cur.fetchall()
+            by_user = {row[0]: _sort_key(row[1], row[2], row[3]) for row in rows if row[4]}
+            unlisted = {row[0]: _sort_key(row[1], row[2], row[3]) for row in rows if not row[4]}
+            keys = sorted(by_user.values())
+            with self._lock:
+                self._by_user = by_user
+                self._unlisted = unlisted
+                self._keys = keys
+                for user_id, update in self._pending.items():
+                    if update is None:
+                        self._remove(user_id)
+                    else:
+                        self._apply(user_id, *update)
+        finally:
+            with self._lock:
+                self._pending = None
+        self._loaded.set()
+        logging.info(f"Rank index loaded with {len(keys)} ranked users")
+
+    def refresh_user(self, user_id, cur=None):
+        if cur is None:
+            with get_db_conn() as conn:
+                return self.refresh_user(user_id, conn.cursor())
+        cur.execute(_RANKED_USERS_SQL + " WHERE ut.user_id = %s", (user_id,))
+        row = cur.fetchone()
+        with self._lock:
+            if row:
+                self._apply(user_id, row[1], row[2], row[3], row[4])
+                self._record(user_id, tuple(row[1:5]))
+            else:
+                self._remove(user_id)
+                self._record(user_id, None)
+
+    def update_user(self, user_id, total_score, perfect_quizzes, last_quiz, join_public):
+        with self._lock:
+            self._apply(user_id, total_score, perfect_quizzes, last_quiz, join_public)
+            self._record(user_id, (total_score, perfect_quizzes, last_quiz, join_public))
+
+    def ensure_loaded(self):
+        # One caller loads (outside self._lock); others wait briefly rather than queueing up
+        # behind it, and after a failure nobody retries for RANK_RELOAD_BACKOFF_SECONDS.
+        if not self._loaded.is_set() and time.monotonic() >= self._retry_at:
+            if self._loading.acquire(blocking=False):
+                try:
+                    if not self._loaded.is_set():
+                        self.reload()
+                except Exception as e:
+                    self._retry_at = time.monotonic() + RANK_RELOAD_BACKOFF_SECONDS
+                    logging.error(f"Failed to load rank index, retrying in {RANK_RELOAD_BACKOFF_SECONDS}s: {e}")
+                finally:
+                    self._loading.release()
+            else:
+                self._loaded.wait(RANK_LOAD_WAIT_SECONDS)
+        events.ensure_listener()
+
+    def lookup(self, user_id):
+        self.ensure_loaded()
+        with self._lock:
+            key = self._by_user.get(user_id) or self._unlisted.get(user_id)
+            if key is None:
+                return None
+            # bisect_left counts the public users strictly ahead, whether or not key is listed
+            return {"rank": bisect.bisect_left(self._keys, key) + 1, "total_score": -key[0], "perfect_quizzes": -key[1]}
+
+    def rank(self, user_id):
+        found = self.lookup(user_id)
+        return found['rank'] if found else None
+
+    def size(self):
+        with self._lock:
+            return len(self._keys)
+
+    def _on_event(self, payload):
+        if payload is None:
+            # listener (re)connected: updates may have been missed
+            if self._loaded.is_set():
+                # one reload at a time: they share the pending updates
+                with self._loading:
+                    self.reload()
+            return
+        try:
+            user_id = int(payload)
+        except ValueError:
+            logging.warning(f"Ignoring malformed rank event: {payload}")
+            return
+        if self._loaded.is_set():
+            self.refresh_user(user_id)
+
+rank_index = RankIndex()
+events.on(RANK_TOPIC, rank_index._on_event)
+
+def notify_rank_change(cur, user_id):
+    # call inside the writing transaction; other workers refresh the user once it commits
+    events.notify(cur, RANK_TOPIC, user_id)
+
+def warm_rank_index():
+    threading.Thread(target=rank_index.ensure_loaded, name='rank-index-warm', daemon=True).start()
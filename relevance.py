@@ -0,0 +1,74 @@
+import os
+import re
+import json
+import logging
+
+# Headline relevance scoring. Every keyword in every category is compiled into one
+# case-insensitive alternation, so a headline is scanned once however long the list gets.
+# Keywords weighing at least RELEVANCE_ANCHOR_WEIGHT are anchors: a headline needs one to
+# be kept, and an anchor in the title counts double. Lighter keywords (password, cve, ...)
+# only add their weight to rank headlines that already have an anchor, so
+# "Password reset tips" scores 0 and is dropped, "Malware steals passwords" is kept, and
+# every keyword of the original boolean filter is an anchor. Headlines below
+# RELEVANCE_MIN_SCORE are dropped at ingest and the best scored ones are generated first.
+# The two are separate so raising the threshold makes the filter stricter without also
+# demoting keywords from anchors.
+# RELEVANCE_KEYWORDS_FILE may point at a JSON file of the same shape as
+# DEFAULT_KEYWORDS ({category: {keyword: weight}}) to replace the built-in list.
+RELEVANCE_KEYWORDS_FILE = os.getenv('RELEVANCE_KEYWORDS_FILE')
+RELEVANCE_MIN_SCORE = float(os.getenv('RELEVANCE_MIN_SCORE', '2'))
+RELEVANCE_ANCHOR_WEIGHT = float(os.getenv('RELEVANCE_ANCHOR_WEIGHT', '2'))
+TITLE_WEIGHT = 2
+
+DEFAULT_KEYWORDS = {
+    "ransomware": {"ransomware": 3, "extortion": 2, "double extortion": 3},
+    "phishing": {"phishing": 3, "social engineering": 3, "smishing": 3, "vishing": 3,
+                 "business email compromise": 3},
+    "malware": {"malware": 2, "infostealer": 3, "trojan": 2, "botnet": 2, "spyware": 2, "backdoor": 2},
+    "credentials": {"credential stuffing": 3, "account takeover": 3, "password": 1, "mfa": 1},
+    "breach": {"data breach": 3, "data leak": 2, "breach": 1},
+    "vulnerability": {"exploit": 2, "zero-day": 3, "vulnerability": 1, "cve": 1},
+    "cybercrime": {"cybercrime": 2, "scam": 2, "fraud": 1},
+}
+
+def _normalize(keyword):
+    return re.sub(r'[\s-]+', ' ', keyword.strip().lower())
+
+class RelevanceClassifier:
+    def __init__(self, keywords):
+        self.weights = {}
+        for category, terms in keywords.items():
+            for keyword, weight in terms.items():
+                self.weights[_normalize(keyword)] = (category, float(weight))
+        # longest first so "data breach" wins over "breach"; inner spaces also match hyphens,
+        # and a trailing \w* lets "exploit" match "exploited"
+        alternatives = sorted(self.weights, key=len, reverse=True)
+        pattern = '|'.join(r'[\s-]+'.join(map(re.escape, keyword.split(' '))) for keyword in alternatives)
+        self._regex = re.compile(rf'\b({pattern})\w*', re.IGNORECASE)
+
+    def _matches(self, text):
+        return {_normalize(m.group(1)) for m in self._regex.finditer(text or '')}
+
+    def score(self, title, description=''):
+        # returns (score, sorted categories)
+        in_title = self._matches(title)
+        found = in_title | self._matches(description)
+        categories = sorted({self.weights[k][0] for k in found})
+        anchors = {k for k in found if self.weights[k][1] >= RELEVANCE_ANCHOR_WEIGHT}
+        if not anchors:
+            return 0.0, categories
+        score = sum(self.weights[k][1] * (TITLE_WEIGHT if k in in_title and k in anchors else 1) for k in found)
+        return score, categories
+
+    def is_relevant(self, score):
+        return score >= RELEVANCE_MIN_SCORE
+
+def _load_keywords():
+    if not RELEVANCE_KEYWORDS_FILE:
+        return DEFAULT_KEYWORDS
+    with open(RELEVANCE_KEYWORDS_FILE) as f:
+        keywords = json.load(f)
+    logging.info(f"Loaded {sum(len(t) for t in keywords.values())} relevance keywords from {RELEVANCE_KEYWORDS_FILE}")
+    return keywords
+
+classifier = RelevanceClassifier(_load_keywords())
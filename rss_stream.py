@@ -0,0 +1,118 @@
+import os
+import logging
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import feedparser
+
+# Streaming RSS/Atom reader for ingestion. The response is fed to an incremental XML parser
+# in FEED_CHUNK_BYTES pieces and each <item>/<entry> is reduced to the four fields we store
+# as soon as it closes, then discarded; reading stops after max_entries items or
+# FEED_MAX_BYTES. Feeds the XML parser rejects (HTML entities, broken markup) are handed to
+# feedparser, which is lenient but buffers the whole document.
+FEED_MAX_BYTES = int(os.getenv("FEED_MAX_BYTES", str(5 * 1024 * 1024)))
+FEED_CHUNK_BYTES = 64 * 1024
+
+_ENTRY_TAGS = {'item', 'entry'}
+
+class FeedParseError(Exception):
+    pass
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else ''
+
+def _text(elem):
+    return ''.join(elem.itertext()).strip()
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+def _entry(elem):
+    fields = {}
+    link = None
+    for child in elem:
+        name = _local(child.tag)
+        if name == 'link':
+            # Atom: <link rel="alternate" href=...>; RSS: <link>url</link>
+            if child.get('href') and child.get('rel', 'alternate') == 'alternate':
+                link = link or child.get('href')
+            elif child.text and child.text.strip():
+                link = link or child.text.strip()
+        elif name not in fields:
+            fields[name] = child
+    summary = fields.get('description', fields.get('summary', fields.get('content')))
+    published = fields.get('pubDate', fields.get('published', fields.get('date', fields.get('updated'))))
+    return {
+        "title": _text(fields['title']) if 'title' in fields else "",
+        "summary": _text(summary) if summary is not None else "",
+        "link": link or "",
+        "published": _parse_date(_text(published)) if published is not None else None,
+    }
+
+def iter_entries(stream, max_entries=10, max_bytes=FEED_MAX_BYTES, consumed=None):
+    # Yields entry dicts lazily. Raises FeedParseError on malformed XML; bytes read so far are
+    # appended to consumed (if given) so the caller can fall back without re-fetching.
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    depth = 0
+    count = 0
+    total = 0
+    while count < max_entries and total < max_bytes:
+        chunk = stream.read(min(FEED_CHUNK_BYTES, max_bytes - total))
+        if not chunk:
+            break
+        total += len(chunk)
+        if consumed is not None:
+            consumed.append(chunk)
+        try:
+            parser.feed(chunk)
+            for event, elem in parser.read_events():
+                if _local(elem.tag) not in _ENTRY_TAGS:
+                    continue
+                if event == 'start':
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth:
+                    continue
+                yield _entry(elem)
+                elem.clear()
+                count += 1
+                if count >= max_entries:
+                    return
+        except ET.ParseError as e:
+            raise FeedParseError(str(e)) from e
+    if total >= max_bytes and count < max_entries:
+        logging.warning(f"Feed exceeded {max_bytes} bytes, stopped after {count} entries")
+
+def _from_feedparser(entry):
+    published = entry.get("published_parsed") or entry.get("updated_parsed")
+    return {
+        "title": entry.get("title", "").strip(),
+        "summary": entry.get("summary", ""),
+        "link": entry.get("link", ""),
+        "published": datetime(*published[:6], tzinfo=timezone.utc) if published else None,
+    }
+
+def parse_with_feedparser(data, max_entries=10):
+    return [_from_feedparser(entry) for entry in feedparser.parse(data).entries[:max_entries]]
+
+def parse_feed(stream, max_entries=10, max_bytes=FEED_MAX_BYTES, source_name='feed'):
+    consumed = []
+    try:
+        return list(iter_entries(stream, max_entries, max_bytes, consumed))
+    except FeedParseError as e:
+        logging.info(f"Streaming parse of {source_name} failed ({e}), falling back to feedparser")
+    read = sum(len(chunk) for chunk in consumed)
+    consumed.append(stream.read(max(0, max_bytes - read)))
+    return parse_with_feedparser(b''.join(consumed), max_entries)
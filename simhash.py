@@ -0,0 +1,195 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+import psycopg2.extras
+
+# Near-duplicate detection for headlines. Each headline gets a 64-bit SimHash of its title
+# and description, stored in headlines.simhash. Headlines within SIMHASH_MAX_DISTANCE bits
+# of one another are the same story and share headlines.cluster_id (the id of the first
+# headline seen for it). What tells two security stories apart is who and what they are
+# about, not the vocabulary every story shares, so names (capitalized mid-sentence, mixed
+# case like FortiOS, or containing digits like CVE ids) weigh ENTITY_WEIGHT and common
+# security-news words COMMON_WEIGHT. Tuned on the labelled pairs in bench/simhash_pairs.json
+# (`python -m bench.simhash_pairs`): a false merge silently drops a story, a miss only costs
+# a duplicate slide, so the threshold is the largest with no different-story pair inside it.
+# That catches close rewrites (5 of 22 labelled pairs, 0 of 23 false merges); rewrites
+# that share little wording land 11-34 bits apart, where different stories on the same
+# product or victim type also start (11).
+# Lookups split the hash into SIMHASH_BANDS 4-bit bands and only compare against headlines
+# sharing a band, which finds every pair up to SIMHASH_BANDS - 1 bits apart. The in-memory
+# index covers the last SIMHASH_WINDOW_DAYS and is rebuilt from the stored hashes,
+# incrementally by id.
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 16
+SIMHASH_MAX_DISTANCE = int(os.getenv('SIMHASH_MAX_DISTANCE', '10'))
+SIMHASH_WINDOW_DAYS = int(os.getenv('SIMHASH_WINDOW_DAYS', '7'))
+ENTITY_WEIGHT = 4
+COMMON_WEIGHT = 0.5
+
+_BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+_MASK = (1 << SIMHASH_BITS) - 1
+_TOKEN = re.compile(r"[A-Za-z0-9][A-Za-z0-9'&-]+")
+_STOPWORDS = frozenset("""
+    a an and are as at be been but by for from has have in into is it its new not of on or says
+    that the their this to was were which who will with after over than more about
+""".split())
+_SUFFIXES = ('ing', 'ed', 'es', 's')
+
+def _stem(token):
+    # crude suffix stripping so "exploited", "exploits" and "exploiting" agree
+    token = token.removesuffix("'s")
+    for suffix in _SUFFIXES:
+        if len(token) > len(suffix) + 3 and token.endswith(suffix):
+            return token[:-len(suffix)]
+    return token
+
+_COMMON_TERMS = frozenset(_stem(t) for t in """
+    attack attacker cyberattack hacker hack hacking cybersecurity ransomware phishing malware exploit
+    vulnerability vulnerabilities flaw bug patch patches fix fixes security data breach breached stolen
+    steal stole theft user customer account company companies firm warn said say researcher campaign
+    scam scammer fraud critical threat actor email compromise compromised network system million billion
+    report update victim target zero-day backdoor botnet infostealer stealer trojan spyware credential
+    password
+""".split())
+
+def _is_title_case(words):
+    # "Cisco Patches ASA Zero-Day": capitals say nothing about which words are names
+    long_words = [w for w in words if len(w) > 3 and w[0].isalpha()]
+    return bool(long_words) and sum(w[0].isupper() for w in long_words) >= 0.6 * len(long_words)
+
+def _is_entity(word, position, capitals_mark_names):
+    return (any(c.isdigit() for c in word) or any(c.isupper() for c in word[1:])
+            or (capitals_mark_names and position > 0 and word[0].isupper()))
+
+def _features(title, description):
+    # each distinct token counts once: a name repeated in title and blurb would otherwise
+    # outweigh everything else, and two stories about the same product would look alike
+    texts = [_TOKEN.findall(title or ''), _TOKEN.findall(description or '')]
+    entities = set()
+    for words, capitals_mark_names in zip(texts, (not _is_title_case(texts[0]), True)):
+        entities.update(_stem(w.lower()) for i, w in enumerate(words) if _is_entity(w, i, capitals_mark_names))
+    weights = {}
+    for words in texts:
+        for word in words:
+            token = word.lower()
+            if token in _STOPWORDS:
+                continue
+            token = _stem(token)
+            weights[token] = ENTITY_WEIGHT if token in entities else COMMON_WEIGHT if token in _COMMON_TERMS else 1
+    return weights
+
+def simhash(title, description=''):
+    vector = [0.0] * SIMHASH_BITS
+    for token, weight in _features(title, description).items():
+        h = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), 'big')
+        for bit in range(SIMHASH_BITS):
+            vector[bit] += weight if h >> bit & 1 else -weight
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if vector[bit] > 0)
+
+def to_db(value):
+    # BIGINT is signed
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+def from_db(value):
+    return value & _MASK
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+def _bands(value):
+    return [(i, value >> (i * _BAND_BITS) & _BAND_MASK) for i in range(SIMHASH_BANDS)]
+
+class SimHashIndex:
+    def __init__(self, window_days=SIMHASH_WINDOW_DAYS, max_distance=SIMHASH_MAX_DISTANCE):
+        self.window_days = window_days
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._buckets = defaultdict(set)
+        self._entries = OrderedDict()  # id -> (hash, cluster_id, timestamp), oldest first
+        self._max_id = 0
+
+    def _add(self, headline_id, value, cluster_id, timestamp):
+        self._entries[headline_id] = (value, cluster_id, timestamp)
+        for band in _bands(value):
+            self._buckets[band].add(headline_id)
+        self._max_id = max(self._max_id, headline_id)
+
+    def _prune(self, cutoff):
+        while self._entries:
+            headline_id, (value, _, timestamp) = next(iter(self._entries.items()))
+            if timestamp is None or timestamp >= cutoff:
+                break
+            del self._entries[headline_id]
+            for band in _bands(value):
+                bucket = self._buckets[band]
+                bucket.discard(headline_id)
+                if not bucket:
+                    del self._buckets[band]
+
+    def sync(self, cur):
+        # load headlines stored since the last sync (by this or any other process)
+        with self._lock:
+            self._sync(cur)
+
+    def _sync(self, cur):
+        cur.execute("""
+            SELECT id, simhash, COALESCE(cluster_id, id), timestamp FROM headlines
+            WHERE id > %s AND simhash IS NOT NULL AND timestamp > NOW() - make_interval(days => %s)
+            ORDER BY id
+        """, (self._max_id, self.window_days))
+        rows = cur.fetchall()
+        cur.execute("SELECT NOW() - make_interval(days => %s)", (self.window_days,))
+        cutoff = cur.fetchone()[0]
+        for headline_id, value, cluster_id, timestamp in rows:
+            self._add(headline_id, from_db(value), cluster_id, timestamp)
+        self._prune(cutoff)
+
+    def nearest(self, value):
+        # (distance, cluster_id) of the closest indexed headline within max_distance, or None
+        candidates = set()
+        for band in _bands(value):
+            candidates |= self._buckets.get(band, set())
+        best = None
+        for headline_id in candidates:
+            other, cluster_id, _ = self._entries[headline_id]
+            distance = hamming(value, other)
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, cluster_id)
+        return best
+
+    def assign_clusters(self, cur, headlines):
+        # Sets 'cluster_id' on each headline dict (which must have 'id', 'simhash' and
+        # 'timestamp') and records it in headlines.cluster_id. Call in the inserting
+        # transaction, before the new rows are committed.
+        with self._lock:
+            try:
+                for h in headlines:
+                    match = self.nearest(h['simhash'])
+                    h['cluster_id'] = match[1] if match else h['id']
+                    self._add(h['id'], h['simhash'], h['cluster_id'], h['timestamp'])
+                psycopg2.extras.execute_values(cur, """
+                    UPDATE headlines SET cluster_id = v.cluster_id
+                    FROM (VALUES %s) AS v (id, cluster_id) WHERE headlines.id = v.id
+                """, [(h['id'], h['cluster_id']) for h in headlines])
+            except Exception:
+                # the index may now hold rows that will be rolled back
+                self.reset()
+                raise
+        duplicates = sum(1 for h in headlines if h['cluster_id'] != h['id'])
+        if duplicates:
+            logging.info(f"Clustered {duplicates} of {len(headlines)} new headlines with near-duplicate stories")
+        return headlines
+
+    def stats(self):
+        with self._lock:
+            return {"indexed": len(self._entries), "buckets": len(self._buckets), "max_id": self._max_id,
+                    "window_days": self.window_days, "max_distance": self.max_distance}
+
+headline_index = SimHashIndex()
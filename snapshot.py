@@ -0,0 +1,160 @@
+import os
+import json
+import hashlib
+import time
+import logging
+import threading
+from flask import current_app, request
+from psycopg2.extras import DictCursor
+from utils import get_db_conn
+import events
+
+# Quiz, headlines, slides and latest_refresh only change when refresh_database runs, so
+# each worker serves them from one immutable snapshot of pre-serialized bodies. The snapshot
+# is keyed by the 'content' generation in cache_versions: refresh_database bumps it, the
+# events listener delivers the new value, and the next request rebuilds. ETags are a hash
+# of the serialized body, so they agree across workers and a CDN can revalidate cheaply, and
+# a body can never change under an ETag a client already holds (e.g. a TTL rebuild that
+# picks up headlines committed before the generation is bumped).
+CONTENT_TOPIC = 'content'
+CONTENT_MAX_AGE = int(os.getenv('CONTENT_MAX_AGE', '60'))
+# fallback for bumps a worker never heard about (listener down)
+CONTENT_SNAPSHOT_TTL = int(os.getenv('CONTENT_SNAPSHOT_TTL', '300'))
+# after a failed rebuild, serve the previous snapshot (or fail fast without one) this long
+# before trying the database again, instead of queueing every request on the build lock
+CONTENT_REBUILD_BACKOFF_SECONDS = 30
+
+def _iso(value):
+    return value.isoformat().replace('+00:00', 'Z') if value else None
+
+def _headline(title, description, link, source, published_date, timestamp):
+    return {"title": title, "description": description or "No description", "link": link or "#",
+            "source": source, "published_date": _iso(published_date), "timestamp": _iso(timestamp)}
+
+def _load_content(cur):
+    # read the generation first: anything committed after it triggers another rebuild
+    cur.execute("SELECT version FROM cache_versions WHERE name = %s", (CONTENT_TOPIC,))
+    row = cur.fetchone()
+    generation = row['version'] if row else 0
+
+    cur.execute("""
+        SELECT id, question, options, correct, explanation
+        FROM quiz
+        ORDER BY created_at DESC
+        LIMIT 5
+    """)
+    quiz = [{"id": row['id'], "question": row['question'], "options": json.loads(row['options']),
+             "correct": row['correct'], "explanation": row['explanation']} for row in cur.fetchall()]
+
+    cur.execute("""
+        SELECT title, description, link, source, published_date, timestamp
+        FROM headlines ORDER BY timestamp DESC LIMIT 5
+    """)
+    headlines = [_headline(row['title'], row['description'], row['link'], row['source'],
+                           row['published_date'], row['timestamp']) for row in cur.fetchall()]
+
+    cur.execute("""
+        SELECT slides.title, slides.content, headlines.title as headline_title,
+               headlines.description as headline_description, headlines.link as headline_link,
+               headlines.source as headline_source, headlines.published_date as headline_published_date,
+               headlines.timestamp as headline_timestamp
+        FROM slides
+        LEFT JOIN headlines ON slides.headline_id = headlines.id
+        ORDER BY slides.created_at DESC
+        LIMIT 5
+    """)
+    slides = []
+    for row in cur.fetchall():
+        slide = {"title": row['title'], "content": row['content'], "headline": None}
+        if row['headline_title']:
+            slide["headline"] = _headline(row['headline_title'], row['headline_description'], row['headline_link'],
+                                          row['headline_source'], row['headline_published_date'],
+                                          row['headline_timestamp'])
+        slides.append(slide)
+
+    cur.execute("SELECT MAX(timestamp) FROM headlines")
+    latest = cur.fetchone()[0]
+    latest_refresh = {"timestamp": int(latest.timestamp()) if latest else 0}
+
+    return generation, {"quiz": quiz, "headlines": headlines, "slides": slides, "latest_refresh": latest_refresh}
+
+class ContentSnapshot:
+    __slots__ = ('generation', 'bodies', 'etags', 'bootstrap_fragment', 'built_at')
+
+    def __init__(self, generation, data):
+        self.generation = generation
+        serialized = {name: json.dumps(value) for name, value in data.items()}
+        self.bodies = {name: body.encode() for name, body in serialized.items()}
+        self.etags = {name: f"content-{hashlib.sha256(body).hexdigest()[:32]}" for name, body in self.bodies.items()}
+        # shared part of /api/bootstrap, spliced in next to the per-user fields
+        self.bootstrap_fragment = ", ".join(f'"{name}": {body}' for name, body in serialized.items())
+        self.built_at = time.monotonic()
+
+_snapshot = None
+_build_lock = threading.Lock()
+_retry_at = 0
+_stats = {"builds": 0, "build_errors": 0, "not_modified": 0}
+
+def _is_current(snap):
+    if snap is None:
+        return False
+    version = events.current_version(CONTENT_TOPIC)
+    if version is not None and version > snap.generation:
+        return False
+    return time.monotonic() - snap.built_at < CONTENT_SNAPSHOT_TTL
+
+def _backing_off(snap):
+    if time.monotonic() >= _retry_at:
+        return False
+    if snap is None:
+        raise RuntimeError("Content snapshot unavailable, last build failed")
+    return True
+
+def get_snapshot():
+    global _snapshot, _retry_at
+    events.ensure_listener()
+    snap = _snapshot
+    if _is_current(snap) or _backing_off(snap):
+        return snap
+    with _build_lock:
+        # another request may have rebuilt (or failed to) while we waited
+        snap = _snapshot
+        if _is_current(snap) or _backing_off(snap):
+            return snap
+        try:
+            with get_db_conn() as conn:
+                generation, data = _load_content(conn.cursor(cursor_factory=DictCursor))
+            _snapshot = snap = ContentSnapshot(generation, data)
+            _stats["builds"] += 1
+            logging.info(f"Built content snapshot for generation {generation}")
+        except Exception as e:
+            _stats["build_errors"] += 1
+            _retry_at = time.monotonic() + CONTENT_REBUILD_BACKOFF_SECONDS
+            if snap is None:
+                raise
+            # keep serving the previous generation rather than failing every request
+            logging.error(f"Failed to rebuild content snapshot, serving generation {snap.generation} "
+                          f"for {CONTENT_REBUILD_BACKOFF_SECONDS}s: {e}")
+    return snap
+
+def content_response(name):
+    snap = get_snapshot()
+    response = current_app.response_class(snap.bodies[name], mimetype='application/json')
+    response.set_etag(snap.etags[name])
+    response.headers['Cache-Control'] = f"public, max-age={CONTENT_MAX_AGE}"
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        _stats["not_modified"] += 1
+    return response
+
+def bump_content_generation():
+    # call after refresh_database has committed new content
+    with get_db_conn() as conn:
+        generation = events.bump_version(conn.cursor(), CONTENT_TOPIC)
+        conn.commit()
+    events.publish_local(CONTENT_TOPIC, generation)
+    return generation
+
+def snapshot_stats():
+    snap = _snapshot
+    return dict(_stats, generation=snap.generation if snap else None)
@@ -33,12 +33,11 @@ export function startMicrosoftLogin() {
     window.location.href = `/login/microsoft?return_to=${section}`;
 }
 
-export async function fetchUserTeamStatus() {
+export async function fetchUserTeamStatus(teamStatus = null) {
     const toggleTeam = document.getElementById('toggle-team');
     if (!toggleTeam) return;
     try {
-        const res = await fetchWithRetry('/api/user_team_status', 3, 2000);
-        const data = await res.json();
+        const data = teamStatus || await (await fetchWithRetry('/api/user_team_status', 3, 2000)).json();
         if (data.has_team) {
             toggleTeam.style.display = 'inline-block';
             toggleTeam.textContent = `Team (${data.domain})`;
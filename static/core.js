@@ -1,5 +1,5 @@
 import state from './state.js';
-import { debounce, preserveScroll, fetchWithRetry, formatDate, showToast } from './utils.js';
+import { debounce, preserveScroll, fetchWithRetry, formatDate, showToast, flushQueuedQuizSubmissions, loadBootstrap, fetchContent } from './utils.js';
 import { startEducation, startQuiz, showSlide, showQuestion, calculateScore, showResults } from './education.js';
 import { loadProfile } from './profile.js';
 import { loadLeaderboard } from './leaderboard.js';
@@ -99,8 +99,7 @@ async function showSection(section, username = null) {
                 let tempState = null;
                 let slidesTimestamp = 0;
                 try {
-                    const slidesRes = await fetchWithRetry('/api/slides', 3, 2000);
-                    const slidesData = await slidesRes.json();
+                    const slidesData = await fetchContent('slides');
                     slidesTimestamp = slidesData.length > 0 ? Math.max(...slidesData.map(s => new Date(s.headline?.timestamp).getTime() || 0)) : 0;
                 } catch (e) {
                     console.error('Failed to fetch slides for timestamp:', e);
@@ -173,16 +172,18 @@ async function showSection(section, username = null) {
     });
 }
 
-async function fetchQuizCount() {
+async function fetchQuizCount(count = null) {
     const quizCountSpan = document.getElementById('quiz-count');
     if (!quizCountSpan) return;
     try {
-        const res = await fetchWithRetry('/api/update_quiz_count', 3, 2000, {
-            method: 'GET'
-        });
-        const data = await res.json();
-        quizCountSpan.textContent = data.count;
-        console.log('Quiz count fetched:', data.count);
+        if (count === null) {
+            const res = await fetchWithRetry('/api/update_quiz_count', 3, 2000, {
+                method: 'GET'
+            });
+            count = (await res.json()).count;
+        }
+        quizCountSpan.textContent = count;
+        console.log('Quiz count fetched:', count);
     } catch (e) {
         console.error('Failed to fetch quiz count:', e);
         quizCountSpan.textContent = 'N/A';
@@ -282,6 +283,10 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 });
 
+window.addEventListener('online', () => {
+    flushQueuedQuizSubmissions();
+});
+
 window.addEventListener('popstate', (event) => {
     preserveScroll(() => {
         const path = window.location.pathname.replace(/^\/|\/$/g, '');
@@ -306,9 +311,10 @@ window.addEventListener('popstate', (event) => {
         clearUserState();
         document.cookie = 'clearLocalStorage=; expires=Thu, 01 Jan 1970 00:00:00 GMT; path=/';
     }
+    let bootstrap = null;
     try {
-        const refreshResponse = await fetchWithRetry('/api/latest_refresh', 3, 2000);
-        const refreshData = await refreshResponse.json();
+        bootstrap = await loadBootstrap();
+        const refreshData = bootstrap.latest_refresh;
         const refreshTime = refreshData.timestamp ? new Date(refreshData.timestamp * 1000).toISOString() : null;
         state.latestRefreshTimestamp = (refreshData.timestamp || 0) * 1000;
         requestAnimationFrame(() => {
@@ -323,7 +329,7 @@ window.addEventListener('popstate', (event) => {
             console.log('Content refresh styles:', contentRefresh ? window.getComputedStyle(contentRefresh).display : 'not found');
             console.log('Initial latestRefreshTimestamp:', state.latestRefreshTimestamp);
         });
-        await fetchQuizCount();
+        await fetchQuizCount(bootstrap.quiz_count ?? null);
     } catch (error) {
         console.error('Error fetching latest refresh:', error);
         requestAnimationFrame(() => {
@@ -351,21 +357,15 @@ window.addEventListener('popstate', (event) => {
     if (savedSection && validSections.includes(savedSection) && path !== 'logout') {
         section = savedSection;
         if (savedSection === 'profile') {
-            try {
-                const res = await fetchWithRetry('/api/user_status', 3, 2000);
-                const data = await res.json();
-                if (data.user && data.user.username) {
-                    username = data.user.username;
-                } else {
-                    section = 'home';
-                }
-            } catch (e) {
-                console.error('Failed to fetch user status for saved section:', e);
+            if (bootstrap?.user?.username) {
+                username = bootstrap.user.username;
+            } else {
                 section = 'home';
             }
         }
     }
     localStorage.removeItem('returnToSection');
     await showSection(section, username);
-    await fetchUserTeamStatus();
+    await fetchUserTeamStatus(bootstrap?.team_status);
+    await flushQueuedQuizSubmissions();
 })();
\ No newline at end of file
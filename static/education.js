@@ -1,5 +1,5 @@
 import state from './state.js';
-import { preserveScroll, fetchWithRetry, formatDate, showToast } from './utils.js';
+import { preserveScroll, fetchWithRetry, formatDate, showToast, queueQuizSubmission, fetchContent } from './utils.js';
 
 export const startEducation = async () => {
     const startEducationBtn = document.getElementById('start-education');
@@ -24,7 +24,7 @@ export const startEducation = async () => {
             }
         }
         animationId = requestAnimationFrame(updateProgress);
-        fetchWithRetry('/api/slides', 3, 2000).then(res => res.json()).then(data => {
+        fetchContent('slides').then(data => {
             const slidesTimestamp = data.length > 0 ? Math.max(...data.map(s => new Date(s.headline?.timestamp).getTime() || 0)) : 0;
             console.log('Slides timestamp in startEducation:', slidesTimestamp);
             state.latestRefreshTimestamp = slidesTimestamp;
@@ -63,7 +63,7 @@ export const startQuiz = async () => {
     const educationContent = document.getElementById('education-content');
     if (!educationContent) return;
     preserveScroll(() => {
-        const quizId = state.questions[0]?.id || (fetchWithRetry('/api/quiz').then(res => res.json()).then(data => data[0]?.id));
+        const quizId = state.questions[0]?.id || (fetchContent('quiz').then(data => data[0]?.id));
         educationContent.innerHTML = '<p>Loading quiz... <span id="quiz-progress">0%</span></p>';
         let startTime = performance.now();
         let animationId;
@@ -81,7 +81,7 @@ export const startQuiz = async () => {
             }
         }
         animationId = requestAnimationFrame(updateProgress);
-        fetchWithRetry('/api/quiz', 3, 2000).then(res => res.json()).then(data => {
+        fetchContent('quiz').then(data => {
             educationContent.innerHTML = '';
             if (!data || data.length === 0) {
                 educationContent.innerHTML = '<p>No quiz questions available.</p>';
@@ -272,7 +272,13 @@ export const showResults = async (updateQuizCount = true) => {
                 }
             } catch (e) {
                 console.error('Failed to submit quiz score:', e);
-                message = 'Error submitting score. Please try again.';
+                // only a network failure is worth retrying later; an HTTP error is the server's answer
+                if (quizId && (e instanceof TypeError || !navigator.onLine)) {
+                    queueQuizSubmission(quizId, score);
+                    message = 'Could not reach the server. Your score will be submitted automatically later.';
+                } else {
+                    message = 'Error submitting score. Please try again.';
+                }
                 localStorage.setItem('quizSubmissionMessage', message);
             }
         }
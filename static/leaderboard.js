@@ -2,6 +2,58 @@ import state from './state.js';
 import { preserveScroll, fetchWithRetry, formatDate } from './utils.js';
 import { showSection } from './core.js';
 
+const PAGE_SIZE = 50;
+
+function renderLeaderRow(leader) {
+    const rankSymbol = leader.rank === 1 ? '🥇' : leader.rank === 2 ? '🥈' : leader.rank === 3 ? '🥉' : `${leader.rank}`;
+    const usernameCell = `<a href="/profile/${encodeURIComponent(leader.username)}" onclick="event.preventDefault(); showSection('profile', '${encodeURIComponent(leader.username)}');">${leader.username}</a>`;
+    let lastQuizDisplay = leader.last_quiz || 'Never';
+    let isInactive = !leader.last_quiz;
+    console.debug('Raw leader row:', { username: leader.username, last_quiz: leader.last_quiz });
+    if (leader.last_quiz) {
+        const lastQuizDate = new Date(leader.last_quiz);
+        if (isNaN(lastQuizDate.getTime())) {
+            console.error('Invalid last_quiz date:', leader.last_quiz);
+            lastQuizDisplay = 'Unknown';
+            isInactive = false;
+        } else {
+            const now = new Date();
+            const today = new Date(now.getFullYear(), now.getMonth(), now.getDate());
+            const quizDay = new Date(lastQuizDate.getFullYear(), lastQuizDate.getMonth(), lastQuizDate.getDate());
+            const daysDiff = Math.floor((today - quizDay) / (1000 * 60 * 60 * 24));
+            isInactive = daysDiff > 30;
+            lastQuizDisplay = formatDate(leader.last_quiz);
+        }
+    }
+    return `<tr class="rank-${leader.rank}"><td>${rankSymbol}</td><td>${usernameCell}</td><td class="desktop-only">${leader.quizzes_taken}</td><td class="desktop-only">${leader.perfect_quizzes}</td><td class="desktop-only">${leader.avg_score}</td><td>${leader.total_score}</td><td class="${isInactive ? 'inactive' : ''}">${lastQuizDisplay}</td></tr>`;
+}
+
+function renderLoadMore(leaderboardContent, scope, cursor) {
+    const existing = document.getElementById('leaderboard-load-more');
+    if (existing) existing.remove();
+    if (!cursor) return;
+    const button = document.createElement('button');
+    button.id = 'leaderboard-load-more';
+    button.className = 'nav-button';
+    button.textContent = 'Load more';
+    button.addEventListener('click', async () => {
+        button.disabled = true;
+        try {
+            const res = await fetchWithRetry(`/api/leaderboard?scope=${scope}&limit=${PAGE_SIZE}&cursor=${encodeURIComponent(cursor)}`, 3, 2000);
+            const data = await res.json();
+            // the user may have switched scope while this page was loading
+            if (data.error || scope !== state.currentScope) return;
+            const table = leaderboardContent.querySelector('.leaderboard-table tbody') || leaderboardContent.querySelector('.leaderboard-table');
+            if (table) table.insertAdjacentHTML('beforeend', data.leaders.map(renderLeaderRow).join(''));
+            renderLoadMore(leaderboardContent, scope, data.next_cursor);
+        } catch (e) {
+            console.error('Leaderboard page fetch error:', e);
+            button.disabled = false;
+        }
+    });
+    leaderboardContent.appendChild(button);
+}
+
 export async function loadLeaderboard() {
     const leaderboardContent = document.getElementById('leaderboard-content');
     const userRankDiv = document.getElementById('user-rank');
@@ -13,7 +65,7 @@ export async function loadLeaderboard() {
             const userStatusRes = await fetchWithRetry('/api/user_status', 3, 2000);
             const userStatus = await userStatusRes.json();
             const isLoggedIn = !!userStatus.user;
-            const res = await fetchWithRetry(`/api/leaderboard?scope=${state.currentScope}`, 3, 2000);
+            const res = await fetchWithRetry(`/api/leaderboard?scope=${state.currentScope}&limit=${PAGE_SIZE}`, 3, 2000);
             const data = await res.json();
             if (data.error) {
                 leaderboardContent.innerHTML = `<p>${data.error}</p>`;
@@ -25,29 +77,7 @@ export async function loadLeaderboard() {
                 html += '<tr><td colspan="7">No scores yet — take the quiz!</td></tr>';
             } else {
                 html += '<tr><th>Rank</th><th>Username</th><th class="desktop-only">Quizzes</th><th class="desktop-only">Perfect</th><th class="desktop-only">Avg</th><th>Total</th><th>Last Quiz</th></tr>';
-                data.leaders.forEach((leader, i) => {
-                    const rankSymbol = i === 0 ? '🥇' : i === 1 ? '🥈' : i === 2 ? '🥉' : `${leader.rank}`;
-                    const usernameCell = `<a href="/profile/${encodeURIComponent(leader.username)}" onclick="event.preventDefault(); showSection('profile', '${encodeURIComponent(leader.username)}');">${leader.username}</a>`;
-                    let lastQuizDisplay = leader.last_quiz || 'Never';
-                    let isInactive = !leader.last_quiz;
-                    console.debug('Raw leader row:', { username: leader.username, last_quiz: leader.last_quiz });
-                    if (leader.last_quiz) {
-                        const lastQuizDate = new Date(leader.last_quiz);
-                        if (isNaN(lastQuizDate.getTime())) {
-                            console.error('Invalid last_quiz date:', leader.last_quiz);
-                            lastQuizDisplay = 'Unknown';
-                            isInactive = false;
-                        } else {
-                            const now = new Date();
-                            const today = new Date(now.getFullYear(), now.getMonth(), now.getDate());
-                            const quizDay = new Date(lastQuizDate.getFullYear(), lastQuizDate.getMonth(), lastQuizDate.getDate());
-                            const daysDiff = Math.floor((today - quizDay) / (1000 * 60 * 60 * 24));
-                            isInactive = daysDiff > 30;
-                            lastQuizDisplay = formatDate(leader.last_quiz);
-                        }
-                    }
-                    html += `<tr class="rank-${i + 1}"><td>${rankSymbol}</td><td>${usernameCell}</td><td class="desktop-only">${leader.quizzes_taken}</td><td class="desktop-only">${leader.perfect_quizzes}</td><td class="desktop-only">${leader.avg_score}</td><td>${leader.total_score}</td><td class="${isInactive ? 'inactive' : ''}">${lastQuizDisplay}</td></tr>`;
-                });
+                html += data.leaders.map(renderLeaderRow).join('');
             }
             html += '</table>';
             if (data.user_rank) {
@@ -56,6 +86,7 @@ export async function loadLeaderboard() {
                 userRankDiv.innerHTML = '<p>You: Unranked</p>';
             }
             leaderboardContent.innerHTML = html;
+            renderLoadMore(leaderboardContent, state.currentScope, data.next_cursor);
             if (data.team_stats) {
                 statsEl.innerHTML = `
                     <div class="team-stats">
@@ -64,4 +64,77 @@ export const showDismissibleMessage = (container, message) => {
     msgDiv.innerHTML = `${message} <button class="close-btn">×</button>`;
     (container || document.body).appendChild(msgDiv);
     msgDiv.querySelector('.close-btn').addEventListener('click', () => msgDiv.remove());
-};
\ No newline at end of file
+};
+
+const QUEUED_SUBMISSIONS_KEY = 'queuedQuizSubmissions';
+
+// The quiz id ties a queued score to the content refresh it was taken in: once a newer quiz
+// is stored the server answers the item as stale instead of saving it into the new window.
+export const queueQuizSubmission = (quizId, score) => {
+    const queued = JSON.parse(localStorage.getItem(QUEUED_SUBMISSIONS_KEY) || '[]');
+    if (!queued.some(s => s.quiz_id === quizId)) {
+        queued.push({ quiz_id: quizId, score });
+        localStorage.setItem(QUEUED_SUBMISSIONS_KEY, JSON.stringify(queued.slice(-20)));
+    }
+};
+
+export const flushQueuedQuizSubmissions = async () => {
+    const queued = JSON.parse(localStorage.getItem(QUEUED_SUBMISSIONS_KEY) || '[]');
+    if (queued.length === 0 || !navigator.onLine) return null;
+    let res;
+    try {
+        res = await fetch('/api/submit_quiz/batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ submissions: queued })
+        });
+    } catch (e) {
+        console.error('Failed to flush queued quiz submissions:', e);
+        return null;
+    }
+    if (res.status >= 500) {
+        console.error('Server error flushing queued quiz submissions:', res.status);
+        return null;
+    }
+    const data = await res.json().catch(() => ({}));
+    // Every item the server answered is final (saved or rejected); a 4xx for the whole
+    // request would fail the same way next time, so nothing is kept for it either.
+    const answered = new Set((data.results || []).map(r => r.quiz_id));
+    const remaining = res.ok ? queued.filter(s => !answered.has(s.quiz_id)) : [];
+    if (remaining.length) {
+        localStorage.setItem(QUEUED_SUBMISSIONS_KEY, JSON.stringify(remaining));
+    } else {
+        localStorage.removeItem(QUEUED_SUBMISSIONS_KEY);
+    }
+    console.log('Flushed queued quiz submissions:', data.results || res.status);
+    return data.results || null;
+};
+// /api/bootstrap bundles the startup data into one round trip. Its content is reused for
+// a short while; after that the per-resource endpoints (ETag/304) are cheaper to hit.
+const BOOTSTRAP_MAX_AGE_MS = 5 * 60 * 1000;
+let bootstrapPromise = null;
+let bootstrapRequestedAt = 0;
+
+export const loadBootstrap = () => {
+    if (!bootstrapPromise) {
+        bootstrapRequestedAt = Date.now();
+        bootstrapPromise = fetchWithRetry('/api/bootstrap', 3, 2000).then(res => res.json()).catch(e => {
+            bootstrapPromise = null;
+            throw e;
+        });
+    }
+    return bootstrapPromise;
+};
+
+export const fetchContent = async (name) => {
+    if (bootstrapPromise && Date.now() - bootstrapRequestedAt < BOOTSTRAP_MAX_AGE_MS) {
+        try {
+            const data = await bootstrapPromise;
+            if (data[name] !== undefined) return data[name];
+        } catch (e) {
+            console.error('Bootstrap unavailable, fetching content directly:', e);
+        }
+    }
+    const res = await fetchWithRetry(`/api/${name}`, 3, 2000);
+    return res.json();
+};
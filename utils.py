@@ -1,34 +1,78 @@
 import os
+import hmac
+import time
+import functools
 import logging
+import threading
 import psycopg2
+from flask import abort, g, has_app_context, request
 from dotenv import load_dotenv
+from db_pool import ConnectionPool, PooledConnection, PoolTimeout
+from metrics import InstrumentedConnection, POOL_CHECKOUT_LATENCY, POOL_TIMEOUTS
 
 load_dotenv()
 
-def get_db_conn():
+# Operational endpoints (pool, upstream and queue internals) answer only requests carrying
+# "Authorization: Bearer $OPS_TOKEN"; with no OPS_TOKEN set they are disabled.
+OPS_TOKEN = os.getenv('OPS_TOKEN')
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def _connect():
     try:
-        return psycopg2.connect(os.getenv('DATABASE_URL'), sslmode='require')
+        return psycopg2.connect(os.getenv('DATABASE_URL'), sslmode='require', connection_factory=InstrumentedConnection)
     except psycopg2.Error as e:
         logging.error(f"Failed to connect to database: {e}")
         raise
 
-def generate_username():
-    with get_db_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT MAX(CAST(SUBSTR(username, 7) AS INTEGER)) FROM users WHERE username LIKE 'cyb3r_%'")
-        max_suffix = cur.fetchone()[0]
-        suffix = (max_suffix or 0) + 1
-        return f"cyb3r_{suffix}"
-
-def load_quiz_count():
-    with get_db_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT count FROM quiz_counts WHERE id = 1")
-        result = cur.fetchone()
-        return result[0] if result else 0
-
-def save_quiz_count(count):
-    with get_db_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("UPDATE quiz_counts SET count = %s WHERE id = 1", (count,))
-        conn.commit()
\ No newline at end of file
+def get_db_pool():
+    global _pool, _pool_pid
+    # gunicorn forks workers after import; never share sockets across processes
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ConnectionPool(_connect)
+                _pool_pid = os.getpid()
+    return _pool
+
+def _forget_request_conn(pooled):
+    if has_app_context():
+        checked_out = g.get('_db_conns')
+        if checked_out and pooled in checked_out:
+            checked_out.remove(pooled)
+
+def get_db_conn():
+    pool = get_db_pool()
+    start = time.perf_counter()
+    try:
+        conn = pool.getconn()
+    except PoolTimeout:
+        POOL_TIMEOUTS.inc()
+        raise
+    POOL_CHECKOUT_LATENCY.observe(time.perf_counter() - start)
+    pooled = PooledConnection(pool, conn, on_release=_forget_request_conn)
+    if has_app_context():
+        g.setdefault('_db_conns', []).append(pooled)
+    return pooled
+
+def release_db_conns(exc=None):
+    for pooled in list(g.pop('_db_conns', [])):
+        logging.warning("Returning database connection that was not released by its handler")
+        pooled.release(discard=exc is not None)
+
+def init_db_pool(app):
+    app.teardown_appcontext(release_db_conns)
+
+def get_db_pool_stats():
+    return get_db_pool().stats()
+
+def ops_only(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        supplied = request.headers.get('Authorization', '')
+        if not OPS_TOKEN or not hmac.compare_digest(supplied.encode(), f"Bearer {OPS_TOKEN}".encode()):
+            abort(404)
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,128 @@
+import os
+import time
+import signal
+import socket
+import logging
+import threading
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+import jobs
+from utils import get_db_conn
+from content import refresh_database, refresh_if_stale, REFRESH_INTERVAL_SECONDS
+from phish import top_up_phish_pool, PHISH_POOL_REFILL_MINUTES
+from social import post_to_x
+
+# Background job runner, started with `python manage.py worker`; web workers only read and
+# enqueue. Each process runs JOB_WORKER_CONCURRENCY consumer threads plus a scheduler tick.
+# The tick enqueues periodic jobs under a per-period dedupe key while holding an advisory
+# lock, so however many worker processes run, each period's job is queued exactly once.
+JOB_WORKER_CONCURRENCY = int(os.getenv('JOB_WORKER_CONCURRENCY', '2'))
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', '5'))
+JOB_SCHEDULE_SECONDS = float(os.getenv('JOB_SCHEDULE_SECONDS', '30'))
+# pg_try_advisory_xact_lock key held by whichever process is running the scheduler tick
+JOB_SCHEDULER_LOCK_ID = 4201022
+X_POST_TIME = (11, 11)
+X_POST_TIMEZONE = ZoneInfo('US/Eastern')
+# a missed daily post is still made up to this long after its time
+X_POST_GRACE_SECONDS = 3600
+
+HANDLERS = {
+    # The periodic job forces: comparing the last run's age with the period it was scheduled
+    # on would skip every other slot. refresh_if_stale is for ad-hoc catch-up.
+    'refresh': refresh_database,
+    'refresh_if_stale': refresh_if_stale,
+    'phish_top_up': top_up_phish_pool,
+    'post_to_x': post_to_x,
+}
+# (kind, period in seconds, max attempts)
+PERIODIC_JOBS = [
+    ('refresh', REFRESH_INTERVAL_SECONDS, jobs.JOB_MAX_ATTEMPTS),
+    ('phish_top_up', PHISH_POOL_REFILL_MINUTES * 60, 1),
+]
+
+def _x_post_key(now):
+    local = now.astimezone(X_POST_TIMEZONE)
+    due = local.replace(hour=X_POST_TIME[0], minute=X_POST_TIME[1], second=0, microsecond=0)
+    if 0 <= (local - due).total_seconds() < X_POST_GRACE_SECONDS:
+        return f"post_to_x:{local.date().isoformat()}"
+    return None
+
+def schedule_tick():
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (JOB_SCHEDULER_LOCK_ID,))
+        if not cur.fetchone()[0]:
+            conn.commit()
+            return
+        for kind, period, max_attempts in PERIODIC_JOBS:
+            jobs.enqueue(kind, dedupe_key=jobs.slot_key(kind, period), max_attempts=max_attempts, cur=cur)
+        x_post_key = _x_post_key(datetime.now(timezone.utc))
+        if x_post_key:
+            # never retried: a failure after the tweet went out would post it twice
+            jobs.enqueue('post_to_x', dedupe_key=x_post_key, max_attempts=1, cur=cur)
+        jobs.reap(cur)
+        conn.commit()
+
+def _heartbeat(job, done):
+    # keeps the lease alive for as long as the handler runs, however long that is
+    while not done.wait(jobs.JOB_HEARTBEAT_SECONDS):
+        try:
+            if not jobs.heartbeat(job):
+                logging.warning(f"{job['kind']} job {job['id']} lost its lease while running")
+                return
+        except Exception as e:
+            logging.error(f"Failed to renew lease on {job['kind']} job {job['id']}: {e}")
+
+def run_job(job):
+    handler = HANDLERS.get(job['kind'])
+    if handler is None:
+        jobs.fail(dict(job, attempts=job['max_attempts']), f"no handler for job kind {job['kind']}")
+        return
+    start = time.monotonic()
+    done = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job, done), name=f"job-heartbeat-{job['id']}", daemon=True).start()
+    try:
+        handler(**job['payload'])
+    except Exception as e:
+        jobs.fail(job, f"{type(e).__name__}: {e}")
+        return
+    finally:
+        done.set()
+    jobs.complete(job['id'])
+    logging.info(f"{job['kind']} job {job['id']} finished in {time.monotonic() - start:.1f}s")
+
+def _consume(worker_id, stop):
+    while not stop.is_set():
+        try:
+            job = jobs.claim(worker_id)
+        except Exception as e:
+            logging.error(f"Failed to claim job: {e}")
+            job = None
+        if job is None:
+            stop.wait(JOB_POLL_SECONDS)
+            continue
+        try:
+            run_job(job)
+        except Exception as e:
+            # recording the outcome failed; the lease reaper will pick the job up again
+            logging.error(f"Error finishing {job['kind']} job {job['id']}: {e}")
+
+def run_worker(concurrency=JOB_WORKER_CONCURRENCY):
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    threads = [threading.Thread(target=_consume, args=(f"{prefix}:{i}", stop), name=f'job-worker-{i}')
+               for i in range(max(concurrency, 1))]
+    for thread in threads:
+        thread.start()
+    logging.info(f"Job worker {prefix} started with {len(threads)} consumers")
+    while not stop.is_set():
+        try:
+            schedule_tick()
+        except Exception as e:
+            logging.error(f"Job scheduler tick failed: {e}")
+        stop.wait(JOB_SCHEDULE_SECONDS)
+    logging.info("Stopping job worker, waiting for running jobs to finish")
+    for thread in threads:
+        thread.join()
@@ -0,0 +1,175 @@
+import os
+import time
+import random
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import timed_xai_call
+
+# One keep-alive client for every xAI call. Requests go through a pooled Session, are retried
+# on 429/5xx and connection errors with jittered exponential backoff (honouring Retry-After),
+# and never run past the caller's deadline. After XAI_BREAKER_THRESHOLD consecutive failures
+# the circuit opens and calls fail immediately for XAI_BREAKER_COOLDOWN seconds; then a
+# single trial call decides whether to close it again.
+XAI_API_URL = os.getenv("XAI_API_URL", "https://api.x.ai/v1/chat/completions")
+XAI_API_KEY = os.getenv("XAI_API_KEY")
+XAI_MAX_ATTEMPTS = int(os.getenv("XAI_MAX_ATTEMPTS", "3"))
+XAI_BACKOFF_SECONDS = float(os.getenv("XAI_BACKOFF_SECONDS", "1"))
+XAI_DEFAULT_DEADLINE = float(os.getenv("XAI_DEFAULT_DEADLINE", "120"))
+XAI_CONNECT_TIMEOUT = float(os.getenv("XAI_CONNECT_TIMEOUT", "5"))
+XAI_BREAKER_THRESHOLD = int(os.getenv("XAI_BREAKER_THRESHOLD", "5"))
+XAI_BREAKER_COOLDOWN = float(os.getenv("XAI_BREAKER_COOLDOWN", "60"))
+XAI_POOL_SIZE = int(os.getenv("XAI_POOL_SIZE", "10"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class XAIError(requests.RequestException):
+    pass
+
+class XAIUnavailable(XAIError):
+    # raised without touching the network while the circuit is open
+    pass
+
+class CircuitBreaker:
+    def __init__(self, threshold=XAI_BREAKER_THRESHOLD, cooldown=XAI_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self.times_opened = 0
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at < self.cooldown:
+            return 'open'
+        return 'half_open'
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logging.info("xAI circuit breaker closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            reopen = self._trial_in_flight
+            self._trial_in_flight = False
+            if reopen or (self._opened_at is None and self._failures >= self.threshold):
+                self._opened_at = time.monotonic()
+                self.times_opened += 1
+                logging.warning(f"xAI circuit breaker open for {self.cooldown}s after {self._failures} consecutive failures")
+
+    def stats(self):
+        with self._lock:
+            return {"state": self._state(), "consecutive_failures": self._failures, "times_opened": self.times_opened}
+
+class XAIClient:
+    def __init__(self, url=XAI_API_URL, api_key=XAI_API_KEY, max_attempts=XAI_MAX_ATTEMPTS):
+        self.url = url
+        self.api_key = api_key
+        self.max_attempts = max(max_attempts, 1)
+        self.breaker = CircuitBreaker()
+        self._session = requests.Session()
+        for prefix in ('https://', 'http://'):
+            self._session.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=XAI_POOL_SIZE))
+        self._session.headers.update({"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"})
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "attempts": 0, "retries": 0, "failures": 0, "rejected": 0}
+
+    @property
+    def configured(self):
+        return bool(self.api_key)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _backoff(self, attempt, response):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return XAI_BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def _attempts(self, payload, deadline):
+        last_error = None
+        for attempt in range(self.max_attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._count('attempts')
+            response = None
+            try:
+                response = self._session.post(self.url, json=payload,
+                                              timeout=(min(XAI_CONNECT_TIMEOUT, remaining), remaining))
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    try:
+                        return response.json()["choices"][0]["message"]["content"]
+                    except (ValueError, KeyError, IndexError, TypeError) as e:
+                        # json()'s JSONDecodeError is a RequestException without a response;
+                        # carry it so chat() sees xAI answered and does not trip the breaker
+                        raise XAIError(f"xAI returned a malformed body: {e}", response=response) from e
+                last_error = XAIError(f"xAI returned {response.status_code}", response=response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_error = e
+            if attempt < self.max_attempts - 1:
+                pause = self._backoff(attempt, response)
+                if time.monotonic() + pause >= deadline:
+                    break
+                self._count('retries')
+                logging.warning(f"xAI attempt {attempt + 1}/{self.max_attempts} failed ({last_error}), retrying in {pause:.1f}s")
+                time.sleep(pause)
+        raise last_error or XAIError("xAI deadline exceeded before the request could be sent")
+
+    def chat(self, messages, model, operation, deadline=XAI_DEFAULT_DEADLINE):
+        # Returns the completion text. Raises XAIUnavailable while the breaker is open, and the
+        # last error once retries or the deadline are exhausted.
+        self._count('calls')
+        if not self.breaker.allow():
+            self._count('rejected')
+            timed_xai_call(operation).error('CircuitOpen')
+            raise XAIUnavailable("xAI circuit breaker is open")
+        with timed_xai_call(operation):
+            try:
+                completion = self._attempts({"model": model, "messages": messages}, time.monotonic() + deadline)
+            except Exception as e:
+                self._count('failures')
+                response = getattr(e, 'response', None)
+                if isinstance(e, requests.RequestException) and (
+                        response is None or response.status_code >= 500 or response.status_code == 429):
+                    self.breaker.record_failure()
+                else:
+                    # xAI answered (a 4xx or a malformed body): it is up, the request was the problem
+                    self.breaker.record_success()
+                raise
+        self.breaker.record_success()
+        return completion
+
+    def stats(self):
+        pools = [pool for adapter in self._session.adapters.values()
+                 for pool in adapter.poolmanager.pools.values()]
+        with self._lock:
+            stats = dict(self._stats)
+        # requests_sent well above connections_opened means keep-alive connections are reused
+        stats.update(connections_opened=sum(pool.num_connections for pool in pools),
+                     requests_sent=sum(pool.num_requests for pool in pools),
+                     breaker=self.breaker.stats())
+        return stats
+
+xai_client = XAIClient()